@@ -356,6 +356,13 @@ if __name__ == "__main__":
             Output("btn-enrich", "disabled"),
             Output("btn-pregen", "disabled"),
         ],
+        running=[
+            (
+                Output("btn-cancel-optimize", "style"),
+                {"display": "inline-block"},
+                {"display": "none"},
+            ),
+        ],
         background=True,
         prevent_initial_call=True,
     )
@@ -367,7 +374,10 @@ if __name__ == "__main__":
 
         game_config = config.get_game_config(game_id)
         state_path = game_config["paths"]["state"]
-        state = state_manager.get_state(state_path)
+        cancel_path = game_config["paths"]["cancel_optimization"]
+        snapshot = state_manager.get_state(state_path).get("last_concurso_for_freqs", 0)
+        # Una cancelación pendiente de una corrida anterior no debe detener esta.
+        state_manager.clear_cancel(cancel_path)
         set_progress(
             (0, "Iniciando...", {"display": "block"}, True, True, True, True, True)
         )
@@ -382,12 +392,17 @@ if __name__ == "__main__":
                 color="warning",
             )
         success, message, report = ml_optimizer.run_optimization(
-            game_config, df_historico, freqs, set_progress=set_progress
+            game_config,
+            df_historico,
+            freqs,
+            set_progress=set_progress,
+            should_cancel=lambda: state_manager.is_cancel_requested(cancel_path),
+            snapshot=snapshot,
         )
         if success:
-            state["last_concurso_for_optimization"] = state.get(
-                "last_concurso_for_freqs", 0
-            )
+            # Se relee el estado para no pisar lo que otras tareas hayan guardado durante la optimización.
+            state = state_manager.get_state(state_path)
+            state["last_concurso_for_optimization"] = snapshot
             state_manager.save_state(state, state_path)
         set_progress(
             (100, "Completado.", {"display": "none"}, False, False, False, False, False)
@@ -396,6 +411,68 @@ if __name__ == "__main__":
             message, color="success" if success else "danger", duration=20000
         )
 
+    @app.callback(
+        Output("notification-container", "children", allow_duplicate=True),
+        Input("btn-cancel-optimize", "n_clicks"),
+        State("store-active-game", "data"),
+        prevent_initial_call=True,
+    )
+    def handle_cancel_optimize(n_clicks, game_id):
+        if not n_clicks:
+            raise PreventUpdate
+        from utils import state_manager
+
+        # La optimización consulta esta marca entre tareas y termina sus workers al verla.
+        state_manager.request_cancel(config.get_game_config(game_id)["paths"]["cancel_optimization"])
+        return dbc.Alert("Cancelando la optimización...", color="info", duration=5000)
+
+    @app.callback(
+        Output("table-pareto", "data"),
+        Output("table-pareto", "selected_rows"),
+        Output("pareto-info", "children"),
+        Input("btn-load-pareto", "n_clicks"),
+        State("store-active-game", "data"),
+        prevent_initial_call=True,
+    )
+    def handle_load_pareto(n_clicks, game_id):
+        if not n_clicks:
+            raise PreventUpdate
+        from modules import database
+
+        game_config = config.get_game_config(game_id)
+        df = database.read_threshold_scenarios(
+            game_config["paths"]["db"], pareto_only=True
+        )
+        if df.empty:
+            return [], [], "No hay escenarios guardados; ejecuta la optimización primero."
+        info = f"{len(df)} escenarios no dominados del snapshot de frecuencias {int(df['snapshot_concurso'].iloc[0])}."
+        return df.to_dict("records"), [], info
+
+    @app.callback(
+        Output("notification-container", "children", allow_duplicate=True),
+        Input("btn-apply-scenario", "n_clicks"),
+        State("table-pareto", "data"),
+        State("table-pareto", "selected_rows"),
+        State("store-active-game", "data"),
+        prevent_initial_call=True,
+    )
+    def handle_apply_scenario(n_clicks, rows, selected_rows, game_id):
+        if not n_clicks:
+            raise PreventUpdate
+        if not rows or not selected_rows:
+            return dbc.Alert(
+                "Selecciona un escenario del frente de Pareto.", color="warning"
+            )
+        from modules import ml_optimizer
+
+        game_config = config.get_game_config(game_id)
+        success, message = ml_optimizer.apply_scenario_thresholds(
+            game_config, rows[selected_rows[0]]
+        )
+        return dbc.Alert(
+            message, color="success" if success else "danger", duration=10000
+        )
+
     @app.callback(
         Output("notification-container", "children", allow_duplicate=True),
         Input("btn-enrich", "n_clicks"),
@@ -1075,17 +1152,23 @@ if __name__ == "__main__":
 
             # AÑADIR LA LÍNEA DORADA
             if not df_golden_trajectory.empty:
-                fig_trajectory.add_trace(
-                    go.Scatter(
-                        x=df_golden_trajectory["concurso"],
-                        y=df_golden_trajectory["elite_score_original_mean"],
-                        mode="lines",
-                        name="Score Original (Élite Reactiva)",
-                        line=dict(
-                            color="rgba(255, 215, 0, 0.9)", width=2, dash="dash"
-                        ),  # Línea dorada punteada
+                # Una línea por percentil de élite (las tablas anteriores solo tienen una).
+                if "elite_percentile" not in df_golden_trajectory.columns:
+                    df_golden_trajectory["elite_percentile"] = 95.0
+                golden_lines = list(df_golden_trajectory.groupby("elite_percentile", sort=True))
+                for position, (elite_percentile, df_line) in enumerate(golden_lines):
+                    opacity = 0.9 if position == len(golden_lines) - 1 else 0.4 + 0.5 * position / len(golden_lines)
+                    fig_trajectory.add_trace(
+                        go.Scatter(
+                            x=df_line["concurso"],
+                            y=df_line["elite_score_original_mean"],
+                            mode="lines",
+                            name=f"Score Original (Élite Reactiva p{elite_percentile:g})",
+                            line=dict(
+                                color=f"rgba(255, 215, 0, {opacity:.2f})", width=2, dash="dash"
+                            ),  # Línea dorada punteada; la élite más estricta, más opaca
+                        )
                     )
-                )
 
             fig_trajectory.add_trace(
                 go.Scatter(
@@ -1488,10 +1571,10 @@ if __name__ == "__main__":
         final_freqs = omega_logic.get_frequencies(game_config)
         if final_freqs:
             hist_data = [
-                {"Frecuencia": v, "Nivel": l.capitalize()}
+                {"Frecuencia": int(v), "Nivel": l.capitalize()}
                 for l in ["pares", "tercias", "cuartetos"]
-                if final_freqs.get(l)
-                for v in final_freqs[l].values()
+                if l in final_freqs
+                for v in final_freqs[l][final_freqs[l] > 0]
             ]
             if hist_data:
                 df_hist = pd.DataFrame(hist_data)
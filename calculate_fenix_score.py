@@ -6,112 +6,158 @@ import logging
 import time
 import sys
 import importlib
-from itertools import combinations
 from functools import partial
 import multiprocessing as mp
-from typing import List, Dict, Any, Tuple
-from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
 
 import config
 from utils.logger_config import setup_logger
-from utils.parallel_utils import NoDaemonPool
+from utils.parallel_utils import SharedArrayPool, get_shared_array
 from modules import database as db
-from modules import omega_logic as ol
+from modules.frequency_table import split_rank_ranges, subsequence_ranks
+from modules.time_travel import PairTrajectory, TimeTravel, replay
 
 importlib.reload(config)
 setup_logger()
 logger = logging.getLogger(__name__)
 
-# _worker_calculate_fenix no necesita cambios
-def _worker_calculate_fenix(combo_chunk: List[Tuple[int, ...]], trajectory_data: List[Tuple[Dict[str, Any], float]]) -> List[Dict[str, Any]]:
+START_POINT_ANALYSIS = 600
+
+# Memoria máxima de cada bloque (combinaciones x puntos) de la historia de scores.
+FENIX_BLOCK_BYTES = 64 * 1024 * 1024
+
+def _worker_calculate_fenix(row_range: Tuple[int, int], k: int) -> List[Dict[str, Any]]:
+    """
+    Calcula el Fénix de las filas [start, stop) de la matriz compartida de combinaciones.
+    La afinidad de pares es lineal en los conteos: la historia de un bloque es su matriz de
+    incidencia de pares (bloque x C(k, 2)) por la trayectoria de conteos (C(k, 2) x puntos).
+    Cada fila solo procesa los puntos desde 'desde' y los combina con sus estadísticas previas (Welford).
+    """
+    start, stop = row_range
+    combos = get_shared_array('combinations')[start:stop]
+    desde = get_shared_array('desde')[start:stop]
+    prev_count, prev_mean, prev_m2 = (get_shared_array(name)[start:stop] for name in ('prev_count', 'prev_mean', 'prev_m2'))
+    pair_counts_t = get_shared_array('pair_counts').T
+    umbrales = get_shared_array('umbrales')
+    divisores = np.where(umbrales != 0, umbrales, 1.0)
+    total_points = len(umbrales)
+    block_rows = max(1, FENIX_BLOCK_BYTES // (8 * max(total_points, pair_counts_t.shape[0])))
     fenix_results = []
-    for combo in combo_chunk:
-        historical_scores: List[float] = []
-        for freqs_past, umbral_past in trajectory_data:
-            af_p = ol._calculate_subsequence_affinity(list(combo), freqs_past, 2)
-            score_at_t = (af_p - umbral_past) / (umbral_past or 1)
-            historical_scores.append(score_at_t)
-        
-        fenix_score = np.std(historical_scores) if len(historical_scores) > 1 else 0.0
-        result_row = {'combination': list(combo), 'fenix_score': float(fenix_score)}
-        fenix_results.append(result_row)
+    for block_start in range(0, len(combos), block_rows):
+        block_desde = desde[block_start:block_start + block_rows]
+        for first in np.unique(block_desde).tolist():
+            count_b = total_points - first
+            if count_b <= 0: continue
+            rows = block_start + np.flatnonzero(block_desde == first)
+            block = combos[rows]
+            incidence = np.zeros((len(block), pair_counts_t.shape[0]), dtype=np.float64)
+            incidence[np.arange(len(block))[:, None], subsequence_ranks(block, 2, k)] = 1.0
+            # Los conteos caben exactos en float64, así el producto usa BLAS sin perder precisión.
+            historical_scores = (incidence @ pair_counts_t[:, first:] - umbrales[first:]) / divisores[first:]
+            mean_b = historical_scores.sum(axis=1) / count_b
+            m2_b = ((historical_scores - mean_b[:, None]) ** 2).sum(axis=1)
+            # Fusión de Chan/Welford con lo acumulado; sin historia previa equivale a np.std.
+            count_a, mean_a, m2_a = prev_count[rows], prev_mean[rows], prev_m2[rows]
+            count = count_a + count_b
+            delta = mean_b - mean_a
+            mean = np.where(count_a == 0, mean_b, mean_a + delta * count_b / count)
+            m2 = np.where(count_a == 0, m2_b, m2_a + m2_b + delta ** 2 * count_a * count_b / count)
+            fenix_scores = np.where(count > 1, np.sqrt(m2 / count), 0.0)
+            fenix_results.extend(
+                {'combination': combo, 'fenix_score': float(score), 'fenix_count': int(c), 'fenix_mean': float(mu), 'fenix_m2': float(sq)}
+                for combo, score, c, mu, sq in zip(block.tolist(), fenix_scores, count, mean, m2)
+            )
     return fenix_results
 
 
-def main(game_id: str):
-    try:
-        game_config = config.get_game_config(game_id)
-    except ValueError as e:
-        logger.error(f"Error: {e}."); return
-
-    logger.info("="*60); logger.info(f"PROYECTO FÉNIX (MOTOR INCREMENTAL): Calculando Scores para: {game_config['display_name']}"); logger.info("="*60)
-
+def compute_fenix_scores(game_config: Dict[str, Any], trajectory: PairTrajectory, incremental: bool = False, df_omega_class: Optional[pd.DataFrame] = None) -> None:
+    """
+    Calcula y guarda el Fénix de la Clase Omega a partir de la trayectoria de pares ya recorrida.
+    En modo incremental cada combinación solo incorpora los puntos posteriores a su 'fenix_last_concurso';
+    las que no tienen estadísticas (p. ej. recién añadidas a la clase) se calculan con toda la trayectoria.
+    """
     db_path = game_config['paths']['db']
     n = game_config['n']
     db.add_fenix_score_column(db_path)
+    if len(trajectory) == 0:
+        if incremental: logger.info("No hay puntos nuevos en la trayectoria; los Fenix Scores están al día.")
+        else: logger.warning("La trayectoria de pares no tiene puntos; no hay Fenix Scores que calcular.")
+        return
 
-    logger.info("Construyendo motor de viaje en el tiempo (Incremental)...")
-    df_historico_full = db.read_historico_from_db(db_path).sort_values(by='concurso').reset_index(drop=True)
-    result_cols = game_config['data_source']['result_columns']
-    
-    # --- INICIO DE LA CORRECCIÓN ESTRUCTURAL ---
-    START_POINT_ANALYSIS = 600
-    df_base_hist = df_historico_full[df_historico_full['concurso'] < START_POINT_ANALYSIS]
-    df_analysis_hist = df_historico_full[df_historico_full['concurso'] >= START_POINT_ANALYSIS].copy()
-    
-    # 1. Calcular el estado inicial una sola vez, ANTES del bucle.
-    logger.info("Calculando estado base inicial (hasta sorteo 600)...")
-    current_freqs = Counter(c for _, row in df_base_hist.iterrows() for c in combinations(sorted(row[result_cols]), 2))
-    afinidades_list = [ol._calculate_subsequence_affinity(list(sorted(row[result_cols])), {'pares': current_freqs}, 2) for _, row in df_base_hist.iterrows()]
-    
-    trajectory_points: List[Tuple[Dict[str, Any], float]] = []
-    total_points = len(df_analysis_hist)
-    
-    # 2. Bucle incremental que ahora funciona correctamente.
-    logger.info(f"Iniciando construcción incremental de {total_points} puntos de trayectoria...")
-    start_time_loop = time.time()
-
-    for i, analysis_row in enumerate(df_analysis_hist.itertuples(index=False)):
-        # Calcular el umbral basado en el estado *anterior*
-        umbral_pares_past = float(np.percentile(afinidades_list, 20)) if afinidades_list else 0.0
-        trajectory_points.append(({'pares': dict(current_freqs)}, umbral_pares_past))
-
-        # Actualizar el estado con la información del sorteo actual
-        current_combo = sorted([int(getattr(analysis_row, col)) for col in result_cols])
-        current_freqs.update(combinations(current_combo, 2))
-        afinidades_list.append(ol._calculate_subsequence_affinity(current_combo, {'pares': current_freqs}, 2))
-
-        if (i + 1) % 50 == 0 or (i + 1) == total_points:
-            logger.info(f"  -> Motor: Procesado punto {i + 1}/{total_points}...")
-
-    end_time_loop = time.time()
-    logger.info(f"Motor de viaje en el tiempo construido en {end_time_loop - start_time_loop:.2f} segundos con {len(trajectory_points)} puntos.")
-    # --- FIN DE LA CORRECCIÓN ESTRUCTURAL ---
-
-    # El resto del script ya es eficiente y utiliza el paralelismo
     logger.info("Cargando combinaciones de la Clase Omega para evaluar...")
-    df_omega_class = db.read_full_omega_class(db_path)
-    combinations_to_eval = [tuple(row) for row in df_omega_class[[f'c{i}' for i in range(1, n + 1)]].values]
-
+    if df_omega_class is None: df_omega_class = db.read_full_omega_class(db_path)
+    combinations_to_eval = df_omega_class[[f'c{i}' for i in range(1, n + 1)]].to_numpy(dtype=np.int64)
+
+    desde = np.zeros(len(df_omega_class), dtype=np.int64)
+    prev_count = np.zeros(len(df_omega_class), dtype=np.int64)
+    prev_mean = np.zeros(len(df_omega_class), dtype=np.float64)
+    prev_m2 = np.zeros(len(df_omega_class), dtype=np.float64)
+    if incremental:
+        last = pd.to_numeric(df_omega_class['fenix_last_concurso'], errors='coerce')
+        known = (last.notna() & df_omega_class['fenix_count'].notna()).to_numpy()
+        # La trayectoria debe registrar todos los puntos pendientes; las filas sin estadísticas la requieren completa.
+        if (known.any() and (last[known] + 1 < trajectory.start_concurso).any()) or ((~known).any() and trajectory.start_concurso > START_POINT_ANALYSIS):
+            raise ValueError("La trayectoria no cubre todos los puntos pendientes de la Clase Omega.")
+        desde[known] = np.searchsorted(trajectory.concursos, last[known].to_numpy(dtype=np.int64), side='right')
+        prev_count[known] = df_omega_class.loc[known, 'fenix_count'].to_numpy(dtype=np.int64)
+        prev_mean[known] = df_omega_class.loc[known, 'fenix_mean'].to_numpy(dtype=np.float64)
+        prev_m2[known] = df_omega_class.loc[known, 'fenix_m2'].to_numpy(dtype=np.float64)
+        logger.info(f"Modo incremental: {int(known.sum())} combinaciones con estadísticas previas, {int((~known).sum())} desde cero.")
+
+    # Las combinaciones y la trayectoria viajan una sola vez por memoria compartida; cada tarea es un rango de filas.
+    shared_arrays = {'combinations': combinations_to_eval, 'pair_counts': trajectory.pair_counts.astype(np.float64), 'umbrales': trajectory.umbrales,
+                     'desde': desde, 'prev_count': prev_count, 'prev_mean': prev_mean, 'prev_m2': prev_m2}
     n_processes = mp.cpu_count()
-    chunk_size = (len(combinations_to_eval) + n_processes - 1) // n_processes
-    chunks: List[List[Tuple[int, ...]]] = [combinations_to_eval[i:i + chunk_size] for i in range(0, len(combinations_to_eval), chunk_size)]
-    worker_func = partial(_worker_calculate_fenix, trajectory_data=trajectory_points)
+    chunks = split_rank_ranges(len(combinations_to_eval), n_processes)
+    worker_func = partial(_worker_calculate_fenix, k=game_config['k'])
 
     logger.info(f"Iniciando cálculo paralelo de {len(combinations_to_eval)} Fenix Scores en {n_processes} procesos...")
-    script_start_time = time.time()
     all_results: List[Dict[str, Any]] = []
     
-    with NoDaemonPool(processes=n_processes) as pool:
+    with SharedArrayPool(shared_arrays, processes=n_processes) as pool:
         for i, result_chunk in enumerate(pool.imap(worker_func, chunks)):
             all_results.extend(result_chunk)
             logger.info(f"  -> Paralelo: Procesado lote {i + 1}/{len(chunks)}...")
 
+    if not all_results:
+        logger.info("Los Fenix Scores ya incluyen todos los puntos de la trayectoria."); return
     df_fenix_scores = pd.DataFrame(all_results)
-    logger.info("Cálculo paralelo completado. Guardando resultados...")
+    df_fenix_scores['fenix_last_concurso'] = int(trajectory.concursos[-1])
+    logger.info(f"Cálculo paralelo completado. Guardando {len(df_fenix_scores)} resultados...")
     db.update_fenix_scores_in_db(db_path, df_fenix_scores, game_config)
+
+
+def main(game_id: str, incremental: bool = False):
+    try:
+        game_config = config.get_game_config(game_id)
+    except ValueError as e:
+        logger.error(f"Error: {e}."); return
+
+    logger.info("="*60); logger.info(f"PROYECTO FÉNIX (MOTOR INCREMENTAL): Calculando Scores para: {game_config['display_name']}"); logger.info("="*60)
+
+    db_path = game_config['paths']['db']
+    db.add_fenix_score_column(db_path)
+    df_omega_class = db.read_full_omega_class(db_path)
+    start_concurso = START_POINT_ANALYSIS
+    if incremental and not df_omega_class.empty and df_omega_class[['fenix_count', 'fenix_last_concurso']].notna().all(axis=None):
+        # Todas las combinaciones tienen historia: basta con registrar los puntos posteriores al más antiguo pendiente.
+        start_concurso = max(START_POINT_ANALYSIS, int(df_omega_class['fenix_last_concurso'].min()) + 1)
+
+    logger.info("Construyendo motor de viaje en el tiempo (Incremental)...")
+    df_historico_full = db.read_historico_from_db(db_path)
+    start_time_loop = time.time()
+
+    # El estado base (sorteos previos al 600) se cuenta en un solo lote y la trayectoria se registra desde ahí.
+    engine = TimeTravel(df_historico_full, game_config, levels=(2,), anchor_concurso=START_POINT_ANALYSIS)
+    trajectory = PairTrajectory(start_concurso)
+    replay(engine, [trajectory], start=engine.index_of(start_concurso))
+    logger.info(f"Motor de viaje en el tiempo construido en {time.time() - start_time_loop:.2f} segundos con {len(trajectory)} puntos.")
+
+    compute_fenix_scores(game_config, trajectory, incremental=incremental, df_omega_class=df_omega_class)
     
     logger.info("="*60); logger.info(f"PROYECTO FÉNIX COMPLETO. Tiempo total: {(time.time() - start_time_loop) / 60:.2f} minutos."); logger.info("="*60)
 
 if __name__ == "__main__":
-    main('melate_retro')
\ No newline at end of file
+    game_id_arg = sys.argv[1] if len(sys.argv) > 1 else 'melate_retro'
+    # 'incremental' como segundo argumento solo incorpora los puntos nuevos de la trayectoria.
+    main(game_id_arg, incremental=len(sys.argv) > 2 and sys.argv[2] == 'incremental')
\ No newline at end of file
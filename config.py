@@ -39,7 +39,20 @@ GAME_REGISTRY: Dict[str, Dict[str, Any]] = {
         'omega_config': {
             'affinity_levels': [2, 3, 4],
             'score_weights': {'pares': 0.2, 'tercias': 0.3, 'cuartetos': 0.5},
-            'default_thresholds': {'pares': 421, 'tercias': 65, 'cuartetos': 16}
+            'default_thresholds': {'pares': 421, 'tercias': 65, 'cuartetos': 16},
+            # 'blocks' recorre todo el universo; 'branch_and_bound' poda subárboles por cotas superiores.
+            'pregeneration_method': 'blocks',
+            # Con pocos sorteos nuevos y umbrales iguales o más altos, solo se recalcula su vecindad.
+            'incremental_pregeneration': True,
+            # 'exact' cuenta la Cobertura Universal sobre todo el universo; 'sample' la estima sobre una muestra
+            # común a todos los escenarios (con intervalo de confianza); 'monte_carlo' usa una muestra por escenario.
+            'coverage_mode': 'exact',
+            'coverage_sample_size': 20000,
+            'coverage_sample_batch': 2000,
+            # 'grid' evalúa la rejilla fija de percentiles; 'adaptive' sigue la frontera sobre umbrales enteros.
+            'threshold_search': 'grid',
+            # En la trayectoria, parte de los umbrales del bloque anterior; solo aplica con 'adaptive'.
+            'warm_start': True
         }
     },
     
@@ -66,7 +79,14 @@ GAME_REGISTRY: Dict[str, Dict[str, Any]] = {
             # Mantenemos los mismos pesos para el experimento
             'score_weights': {'pares': 0.2, 'tercias': 0.3, 'cuartetos': 0.5},
             # Umbrales iniciales conservadores (se optimizarán con el ML)
-            'default_thresholds': {'pares': 1, 'tercias': 1, 'cuartetos': 1}
+            'default_thresholds': {'pares': 1, 'tercias': 1, 'cuartetos': 1},
+            'pregeneration_method': 'blocks',
+            'incremental_pregeneration': True,
+            'coverage_mode': 'exact',
+            'coverage_sample_size': 20000,
+            'coverage_sample_batch': 2000,
+            'threshold_search': 'grid',
+            'warm_start': True
         }
     }
 }
@@ -80,9 +100,11 @@ def get_game_paths(game_id: str) -> Dict[str, str]:
     
     return {
         'db': os.path.join(DATA_DIR, f"{game_id}.db"),
-        'frequencies': os.path.join(DATA_DIR, f"{game_id}_frecuencias.json"),
+        'frequencies': os.path.join(DATA_DIR, f"{game_id}_frecuencias.bin"),
+        'frequencies_legacy': os.path.join(DATA_DIR, f"{game_id}_frecuencias.json"),
         'state': os.path.join(DATA_DIR, f"{game_id}_system_state.json"),
         'thresholds': os.path.join(DATA_DIR, f"{game_id}_thresholds.json"),
+        'cancel_optimization': os.path.join(DATA_DIR, f"{game_id}_cancel_optimization.flag"),
         'backup': os.path.join(DATA_DIR, f"{game_id}_registros_backup.json")
     }
 
@@ -103,6 +125,7 @@ UMBRALES_TRAYECTORIA_SCHEMA = {
     "ultimo_concurso_usado": "INTEGER PRIMARY KEY", "umbral_pares": "INTEGER NOT NULL",
     "umbral_tercias": "INTEGER NOT NULL", "umbral_cuartetos": "INTEGER NOT NULL",
     "cobertura_historica": "REAL NOT NULL", "cobertura_universal_estimada": "REAL NOT NULL",
+    "costo_optimizacion_seg": "REAL", "evaluaciones": "INTEGER", "arranque_en_caliente": "INTEGER",
     "fecha_calculo": "DATETIME"
 }
 
@@ -0,0 +1,87 @@
+# generate_all_trajectories.py
+
+import logging
+import time
+import sys
+import importlib
+
+import config
+from utils.logger_config import setup_logger
+from modules import database as db
+from modules.time_travel import PairTrajectory, TimeTravel, replay
+
+import generate_trajectory
+import generate_omega_score_trajectory
+import calculate_fenix_score
+import generate_golden_trajectory
+
+importlib.reload(config)
+setup_logger()
+logger = logging.getLogger(__name__)
+
+def main(game_id: str, block_size: int = 100, optimize_every: int = 1, parallel: bool = False, warm_start: bool = True):
+    """
+    Genera la trayectoria por bloques, Omega Cero, el Score Fénix y la Línea Dorada con un único
+    recorrido del histórico. Fénix y la Línea Dorada se calculan al final sobre la trayectoria de pares registrada.
+    """
+    try:
+        game_config = config.get_game_config(game_id)
+    except ValueError as e:
+        logger.error(f"Error: {e}. Juegos disponibles: {list(config.GAME_REGISTRY.keys())}")
+        return
+
+    logger.info("=" * 60); logger.info(f"VIAJE EN EL TIEMPO COMPARTIDO PARA: {game_config['display_name']}"); logger.info("=" * 60)
+    db_path = game_config['paths']['db']
+    script_start_time = time.time()
+
+    df_full_historico = db.read_historico_from_db(db_path)
+    if df_full_historico.empty:
+        logger.error("El histórico está vacío. Ejecute la configuración en la app primero."); return
+
+    engine = TimeTravel(df_full_historico, game_config, anchor_concurso=calculate_fenix_score.START_POINT_ANALYSIS)
+    consumers = []
+
+    analysis_points = generate_trajectory.trajectory_points(len(engine), block_size)
+    if len(engine) > analysis_points[0]:
+        generate_trajectory.prepare_database_for_trajectory(db_path)
+        consumers.append(generate_trajectory.TrajectoryConsumer(game_config, analysis_points, optimize_every, warm_start=warm_start, parallel=parallel))
+    else:
+        logger.error(f"No hay suficientes sorteos ({len(engine)}) para la trayectoria por bloques; se omite.")
+
+    if 'omega_score' in df_full_historico.columns:
+        generate_omega_score_trajectory.prepare_database_for_cero(db_path)
+        consumers.append(generate_omega_score_trajectory.OmegaCeroConsumer(game_config))
+    else:
+        logger.error("El histórico no está enriquecido; se omite Omega Cero.")
+
+    pair_trajectory = PairTrajectory(calculate_fenix_score.START_POINT_ANALYSIS)
+    consumers.append(pair_trajectory)
+
+    replay(engine, consumers)
+
+    calculate_fenix_score.compute_fenix_scores(game_config, pair_trajectory)
+    generate_golden_trajectory.build_golden_line(game_config, pair_trajectory)
+
+    logger.info("=" * 60); logger.info(f"TRAYECTORIAS COMPLETAS. Tiempo total: {(time.time() - script_start_time) / 60:.2f} minutos."); logger.info("=" * 60)
+
+if __name__ == "__main__":
+    game_id_arg = 'melate_retro'
+    block_size_arg = 100
+    optimize_every_arg = 1
+
+    if len(sys.argv) > 1:
+        game_id_arg = sys.argv[1]
+
+    try:
+        if len(sys.argv) > 2: block_size_arg = int(sys.argv[2])
+        if len(sys.argv) > 3: optimize_every_arg = int(sys.argv[3])
+    except ValueError:
+        print("Error: El tamaño del bloque y la frecuencia de optimización deben ser números enteros.")
+        sys.exit(1)
+
+    # Opciones a partir del cuarto argumento: 'parallel' y 'cold' (sin arranque en caliente).
+    options = set(sys.argv[4:])
+    parallel_arg = 'parallel' in options
+    warm_start_arg = 'cold' not in options
+
+    main(game_id=game_id_arg, block_size=block_size_arg, optimize_every=optimize_every_arg, parallel=parallel_arg, warm_start=warm_start_arg)
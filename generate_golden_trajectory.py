@@ -7,29 +7,33 @@ import time
 import sys
 import sqlite3
 import importlib
-from typing import List, Dict, Any, Tuple
-from collections import Counter
-from itertools import combinations
+from typing import List, Dict, Any, Sequence, Tuple
 
 import config
 from utils.logger_config import setup_logger
 from modules import database as db
-from modules import omega_logic as ol
+from modules.frequency_table import subsequence_ranks
+from modules.time_travel import PairTrajectory, TimeTravel, replay
 
 importlib.reload(config)
 setup_logger()
 logger = logging.getLogger(__name__)
 
+START_POINT_ANALYSIS = 600
+
 def prepare_database(db_path: str):
     conn = None
     try:
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         cursor.execute("DROP TABLE IF EXISTS golden_trajectory")
+        # Una línea por percentil de élite: la clave incluye el percentil.
         cursor.execute("""
             CREATE TABLE golden_trajectory (
-                concurso INTEGER PRIMARY KEY,
-                elite_score_original_mean REAL NOT NULL
+                concurso INTEGER NOT NULL,
+                elite_percentile REAL NOT NULL,
+                elite_score_original_mean REAL NOT NULL,
+                PRIMARY KEY (concurso, elite_percentile)
             );
         """)
         conn.commit()
@@ -38,78 +42,77 @@ def prepare_database(db_path: str):
     finally:
         if conn: conn.close()
 
-def main(game_id: str, elite_percentile: float = 95.0):
-    try:
-        game_config = config.get_game_config(game_id)
-    except ValueError as e:
-        logger.error(f"Error: {e}."); return
-
-    logger.info("="*60); logger.info(f"GENERANDO LÍNEA DORADA (ALTA RESOLUCIÓN) PARA: {game_config['display_name']}"); logger.info("="*60)
+def build_golden_line(game_config: Dict[str, Any], trajectory: PairTrajectory, elite_percentiles: Sequence[float] = (95.0,)) -> None:
+    """
+    Evalúa la Élite Reactiva de cada percentil en todos los puntos de la trayectoria de pares y guarda una Línea Dorada por percentil.
+    La afinidad media de la élite es lineal en los conteos: cada élite se reduce a su vector de multiplicidad
+    de pares y todas las líneas salen de un solo producto (puntos x C(k, 2)) @ (C(k, 2) x percentiles).
+    """
     db_path = game_config['paths']['db']
+    elite_percentiles = [float(p) for p in elite_percentiles]
 
     df_candidates = db.read_omega_class_with_fenix(db_path, only_unplayed=True)
     if df_candidates.empty or 'fenix_score' not in df_candidates.columns or df_candidates['fenix_score'].isnull().all():
         logger.error("No se encontraron Scores Fénix. Ejecute 'calculate_fenix_score.py' primero."); return
 
-    threshold_fenix = np.percentile(df_candidates['fenix_score'].dropna(), elite_percentile)
-    df_elite = df_candidates[df_candidates['fenix_score'] >= threshold_fenix]
-    logger.info(f"Umbral de Fenix Score (percentil {elite_percentile}): {threshold_fenix:.4f}. Élite Reactiva: {len(df_elite)} combinaciones.")
-    
     combo_cols = [f'c{i}' for i in range(1, game_config['n'] + 1)]
-    elite_combinations = [list(map(int, row)) for row in df_elite[combo_cols].values]
+    total_pairs = trajectory.pair_counts.shape[1]
+    multiplicities = np.zeros((total_pairs, len(elite_percentiles)), dtype=np.float64)
+    elite_sizes = np.zeros(len(elite_percentiles), dtype=np.int64)
+    thresholds_fenix = np.percentile(df_candidates['fenix_score'].dropna(), elite_percentiles)
+    for j, (elite_percentile, threshold_fenix) in enumerate(zip(elite_percentiles, thresholds_fenix)):
+        df_elite = df_candidates[df_candidates['fenix_score'] >= threshold_fenix]
+        logger.info(f"Umbral de Fenix Score (percentil {elite_percentile}): {threshold_fenix:.4f}. Élite Reactiva: {len(df_elite)} combinaciones.")
+        elite_matrix = df_elite[combo_cols].to_numpy(dtype=np.int64)
+        multiplicities[:, j] = np.bincount(subsequence_ranks(elite_matrix, 2, game_config['k']).ravel(), minlength=total_pairs)
+        elite_sizes[j] = len(elite_matrix)
 
-    df_full_historico = db.read_historico_from_db(db_path).sort_values(by='concurso').reset_index(drop=True)
-    result_cols = game_config['data_source']['result_columns']
-    
-    # --- INICIO DE LA CORRECCIÓN ESTRUCTURAL ---
-    START_POINT_ANALYSIS = 600
-    df_base_hist = df_full_historico[df_full_historico['concurso'] < START_POINT_ANALYSIS]
-    df_analysis_hist = df_full_historico[df_full_historico['concurso'] >= START_POINT_ANALYSIS].copy()
-    
-    # 1. Calcular el estado inicial una sola vez, ANTES del bucle.
-    logger.info("Calculando estado base inicial (hasta sorteo 600)...")
-    current_freqs = Counter(c for _, row in df_base_hist.iterrows() for c in combinations(sorted(row[result_cols]), 2))
-    afinidades_list = [ol._calculate_subsequence_affinity(list(sorted(row[result_cols])), {'pares': current_freqs}, 2) for _, row in df_base_hist.iterrows()]
-    
-    golden_trajectory_data: List[Tuple[int, float]] = []
-    total_points = len(df_analysis_hist)
-
-    logger.info(f"Iniciando generación de la Línea Dorada sobre {total_points} puntos...")
-
-    # 2. Bucle incremental que ahora funciona correctamente.
-    for i, analysis_row in enumerate(df_analysis_hist.itertuples(index=False)):
-        current_concurso_num = int(analysis_row.concurso) # type: ignore
-
-        umbral_pares_past = float(np.percentile(afinidades_list, 20)) if afinidades_list else 0.0
-        freqs_past_dict = {'pares': dict(current_freqs)}
-        
-        elite_scores_at_t: List[float] = [
-            float((ol._calculate_subsequence_affinity(combo, freqs_past_dict, 2) - umbral_pares_past) / (umbral_pares_past or 1))
-            for combo in elite_combinations
-        ]
-        
-        mean_score = float(np.mean(elite_scores_at_t)) if elite_scores_at_t else 0.0
-        golden_trajectory_data.append((current_concurso_num, mean_score))
-
-        # Actualizar el estado para la siguiente iteración
-        current_combo = sorted([int(getattr(analysis_row, col)) for col in result_cols])
-        current_freqs.update(combinations(current_combo, 2))
-        afinidades_list.append(ol._calculate_subsequence_affinity(current_combo, {'pares': current_freqs}, 2))
-        
-        if (i + 1) % 100 == 0 or (i + 1) == total_points:
-            logger.info(f"  -> Línea Dorada: Procesado punto {i + 1}/{total_points} (Concurso: {current_concurso_num})")
-    # --- FIN DE LA CORRECCIÓN ESTRUCTURAL ---
+    total_points = len(trajectory)
+    logger.info(f"Iniciando generación de {len(elite_percentiles)} Líneas Doradas sobre {total_points} puntos...")
+
+    # Los conteos caben exactos en float64, así el producto usa BLAS sin perder precisión.
+    elite_sums = trajectory.pair_counts.astype(np.float64) @ multiplicities
+    umbrales = trajectory.umbrales[:, None]
+    mean_scores = (elite_sums / np.maximum(elite_sizes, 1) - umbrales) / np.where(umbrales != 0, umbrales, 1.0)
+    mean_scores[:, elite_sizes == 0] = 0.0
+
+    golden_trajectory_data: List[Tuple[int, float, float]] = [
+        (concurso, elite_percentile, score)
+        for j, elite_percentile in enumerate(elite_percentiles)
+        for concurso, score in zip(trajectory.concursos.tolist(), mean_scores[:, j].tolist())
+    ]
 
     prepare_database(db_path)
     conn = sqlite3.connect(db_path)
     try:
         cursor = conn.cursor()
-        cursor.executemany("INSERT INTO golden_trajectory VALUES (?, ?)", golden_trajectory_data)
+        cursor.executemany("INSERT INTO golden_trajectory VALUES (?, ?, ?)", golden_trajectory_data)
         conn.commit()
     finally:
         conn.close()
     
-    logger.info(f"Línea Dorada generada con {len(golden_trajectory_data)} puntos y guardada.")
+    logger.info(f"Línea Dorada generada con {total_points} puntos para los percentiles {elite_percentiles} y guardada.")
+
+def main(game_id: str, elite_percentiles: Sequence[float] = (95.0,)):
+    try:
+        game_config = config.get_game_config(game_id)
+    except ValueError as e:
+        logger.error(f"Error: {e}."); return
+
+    logger.info("="*60); logger.info(f"GENERANDO LÍNEA DORADA (ALTA RESOLUCIÓN) PARA: {game_config['display_name']}"); logger.info("="*60)
+
+    df_full_historico = db.read_historico_from_db(game_config['paths']['db'])
+    engine = TimeTravel(df_full_historico, game_config, levels=(2,), anchor_concurso=START_POINT_ANALYSIS)
+    trajectory = PairTrajectory(START_POINT_ANALYSIS)
+    replay(engine, [trajectory], start=engine.index_of(START_POINT_ANALYSIS))
+
+    build_golden_line(game_config, trajectory, elite_percentiles)
 
 if __name__ == "__main__":
-    main('melate_retro')
\ No newline at end of file
+    game_id_arg = sys.argv[1] if len(sys.argv) > 1 else 'melate_retro'
+    # Percentiles de élite adicionales como argumentos: p. ej. "melate_retro 90 95 99".
+    try:
+        percentiles_arg = [float(p) for p in sys.argv[2:]] or [95.0]
+    except ValueError:
+        print("Error: Los percentiles de élite deben ser números."); sys.exit(1)
+    main(game_id_arg, percentiles_arg)
@@ -6,17 +6,18 @@ import time
 import sqlite3
 import sys
 import numpy as np
-from collections import Counter
-from itertools import combinations
+import multiprocessing as mp
 import importlib
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 # --- CONFIGURACIÓN INICIAL ---
 import config
 from utils.logger_config import setup_logger
 from modules import database as db
 from modules import ml_optimizer
-from modules.omega_logic import _calculate_subsequence_affinity
+from modules.frequency_table import FrequencyTable, LEVEL_NAMES
+from modules.time_travel import Snapshot, TimeTravel, replay
+from utils.parallel_utils import SharedArrayPool, get_shared_array
 
 importlib.reload(config)
 setup_logger()
@@ -24,17 +25,19 @@ logger = logging.getLogger(__name__)
 
 # --- FUNCIONES DE AYUDA REFACTORIZADAS ---
 
+TRAJECTORY_SCHEMAS = {
+    'umbrales_trayectoria': config.UMBRALES_TRAYECTORIA_SCHEMA,
+    'frecuencias_trayectoria': config.FRECUENCIAS_TRAYECTORIA_SCHEMA,
+    'afinidades_trayectoria': config.AFINIDADES_TRAYECTORIA_SCHEMA,
+    'freq_dist_trayectoria': config.FREQ_DIST_TRAYECTORIA_SCHEMA
+}
+
 def prepare_database_for_trajectory(db_path: str):
     logger.info("=" * 30)
     logger.info(f"FASE PREPARATORIA: Reconstruyendo Tablas de Trayectoria en '{db_path}'")
     logger.info("=" * 30)
     
-    schemas = {
-        'umbrales_trayectoria': config.UMBRALES_TRAYECTORIA_SCHEMA,
-        'frecuencias_trayectoria': config.FRECUENCIAS_TRAYECTORIA_SCHEMA,
-        'afinidades_trayectoria': config.AFINIDADES_TRAYECTORIA_SCHEMA,
-        'freq_dist_trayectoria': config.FREQ_DIST_TRAYECTORIA_SCHEMA
-    }
+    schemas = TRAJECTORY_SCHEMAS
     
     conn = None
     try:
@@ -58,29 +61,233 @@ def prepare_database_for_trajectory(db_path: str):
     finally:
         if conn: conn.close()
 
-def save_trajectory_data(db_path: str, table_name: str, schema_dict: Dict, data_dict: Dict):
+def save_trajectory_rows(db_path: str, rows_by_table: Dict[str, List[Dict[str, Any]]]):
+    """Guarda las filas pendientes de todas las tablas de trayectoria en una sola transacción."""
     conn = None
     try:
         conn = sqlite3.connect(db_path, timeout=10.0)
         cursor = conn.cursor()
         
-        cols = [col for col in schema_dict.keys() if col != 'fecha_calculo']
-        placeholders = ", ".join(["?"] * len(cols))
-        
-        query = f"INSERT OR REPLACE INTO {table_name} ({', '.join(cols)}, fecha_calculo) VALUES ({placeholders}, datetime('now', 'localtime'))"
-        params = tuple(data_dict[col] for col in cols)
-
-        cursor.execute(query, params)
+        for table_name, rows in rows_by_table.items():
+            if not rows: continue
+            cols = [col for col in TRAJECTORY_SCHEMAS[table_name].keys() if col != 'fecha_calculo']
+            placeholders = ", ".join(["?"] * len(cols))
+            
+            query = f"INSERT OR REPLACE INTO {table_name} ({', '.join(cols)}, fecha_calculo) VALUES ({placeholders}, datetime('now', 'localtime'))"
+            cursor.executemany(query, [tuple(row[col] for col in cols) for row in rows])
         conn.commit()
     except Exception as e:
-        logger.error(f"Error guardando datos en '{table_name}': {e}", exc_info=True)
+        logger.error(f"Error guardando datos de trayectoria: {e}", exc_info=True)
+        if conn: conn.rollback()
         raise
     finally:
         if conn: conn.close()
 
+# --- OPTIMIZACIÓN DE UMBRALES POR BLOQUE ---
+
+def optimize_block(
+    game_config: Dict[str, Any],
+    df_historico: pd.DataFrame,
+    freqs: FrequencyTable,
+    ultimo_concurso: int,
+    warm_start: Optional[Dict[str, int]] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, int]]]:
+    """Optimiza los umbrales de un bloque. Devuelve su fila (None si falló) y los umbrales para arrancar el siguiente."""
+    optimization_start_time = time.time()
+    success, _, report = ml_optimizer.run_optimization(
+        game_config, df_historico, freqs,
+        warm_start=warm_start, persist_scenarios=False, save_thresholds=False
+    )
+    optimization_cost = time.time() - optimization_start_time
+    if not (success and 'new_thresholds' in report):
+        logger.error(f"La optimización falló para el bloque hasta el sorteo {ultimo_concurso}.")
+        return None, warm_start
+    thresholds = report['new_thresholds']
+    logger.info(f"Optimización en {optimization_cost:.2f} s con {report.get('evaluaciones', 0)} evaluaciones (arranque en caliente: {'sí' if report.get('arranque_en_caliente') else 'no'}).")
+    return {
+        "ultimo_concurso_usado": ultimo_concurso, "umbral_pares": thresholds.get('pares', 0), "umbral_tercias": thresholds.get('tercias', 0), "umbral_cuartetos": thresholds.get('cuartetos', 0),
+        "cobertura_historica": report.get('cobertura_historica', 0.0), "cobertura_universal_estimada": report.get('cobertura_universal_estimada', 0.0),
+        "costo_optimizacion_seg": optimization_cost, "evaluaciones": report.get('evaluaciones', 0), "arranque_en_caliente": int(report.get('arranque_en_caliente', False))
+    }, thresholds
+
+# Estado de cada worker de bloques: configuración e histórico completo, fijados por el inicializador.
+_block_worker: Dict[str, Any] = {}
+
+def _init_block_worker(game_config: Dict[str, Any], df_historico: pd.DataFrame, inner_processes: int):
+    _block_worker.update(game_config=game_config, df_historico=df_historico)
+    # Los pools internos del optimizador se reparten los núcleos que dejan libres los workers de bloques.
+    ml_optimizer.MAX_PROCESSES = inner_processes
+
+def _worker_optimize_segment(task: Tuple[int, List[Tuple[int, int, int]]]) -> List[Dict[str, Any]]:
+    """
+    Optimiza un tramo de bloques consecutivos. Parte de la instantánea de frecuencias de su primer bloque
+    (memoria compartida) y la avanza con los sorteos compartidos. Cada bloque se optimiza en frío, así el
+    resultado no depende de cómo se reparten los bloques entre procesos.
+    """
+    segment, boundaries = task
+    game_config, df_historico = _block_worker['game_config'], _block_worker['df_historico']
+    draws = get_shared_array('draws')
+    freqs = FrequencyTable(game_config['k'], {level: get_shared_array(f'freq_{level}')[segment].copy() for level in LEVEL_NAMES})
+    counted, rows = boundaries[0][1], []
+    for index, valid_draws, ultimo_concurso in boundaries:
+        freqs.update(draws[counted:valid_draws])
+        counted = valid_draws
+        row, _ = optimize_block(game_config, df_historico.head(index), freqs, ultimo_concurso)
+        if row is not None: rows.append(row)
+    return rows
+
+# --- CONSUMIDOR DEL VIAJE EN EL TIEMPO ---
+
+def trajectory_points(total_sorteos: int, block_size: int, start_point: int = 50) -> List[int]:
+    """Posiciones (número de sorteos contados) en las que se mide la trayectoria; siempre incluye el final."""
+    analysis_points = list(range(start_point, total_sorteos, block_size))
+    if total_sorteos not in analysis_points:
+        analysis_points.append(total_sorteos)
+    return analysis_points
+
+class TrajectoryConsumer:
+    """
+    Mide frecuencias, afinidades y umbrales óptimos en cada punto de bloque del recorrido.
+    Las afinidades de todos los sorteos pasados se arrastran en el motor y solo se resumen en cada punto.
+    Los umbrales se optimizan cada 'optimize_every' bloques (y en el último); las filas se acumulan y se
+    guardan en una transacción tras cada optimización, así block_size=1 sigue siendo viable. Con
+    warm_start=False cada bloque hace la búsqueda completa (con 'grid' no hay arranque en caliente).
+    Con parallel=True el recorrido solo anota los bloques a optimizar y, al terminar, los reparte en tramos
+    contiguos entre procesos, sin arranque en caliente; las filas de umbrales se incorporan en orden y todo
+    se guarda al final. Los umbrales del último bloque (todo el histórico) se adoptan una vez, al terminar.
+    """
+    def __init__(self, game_config: Dict[str, Any], analysis_points: List[int], optimize_every: int = 1,
+                 warm_start: bool = True, parallel: bool = False, processes: Optional[int] = None):
+        self.game_config = game_config
+        self.db_path = game_config['paths']['db']
+        self.analysis_points = analysis_points
+        self.points = set(analysis_points)
+        self.optimize_every = max(1, optimize_every)
+        # Los umbrales del bloque anterior arrancan la búsqueda del siguiente.
+        # El arranque en caliente encadena los bloques, así que no aplica en paralelo.
+        self.warm_start = warm_start and not parallel
+        self.previous_thresholds = None
+        self.final_row: Optional[Dict[str, Any]] = None
+        self.block = 0
+        self.pending: Dict[str, List[Dict[str, Any]]] = {table_name: [] for table_name in TRAJECTORY_SCHEMAS}
+        self.parallel = parallel
+        if parallel:
+            total_blocks = len(analysis_points)
+            optimized = sum(1 for block in range(1, total_blocks + 1) if block % self.optimize_every == 0 or block == total_blocks)
+            self.processes = max(1, min(processes or mp.cpu_count(), optimized))
+            # Un tramo por proceso; solo el primer bloque de cada tramo guarda una instantánea de frecuencias.
+            self.segments = np.array_split(np.arange(optimized), self.processes)
+            self.segment_starts = {int(segment[0]) for segment in self.segments}
+            # (posición, sorteos válidos contados, último concurso) de cada bloque a optimizar.
+            self.boundaries: List[Tuple[int, int, int]] = []
+            self.snapshots: List[Dict[int, np.ndarray]] = []
+            self.engine: Optional[TimeTravel] = None
+
+    def consume(self, snapshot: Snapshot) -> None:
+        if snapshot.index not in self.points: return
+        iter_start_time = time.time()
+        self.block += 1
+        is_last = self.block == len(self.analysis_points)
+        
+        ultimo_concurso = snapshot.ultimo_concurso
+        
+        if self.optimize_every == 1 or self.block % 100 == 0 or is_last:
+            logger.info(f"--- Procesando Bloque {self.block}/{len(self.analysis_points)} (hasta concurso {ultimo_concurso}) ---")
+        
+        # 1. Frecuencias al cierre del bloque (el motor las avanza sorteo a sorteo)
+        master_frequencies = snapshot.freqs
+        
+        # 2. Métricas de CONTEO de frecuencias
+        self.pending['frecuencias_trayectoria'].append({
+            "ultimo_concurso_usado": ultimo_concurso,
+            "total_pares_unicos": int(np.count_nonzero(master_frequencies['pares'])),
+            "suma_freq_pares": int(master_frequencies['pares'].sum()),
+            "total_tercias_unicas": int(np.count_nonzero(master_frequencies['tercias'])),
+            "suma_freq_tercias": int(master_frequencies['tercias'].sum()),
+            "total_cuartetos_unicos": int(np.count_nonzero(master_frequencies['cuartetos'])),
+            "suma_freq_cuartetos": int(master_frequencies['cuartetos'].sum()),
+        })
+
+        # 3. Métricas de DISTRIBUCIÓN de valores de frecuencias
+        freq_dist_metrics: Dict[str, Any] = {"ultimo_concurso_usado": ultimo_concurso}
+        for level in ['pares', 'tercias', 'cuartetos']:
+            observed = master_frequencies[level][master_frequencies[level] > 0]
+            values = observed if observed.size else [0]
+            freq_dist_metrics[f'freq_{level}_media'] = float(np.mean(values))
+            freq_dist_metrics[f'freq_{level}_min'] = int(np.min(values))
+            freq_dist_metrics[f'freq_{level}_max'] = int(np.max(values))
+        self.pending['freq_dist_trayectoria'].append(freq_dist_metrics)
+
+        # 4. Métricas de AFINIDADES, resumidas de los arreglos que el motor mantiene al día
+        affinity_metrics: Dict[str, Any] = {"ultimo_concurso_usado": ultimo_concurso}
+        for level in ['pares', 'tercias', 'cuartetos']:
+            summary = snapshot.affinity_summary(level)
+            affinity_metrics[f'afin_{level}_media'] = float(summary['media'])
+            affinity_metrics[f'afin_{level}_mediana'] = float(summary['mediana'])
+            affinity_metrics[f'afin_{level}_min'] = int(summary['min'])
+            affinity_metrics[f'afin_{level}_max'] = int(summary['max'])
+        self.pending['afinidades_trayectoria'].append(affinity_metrics)
+
+        # 5. Optimizar UMBRALES y guardar todo lo pendiente en una transacción
+        if self.block % self.optimize_every == 0 or is_last:
+            if self.parallel:
+                self._mark_boundary(snapshot)
+                return
+            self._optimize(snapshot, ultimo_concurso)
+            self.flush()
+            logger.info(f"Bloque completado en {time.time() - iter_start_time:.2f} segundos.")
+
+    def _optimize(self, snapshot: Snapshot, ultimo_concurso: int) -> None:
+        row, thresholds = optimize_block(
+            self.game_config, snapshot.history, snapshot.freqs, ultimo_concurso, self.previous_thresholds
+        )
+        if self.warm_start: self.previous_thresholds = thresholds
+        # Las optimizaciones llegan en orden: la última es la del bloque final.
+        self.final_row = row
+        if row is not None: self.pending['umbrales_trayectoria'].append(row)
+
+    def _mark_boundary(self, snapshot: Snapshot) -> None:
+        self.engine = snapshot.engine
+        if len(self.boundaries) in self.segment_starts:
+            self.snapshots.append({level: array.copy() for level, array in snapshot.freqs.tables.items()})
+        self.boundaries.append((snapshot.index, len(snapshot.draws), snapshot.ultimo_concurso))
+
+    def _optimize_parallel(self) -> None:
+        if not self.boundaries: return
+        optimization_start_time = time.time()
+        shared_arrays = {'draws': self.engine.draws}
+        for level in LEVEL_NAMES:
+            shared_arrays[f'freq_{level}'] = np.stack([snapshot[level] for snapshot in self.snapshots])
+        self.snapshots = []
+        tasks = [(i, [self.boundaries[j] for j in segment]) for i, segment in enumerate(self.segments)]
+        inner_processes = max(1, mp.cpu_count() // self.processes)
+        logger.info(f"Optimizando {len(self.boundaries)} bloques en {self.processes} tramos paralelos ({inner_processes} procesos internos cada uno)...")
+        with SharedArrayPool(shared_arrays, processes=self.processes, initializer=_init_block_worker,
+                             initargs=(self.game_config, self.engine.df, inner_processes)) as pool:
+            # imap conserva el orden de los tramos, así las filas se incorporan en orden de concurso.
+            for rows in pool.imap(_worker_optimize_segment, tasks):
+                self.pending['umbrales_trayectoria'].extend(rows)
+        rows = self.pending['umbrales_trayectoria']
+        self.final_row = rows[-1] if rows and rows[-1]['ultimo_concurso_usado'] == self.boundaries[-1][2] else None
+        logger.info(f"Optimización paralela completada en {time.time() - optimization_start_time:.2f} segundos.")
+
+    def flush(self) -> None:
+        if not any(self.pending.values()): return
+        save_trajectory_rows(self.db_path, self.pending)
+        self.pending = {table_name: [] for table_name in TRAJECTORY_SCHEMAS}
+
+    def finish(self) -> None:
+        if self.parallel: self._optimize_parallel()
+        self.flush()
+        if self.final_row is None: return
+        final_thresholds = {name: int(self.final_row[f'umbral_{name}']) for name in LEVEL_NAMES.values()}
+        success, message = ml_optimizer.apply_scenario_thresholds(self.game_config, final_thresholds)
+        if success: logger.info(message)
+        else: logger.error(message)
+
 # --- FUNCIÓN PRINCIPAL REFACTORIZADA ---
 
-def main(game_id: str, block_size: int = 100):
+def main(game_id: str, block_size: int = 100, optimize_every: int = 1, parallel: bool = False, warm_start: bool = True):
     try:
         game_config = config.get_game_config(game_id)
     except ValueError as e:
@@ -89,11 +296,10 @@ def main(game_id: str, block_size: int = 100):
 
     logger.info("=" * 60)
     logger.info(f"INICIANDO GENERACIÓN DE TRAYECTORIA PARA: {game_config['display_name']}")
-    logger.info(f"Tamaño de bloque configurado: {block_size} sorteos")
+    logger.info(f"Tamaño de bloque configurado: {block_size} sorteos (umbrales cada {optimize_every} bloques{', en paralelo' if parallel else ''})")
     logger.info("=" * 60)
     
     db_path = game_config['paths']['db']
-    result_columns = game_config['data_source']['result_columns']
     
     prepare_database_for_trajectory(db_path)
     
@@ -102,7 +308,6 @@ def main(game_id: str, block_size: int = 100):
         logger.error("El histórico está vacío. Ejecute la configuración en la app primero.")
         return
         
-    df_full_historico = df_full_historico.sort_values(by='concurso').reset_index(drop=True)
     total_sorteos = len(df_full_historico)
     
     start_point = 50 
@@ -110,94 +315,14 @@ def main(game_id: str, block_size: int = 100):
         logger.error(f"No hay suficientes sorteos ({total_sorteos}) para iniciar el análisis (mínimo {start_point}).")
         return
 
-    analysis_points = list(range(start_point, total_sorteos, block_size))
-    if total_sorteos not in analysis_points:
-        analysis_points.append(total_sorteos)
+    analysis_points = trajectory_points(total_sorteos, block_size, start_point)
 
     logger.info(f"Se analizarán {len(analysis_points)} puntos de la trayectoria.")
     script_start_time = time.time()
     
-    master_frequencies = {'pares': Counter(), 'tercias': Counter(), 'cuartetos': Counter()}
-    last_processed_index = 0
-    
-    for i, end_index in enumerate(analysis_points):
-        iter_start_time = time.time()
-        
-        df_subset = df_full_historico.head(end_index)
-        df_slice = df_full_historico.iloc[last_processed_index:end_index]
-        last_processed_index = end_index
-        ultimo_concurso = int(df_subset.iloc[-1]['concurso'])
-        
-        logger.info(f"--- Procesando Bloque {i+1}/{len(analysis_points)} (hasta concurso {ultimo_concurso}) ---")
-        
-        # 1. Actualizar frecuencias incrementalmente
-        for _, row in df_slice.iterrows():
-            try:
-                draw = sorted([int(row[col]) for col in result_columns]) # type: ignore
-                master_frequencies['pares'].update(combinations(draw, 2))
-                master_frequencies['tercias'].update(combinations(draw, 3))
-                master_frequencies['cuartetos'].update(combinations(draw, 4))
-            except (ValueError, TypeError): continue
-        
-        # **INICIO DEL CÓDIGO RESTAURADO**
-        # 2. Guardar métricas de CONTEO de frecuencias
-        freq_count_metrics = {
-            "ultimo_concurso_usado": ultimo_concurso,
-            "total_pares_unicos": len(master_frequencies['pares']),
-            "suma_freq_pares": sum(master_frequencies['pares'].values()),
-            "total_tercias_unicas": len(master_frequencies['tercias']),
-            "suma_freq_tercias": sum(master_frequencies['tercias'].values()),
-            "total_cuartetos_unicos": len(master_frequencies['cuartetos']),
-            "suma_freq_cuartetos": sum(master_frequencies['cuartetos'].values()),
-        }
-        save_trajectory_data(db_path, 'frecuencias_trayectoria', config.FRECUENCIAS_TRAYECTORIA_SCHEMA, freq_count_metrics)
-
-        # 3. Guardar métricas de DISTRIBUCIÓN de valores de frecuencias
-        freq_dist_metrics: Dict[str, Any] = {"ultimo_concurso_usado": ultimo_concurso}
-        for level in ['pares', 'tercias', 'cuartetos']:
-            values = list(master_frequencies[level].values()) if master_frequencies[level] else [0]
-            freq_dist_metrics[f'freq_{level}_media'] = float(np.mean(values))
-            freq_dist_metrics[f'freq_{level}_min'] = int(np.min(values))
-            freq_dist_metrics[f'freq_{level}_max'] = int(np.max(values))
-        save_trajectory_data(db_path, 'freq_dist_trayectoria', config.FREQ_DIST_TRAYECTORIA_SCHEMA, freq_dist_metrics)
-
-        # 4. Guardar métricas de AFINIDADES
-        afin_p, afin_t, afin_q = [], [], []
-        for _, row in df_subset.iterrows():
-            combo = sorted([int(row[col]) for col in result_columns]) # type: ignore
-            afin_p.append(_calculate_subsequence_affinity(combo, master_frequencies, 2))
-            afin_t.append(_calculate_subsequence_affinity(combo, master_frequencies, 3))
-            afin_q.append(_calculate_subsequence_affinity(combo, master_frequencies, 4))
-        
-        # Forzamos la conversión a tipos nativos de Python ANTES de guardar
-        affinity_metrics = {
-            "ultimo_concurso_usado": ultimo_concurso,
-            "afin_pares_media": float(np.mean(afin_p)), 
-            "afin_pares_mediana": float(np.median(afin_p)), 
-            "afin_pares_min": int(np.min(afin_p)), 
-            "afin_pares_max": int(np.max(afin_p)),
-            "afin_tercias_media": float(np.mean(afin_t)), 
-            "afin_tercias_mediana": float(np.median(afin_t)), 
-            "afin_tercias_min": int(np.min(afin_t)), 
-            "afin_tercias_max": int(np.max(afin_t)),
-            "afin_cuartetos_media": float(np.mean(afin_q)), 
-            "afin_cuartetos_mediana": float(np.median(afin_q)), 
-            "afin_cuartetos_min": int(np.min(afin_q)), 
-            "afin_cuartetos_max": int(np.max(afin_q))
-        }
-        save_trajectory_data(db_path, 'afinidades_trayectoria', config.AFINIDADES_TRAYECTORIA_SCHEMA, affinity_metrics)
-
-        # 5. Optimizar y guardar UMBRALES
-        freqs_for_optimizer = {k: dict(v) for k, v in master_frequencies.items()}
-        success, _, report = ml_optimizer.run_optimization(game_config, df_subset, freqs_for_optimizer)
-        if success and 'new_thresholds' in report:
-            thresholds = report['new_thresholds']
-            umbrales_metrics = {"ultimo_concurso_usado": ultimo_concurso, "umbral_pares": thresholds.get('pares', 0), "umbral_tercias": thresholds.get('tercias', 0), "umbral_cuartetos": thresholds.get('cuartetos', 0), "cobertura_historica": report.get('cobertura_historica', 0.0), "cobertura_universal_estimada": report.get('cobertura_universal_estimada', 0.0)}
-            save_trajectory_data(db_path, 'umbrales_trayectoria', config.UMBRALES_TRAYECTORIA_SCHEMA, umbrales_metrics)
-        else:
-            logging.error(f"La optimización falló para el bloque hasta el sorteo {ultimo_concurso}.")
-        
-        logger.info(f"Bloque completado en {time.time() - iter_start_time:.2f} segundos.")
+    engine = TimeTravel(df_full_historico, game_config)
+    consumer = TrajectoryConsumer(game_config, analysis_points, optimize_every, warm_start=warm_start, parallel=parallel)
+    replay(engine, [consumer], start=analysis_points[0])
 
     logger.info("=" * 60)
     logger.info(f"GENERACIÓN DE TRAYECTORIA COMPLETA. Tiempo total: {(time.time() - script_start_time) / 60:.2f} minutos.")
@@ -206,6 +331,7 @@ def main(game_id: str, block_size: int = 100):
 if __name__ == "__main__":
     game_id_arg = 'melate_retro'
     block_size_arg = 100
+    optimize_every_arg = 1
 
     if len(sys.argv) > 1:
         game_id_arg = sys.argv[1]
@@ -217,4 +343,16 @@ if __name__ == "__main__":
             print("Error: El tamaño del bloque (segundo argumento) debe ser un número entero.")
             sys.exit(1)
 
-    main(game_id=game_id_arg, block_size=block_size_arg)
\ No newline at end of file
+    if len(sys.argv) > 3:
+        try:
+            optimize_every_arg = int(sys.argv[3])
+        except ValueError:
+            print("Error: La frecuencia de optimización (tercer argumento) debe ser un número entero.")
+            sys.exit(1)
+
+    # Opciones a partir del cuarto argumento: 'parallel' y 'cold' (sin arranque en caliente).
+    options = set(sys.argv[4:])
+    parallel_arg = 'parallel' in options
+    warm_start_arg = 'cold' not in options
+
+    main(game_id=game_id_arg, block_size=block_size_arg, optimize_every=optimize_every_arg, parallel=parallel_arg, warm_start=warm_start_arg)
\ No newline at end of file
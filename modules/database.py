@@ -6,7 +6,7 @@ import logging
 import config
 import json
 import os
-from typing import Dict, Any, List, Tuple, Optional, Literal
+from typing import Dict, Any, Iterable, List, Tuple, Optional, Literal
 
 logger = logging.getLogger(__name__)
 
@@ -14,13 +14,20 @@ TABLE_NAME_HISTORICO = "historico"
 TABLE_NAME_OMEGA = "omega_class"
 TABLE_NAME_REGISTROS = "registros_omega"
 
+TABLE_NAME_OMEGA_STAGING = "omega_class_staging"
+TABLE_NAME_FREQ_LOG = "frecuencias_log"
+TABLE_NAME_SCENARIOS = "threshold_scenarios"
+OMEGA_CLASS_COLUMNS_DEF = "c1 INTEGER, c2 INTEGER, c3 INTEGER, c4 INTEGER, c5 INTEGER, c6 INTEGER, c7 INTEGER, c8 INTEGER, ha_salido INTEGER, afinidad_pares INTEGER, afinidad_tercias INTEGER, afinidad_cuartetos INTEGER, PRIMARY KEY (c1, c2, c3, c4, c5, c6, c7, c8)"
+# Score Fénix y sus estadísticas acumuladas (Welford) para actualizarlo de forma incremental.
+FENIX_COLUMNS = {'fenix_score': 'REAL', 'fenix_count': 'INTEGER', 'fenix_mean': 'REAL', 'fenix_m2': 'REAL', 'fenix_last_concurso': 'INTEGER'}
+
 def _create_tables_if_not_exist(db_path: str):
     conn: Optional[sqlite3.Connection] = None
     try:
         conn = sqlite3.connect(db_path, timeout=10)
         cursor = conn.cursor()
         cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME_REGISTROS} (combinacion TEXT PRIMARY KEY, nombre_completo TEXT NOT NULL, movil TEXT NOT NULL, fecha_registro DATETIME);")
-        cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME_OMEGA} (c1 INTEGER, c2 INTEGER, c3 INTEGER, c4 INTEGER, c5 INTEGER, c6 INTEGER, c7 INTEGER, c8 INTEGER, ha_salido INTEGER, afinidad_pares INTEGER, afinidad_tercias INTEGER, afinidad_cuartetos INTEGER, PRIMARY KEY (c1, c2, c3, c4, c5, c6, c7, c8));")
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME_OMEGA} ({OMEGA_CLASS_COLUMNS_DEF});")
         schemas = {'umbrales_trayectoria': config.UMBRALES_TRAYECTORIA_SCHEMA, 'frecuencias_trayectoria': config.FRECUENCIAS_TRAYECTORIA_SCHEMA, 'afinidades_trayectoria': config.AFINIDADES_TRAYECTORIA_SCHEMA, 'freq_dist_trayectoria': config.FREQ_DIST_TRAYECTORIA_SCHEMA}
         for table_name, schema_dict in schemas.items():
             columns_def = ", ".join([f"{col_name} {col_type}" for col_name, col_type in schema_dict.items()])
@@ -33,7 +40,7 @@ def _create_tables_if_not_exist(db_path: str):
             conn.close()
     
 def add_fenix_score_column(db_path: str):
-    """Añade la columna fenix_score a la tabla omega_class si no existe."""
+    """Añade a la tabla omega_class las columnas de Fénix (score y estadísticas acumuladas) que falten."""
     conn: Optional[sqlite3.Connection] = None
     try:
         conn = sqlite3.connect(db_path, timeout=10)
@@ -41,14 +48,14 @@ def add_fenix_score_column(db_path: str):
         # Verificar si la columna ya existe
         cursor.execute(f"PRAGMA table_info({TABLE_NAME_OMEGA});")
         columns = [info[1] for info in cursor.fetchall()]
-        if 'fenix_score' not in columns:
-            logger.info(f"Añadiendo columna 'fenix_score' a la tabla '{TABLE_NAME_OMEGA}'.")
-            cursor.execute(f"ALTER TABLE {TABLE_NAME_OMEGA} ADD COLUMN fenix_score REAL")
-            conn.commit()
-        else:
-            logger.info("La columna 'fenix_score' ya existe.")
+        missing = [col for col in FENIX_COLUMNS if col not in columns]
+        for col in missing:
+            logger.info(f"Añadiendo columna '{col}' a la tabla '{TABLE_NAME_OMEGA}'.")
+            cursor.execute(f"ALTER TABLE {TABLE_NAME_OMEGA} ADD COLUMN {col} {FENIX_COLUMNS[col]}")
+        if missing: conn.commit()
+        else: logger.info("Las columnas de Fénix ya existen.")
     except Exception as e:
-        logger.error(f"Error añadiendo la columna fenix_score: {e}", exc_info=True)
+        logger.error(f"Error añadiendo las columnas de Fénix: {e}", exc_info=True)
     finally:
         if conn: conn.close()
         
@@ -56,6 +63,7 @@ def update_fenix_scores_in_db(db_path: str, fenix_scores_df: pd.DataFrame, game_
     """
     Actualiza la columna fenix_score para las combinaciones dadas.
     Esta versión es dinámica, se adapta al 'n' de cada juego y asegura la compatibilidad de tipos de datos.
+    Las estadísticas acumuladas (fenix_count, fenix_mean, ...) se guardan también si vienen en el DataFrame.
     """
     if fenix_scores_df.empty:
         return
@@ -73,17 +81,18 @@ def update_fenix_scores_in_db(db_path: str, fenix_scores_df: pd.DataFrame, game_
         cols_to_match = [f'c{i}' for i in range(1, n + 1)]
         where_clause = " AND ".join([f"{col} = ?" for col in cols_to_match])
         
+        set_cols = [col for col in FENIX_COLUMNS if col in fenix_scores_df.columns]
         update_query = f"""
             UPDATE {TABLE_NAME_OMEGA}
-            SET fenix_score = ?
+            SET {', '.join(f'{col} = ?' for col in set_cols)}
             WHERE {where_clause};
         """
         
         # --- LA CORRECCIÓN DEFINITIVA ---
         # Forzamos la conversión de cada número en la combinación a un entero nativo de Python.
         data_to_update = [
-            tuple([row['fenix_score']] + [int(c) for c in row['combination']])
-            for _, row in fenix_scores_df.iterrows()
+            tuple(list(values) + [int(c) for c in combination])
+            for combination, *values in zip(fenix_scores_df['combination'], *(fenix_scores_df[col].tolist() for col in set_cols))
         ]
         # --- FIN DE LA CORRECCIÓN ---
             
@@ -104,6 +113,101 @@ def update_fenix_scores_in_db(db_path: str, fenix_scores_df: pd.DataFrame, game_
     finally:
         if conn: conn.close()
 
+def _create_frequency_log_if_not_exist(conn: sqlite3.Connection):
+    # Un renglón por sorteo contado en las frecuencias; los números nulos marcan un sorteo inválido (delta vacío).
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME_FREQ_LOG} (concurso INTEGER PRIMARY KEY, c1 INTEGER, c2 INTEGER, c3 INTEGER, c4 INTEGER, c5 INTEGER, c6 INTEGER, c7 INTEGER, c8 INTEGER);")
+
+def append_frequency_log(db_path: str, rows: List[tuple]) -> Tuple[bool, str]:
+    """
+    Añade a la bitácora de frecuencias los sorteos (concurso, c1..cn) en una sola transacción.
+    El concurso más alto de la bitácora es la marca de avance de las frecuencias.
+    """
+    if not rows: return True, "No hay sorteos nuevos para la bitácora de frecuencias."
+    n = len(rows[0]) - 1
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=20)
+        _create_frequency_log_if_not_exist(conn)
+        cols = ['concurso'] + [f'c{i}' for i in range(1, n + 1)]
+        with conn:
+            conn.executemany(f"INSERT INTO {TABLE_NAME_FREQ_LOG} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))});", rows)
+        return True, f"Se registraron {len(rows)} sorteos en la bitácora de frecuencias."
+    except Exception as e:
+        logger.error(f"Error al escribir la bitácora de frecuencias en '{os.path.basename(db_path)}': {e}", exc_info=True)
+        return False, f"Error al escribir la bitácora de frecuencias en '{os.path.basename(db_path)}': {e}"
+    finally:
+        if conn: conn.close()
+
+def read_frequency_log(db_path: str, after: int = 0, until: Optional[int] = None) -> pd.DataFrame:
+    """Sorteos de la bitácora de frecuencias con concurso en (after, until], en orden."""
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=10)
+        _create_frequency_log_if_not_exist(conn)
+        conn.commit()
+        until_clause = "AND concurso <= ?" if until is not None else ""
+        params = (after, until) if until is not None else (after,)
+        return pd.read_sql_query(f"SELECT * FROM {TABLE_NAME_FREQ_LOG} WHERE concurso > ? {until_clause} ORDER BY concurso ASC", conn, params=params)
+    except (pd.errors.DatabaseError, sqlite3.Error) as e:
+        logger.warning(f"No se pudo leer la bitácora de frecuencias de '{os.path.basename(db_path)}'. Error: {e}")
+        return pd.DataFrame()
+    finally:
+        if conn: conn.close()
+
+def last_concurso_in_frequency_log(db_path: str) -> int:
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=10)
+        _create_frequency_log_if_not_exist(conn)
+        conn.commit()
+        value = conn.execute(f"SELECT MAX(concurso) FROM {TABLE_NAME_FREQ_LOG}").fetchone()[0]
+        return int(value) if value is not None else 0
+    except sqlite3.Error as e:
+        logger.warning(f"No se pudo leer la bitácora de frecuencias de '{os.path.basename(db_path)}'. Error: {e}")
+        return 0
+    finally:
+        if conn: conn.close()
+
+def _create_scenarios_table_if_not_exist(conn: sqlite3.Connection):
+    # Escenarios de umbrales evaluados por el optimizador, por snapshot de frecuencias (último concurso contado).
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME_SCENARIOS} (snapshot_concurso INTEGER, pares INTEGER, tercias INTEGER, cuartetos INTEGER, cobertura_historica REAL, cobertura_universal REAL, omega_size INTEGER, pareto INTEGER, PRIMARY KEY (snapshot_concurso, pares, tercias, cuartetos));")
+
+def save_threshold_scenarios(db_path: str, snapshot: int, scenarios_df: pd.DataFrame) -> Tuple[bool, str]:
+    """Reemplaza en una sola transacción los escenarios guardados para ese snapshot de frecuencias."""
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=20)
+        _create_scenarios_table_if_not_exist(conn)
+        cols = ['pares', 'tercias', 'cuartetos', 'cobertura_historica', 'cobertura_universal', 'omega_size', 'pareto']
+        rows = [(snapshot,) + tuple(row) for row in scenarios_df[cols].itertuples(index=False)]
+        with conn:
+            conn.execute(f"DELETE FROM {TABLE_NAME_SCENARIOS} WHERE snapshot_concurso = ?;", (snapshot,))
+            conn.executemany(f"INSERT OR REPLACE INTO {TABLE_NAME_SCENARIOS} (snapshot_concurso, {', '.join(cols)}) VALUES ({', '.join('?' * (len(cols) + 1))});", rows)
+        return True, f"Se guardaron {len(rows)} escenarios de umbrales (snapshot {snapshot})."
+    except Exception as e:
+        logger.error(f"Error al guardar los escenarios de umbrales en '{os.path.basename(db_path)}': {e}", exc_info=True)
+        return False, f"Error al guardar los escenarios de umbrales en '{os.path.basename(db_path)}': {e}"
+    finally:
+        if conn: conn.close()
+
+def read_threshold_scenarios(db_path: str, snapshot: Optional[int] = None, pareto_only: bool = False) -> pd.DataFrame:
+    """Escenarios de un snapshot (por defecto el más reciente), de mayor a menor Cobertura Histórica."""
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=10)
+        _create_scenarios_table_if_not_exist(conn)
+        conn.commit()
+        if snapshot is None:
+            snapshot = conn.execute(f"SELECT MAX(snapshot_concurso) FROM {TABLE_NAME_SCENARIOS};").fetchone()[0]
+            if snapshot is None: return pd.DataFrame()
+        pareto_clause = "AND pareto = 1" if pareto_only else ""
+        return pd.read_sql_query(f"SELECT * FROM {TABLE_NAME_SCENARIOS} WHERE snapshot_concurso = ? {pareto_clause} ORDER BY cobertura_historica DESC, cobertura_universal ASC", conn, params=(snapshot,))
+    except (pd.errors.DatabaseError, sqlite3.Error) as e:
+        logger.warning(f"No se pudieron leer los escenarios de umbrales de '{os.path.basename(db_path)}'. Error: {e}")
+        return pd.DataFrame()
+    finally:
+        if conn: conn.close()
+
 def save_historico_to_db(df: pd.DataFrame, db_path: str, mode: Literal['replace', 'append'] = 'replace') -> Tuple[bool, str]:
     if df.empty and mode == 'append': return True, "No hay nuevos registros que guardar."
     conn: Optional[sqlite3.Connection] = None
@@ -121,21 +225,80 @@ def save_historico_to_db(df: pd.DataFrame, db_path: str, mode: Literal['replace'
 
 def save_omega_class(omega_combinations_df: pd.DataFrame, db_path: str) -> Tuple[bool, str]:
     if omega_combinations_df.empty: return False, "No se encontraron combinaciones Omega para guardar."
+    combo_cols = [f'c{i}' for i in range(1, 9) if f'c{i}' in omega_combinations_df.columns]
+    cols = combo_cols + ['ha_salido', 'afinidad_pares', 'afinidad_tercias', 'afinidad_cuartetos']
+    rows = [tuple(None if pd.isna(value) else int(value) for value in row) for row in omega_combinations_df[cols].itertuples(index=False)]
+    return save_omega_class_batches([rows], db_path, len(combo_cols))
+
+def save_omega_class_batches(batches: Iterable[List[tuple]], db_path: str, n: int) -> Tuple[bool, str]:
+    """
+    Escribe la Clase Omega a partir de lotes de filas (c1..cn, ha_salido, af_pares, af_tercias, af_cuartetos).
+    Cada lote se inserta con executemany en una tabla de preparación y, al final, esta reemplaza a
+    'omega_class' con un renombrado dentro de una sola transacción: los lectores ven la clase anterior
+    o la nueva completa, nunca una a medias. Si algo falla, la clase anterior queda intacta.
+    """
     conn: Optional[sqlite3.Connection] = None
+    total_rows = 0
     try:
-        conn = sqlite3.connect(db_path)
-        for i in range(1, 9):
-            if f'c{i}' not in omega_combinations_df.columns: omega_combinations_df[f'c{i}'] = None
-        cols = [f'c{i}' for i in range(1, 9)] + ['ha_salido', 'afinidad_pares', 'afinidad_tercias', 'afinidad_cuartetos']
-        omega_combinations_df = omega_combinations_df[cols]
-        omega_combinations_df.to_sql(TABLE_NAME_OMEGA, conn, if_exists='replace', index=False)
-        return True, f"Pre-generación completada. Se guardaron {len(omega_combinations_df)} combinaciones Omega."
+        # Transacciones explícitas: el módulo sqlite3 no abre transacciones para DDL por sí mismo.
+        conn = sqlite3.connect(db_path, timeout=20, isolation_level=None)
+        cursor = conn.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE_NAME_OMEGA_STAGING};")
+        cursor.execute(f"CREATE TABLE {TABLE_NAME_OMEGA_STAGING} ({OMEGA_CLASS_COLUMNS_DEF});")
+        cols = [f'c{i}' for i in range(1, n + 1)] + ['ha_salido', 'afinidad_pares', 'afinidad_tercias', 'afinidad_cuartetos']
+        insert_query = f"INSERT INTO {TABLE_NAME_OMEGA_STAGING} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))});"
+        for batch in batches:
+            if not batch: continue
+            cursor.execute("BEGIN;")
+            cursor.executemany(insert_query, batch)
+            cursor.execute("COMMIT;")
+            total_rows += len(batch)
+        if total_rows == 0:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE_NAME_OMEGA_STAGING};")
+            return False, "No se encontraron combinaciones Omega para guardar."
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE_NAME_OMEGA};")
+        cursor.execute(f"ALTER TABLE {TABLE_NAME_OMEGA_STAGING} RENAME TO {TABLE_NAME_OMEGA};")
+        cursor.execute("COMMIT;")
+        return True, f"Pre-generación completada. Se guardaron {total_rows} combinaciones Omega."
     except Exception as e:
         logger.error(f"Error al guardar la Clase Omega en '{os.path.basename(db_path)}': {e}", exc_info=True)
+        if conn:
+            try:
+                if conn.in_transaction: conn.execute("ROLLBACK;")
+                conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME_OMEGA_STAGING};")
+            except sqlite3.Error:
+                pass
         return False, f"Error al guardar la Clase Omega en '{os.path.basename(db_path)}': {e}"
     finally:
         if conn: conn.close()
 
+def apply_omega_class_delta(db_path: str, n: int, deleted: List[tuple], updated: List[tuple], inserted: List[tuple]) -> Tuple[bool, str]:
+    """
+    Aplica en una sola transacción una actualización parcial de la Clase Omega:
+    'deleted' son combinaciones (c1..cn) que salen, 'updated' filas (ha_salido, af_pares, af_tercias,
+    af_cuartetos, c1..cn) que permanecen con valores nuevos e 'inserted' filas completas que entran.
+    """
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=20, isolation_level=None)
+        cursor = conn.cursor()
+        combo_cols = [f'c{i}' for i in range(1, n + 1)]
+        where_clause = " AND ".join([f"{col} = ?" for col in combo_cols])
+        cols = combo_cols + ['ha_salido', 'afinidad_pares', 'afinidad_tercias', 'afinidad_cuartetos']
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.executemany(f"DELETE FROM {TABLE_NAME_OMEGA} WHERE {where_clause};", deleted)
+        cursor.executemany(f"UPDATE {TABLE_NAME_OMEGA} SET ha_salido = ?, afinidad_pares = ?, afinidad_tercias = ?, afinidad_cuartetos = ? WHERE {where_clause};", updated)
+        cursor.executemany(f"INSERT INTO {TABLE_NAME_OMEGA} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))});", inserted)
+        cursor.execute("COMMIT;")
+        return True, f"Actualización incremental completada: {len(inserted)} combinaciones Omega nuevas, {len(deleted)} eliminadas y {len(updated)} actualizadas."
+    except Exception as e:
+        logger.error(f"Error al actualizar la Clase Omega en '{os.path.basename(db_path)}': {e}", exc_info=True)
+        if conn and conn.in_transaction: conn.rollback()
+        return False, f"Error al actualizar la Clase Omega en '{os.path.basename(db_path)}': {e}"
+    finally:
+        if conn: conn.close()
+
 def register_omega_combination(combinacion: list, nombre: str, movil: str, db_path: str) -> Tuple[bool, str]:
     combo_str = "-".join(map(str, sorted(combinacion)))
     conn: Optional[sqlite3.Connection] = None
@@ -298,7 +461,7 @@ def read_omega_score_trajectory(db_path: str) -> pd.DataFrame:
     return _read_df_from_db("SELECT * FROM omega_score_trajectory ORDER BY concurso ASC", db_path)
 
 def read_golden_trajectory(db_path: str) -> pd.DataFrame:
-    """Lee la tabla con la trayectoria de la Línea Dorada."""
+    """Lee la tabla con la trayectoria de la Línea Dorada (una línea por percentil de élite)."""
     return _read_df_from_db("SELECT * FROM golden_trajectory ORDER BY concurso ASC", db_path)
 
 def read_omega_class_with_fenix(db_path: str, only_unplayed: bool = True) -> pd.DataFrame:
@@ -0,0 +1,352 @@
+# frequency_table.py
+
+import json
+import logging
+import os
+import struct
+import tempfile
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEVEL_NAMES: Dict[int, str] = {2: "pares", 3: "tercias", 4: "cuartetos"}
+NAME_LEVELS: Dict[str, int] = {name: level for level, name in LEVEL_NAMES.items()}
+
+# --- RANKING COMBINATORIO (COLEX) ---
+# Una subsecuencia ordenada (a1 < a2 < ... < as) con números en [1, k] se mapea a
+# un índice único en [0, C(k, s)) mediante rank = sum(C(a_i - 1, i)). Así cada
+# nivel de afinidad cabe en un arreglo denso de C(k, s) posiciones.
+
+@lru_cache(maxsize=None)
+def binomial_table(k: int, max_size: int = 4) -> np.ndarray:
+    """Tabla de solo lectura con C(v, i) para v en [0, k] e i en [0, max_size]."""
+    table = np.array([[comb(v, i) for i in range(max_size + 1)] for v in range(k + 1)], dtype=np.int64)
+    table.setflags(write=False)
+    return table
+
+@lru_cache(maxsize=None)
+def subsequence_positions(n: int, size: int) -> np.ndarray:
+    """Índices de columna (C(n, size), size) de las subsecuencias de una combinación de n números."""
+    positions = np.array(list(combinations(range(n), size)), dtype=np.intp).reshape(-1, size)
+    positions.setflags(write=False)
+    return positions
+
+def rank_subsequences(subs: np.ndarray, k: int) -> np.ndarray:
+    """Rango colex de subsecuencias ordenadas; la última dimensión de 'subs' es su tamaño."""
+    size = subs.shape[-1]
+    binom = binomial_table(k, max(size, 4))
+    ranks = np.zeros(subs.shape[:-1], dtype=np.int64)
+    for i in range(size):
+        ranks += binom[subs[..., i] - 1, i + 1]
+    return ranks
+
+@lru_cache(maxsize=None)
+def _rank_columns(k: int, size: int) -> Tuple[np.ndarray, ...]:
+    """Columnas C(v, i + 1) para v en [0, k), en el entero más pequeño que admite los rangos del nivel."""
+    dtype = np.int32 if comb(k, size) < 2**31 else np.int64
+    binom = binomial_table(k, max(size, 4))
+    columns = tuple(np.ascontiguousarray(binom[:k, i + 1], dtype=dtype) for i in range(size))
+    for column in columns: column.setflags(write=False)
+    return columns
+
+def subsequence_ranks(draws: np.ndarray, size: int, k: int) -> np.ndarray:
+    """Para una matriz (m, n) de combinaciones devuelve los rangos (m, C(n, size)) de sus subsecuencias."""
+    draws = np.asarray(draws)
+    draws = np.sort(draws.reshape(-1, draws.shape[-1]), axis=1)
+    positions = subsequence_positions(draws.shape[1], size)
+    index = draws.astype(np.intp) - 1
+    # La contribución C(a - 1, i + 1) de cada número se calcula una vez por fila
+    # y después solo se seleccionan columnas para cada subsecuencia.
+    columns = _rank_columns(k, size)
+    ranks = np.zeros((len(draws), len(positions)), dtype=columns[0].dtype)
+    for i, column in enumerate(columns):
+        ranks += np.take(column[index], positions[:, i], axis=1)
+    return ranks
+
+@lru_cache(maxsize=None)
+def all_subsequences(k: int, size: int) -> np.ndarray:
+    """Todas las subsecuencias de tamaño 'size' sobre [1, k], ordenadas por su rango colex."""
+    lex = np.array(list(combinations(range(1, k + 1), size)), dtype=np.int64).reshape(-1, size)
+    ordered = np.empty_like(lex)
+    ordered[rank_subsequences(lex, k)] = lex
+    ordered.setflags(write=False)
+    return ordered
+
+
+class FrequencyTable:
+    """
+    Frecuencias históricas de pares, tercias y cuartetos almacenadas en arreglos
+    densos de enteros indexados por el rango colex de cada subsecuencia.
+    Se accede a cada nivel por tamaño o por nombre: table[2] o table['pares'].
+    """
+
+    def __init__(self, k: int, counts: Optional[Dict[int, np.ndarray]] = None, levels: Iterable[int] = (2, 3, 4)):
+        self.k = k
+        self.tables: Dict[int, np.ndarray] = {}
+        for level in sorted(counts.keys() if counts is not None else levels):
+            expected = comb(k, level)
+            if counts is not None:
+                array = np.asarray(counts[level], dtype=np.int64)
+                if array.shape != (expected,):
+                    raise ValueError(f"El nivel {level} requiere {expected} posiciones, se recibieron {array.shape}.")
+            else:
+                array = np.zeros(expected, dtype=np.int64)
+            self.tables[level] = array
+
+    @property
+    def levels(self) -> tuple:
+        return tuple(self.tables.keys())
+
+    @staticmethod
+    def _level(key: Union[int, str]) -> int:
+        return NAME_LEVELS[key] if isinstance(key, str) else int(key)
+
+    def __getitem__(self, key: Union[int, str]) -> np.ndarray:
+        return self.tables[self._level(key)]
+
+    def __contains__(self, key: Union[int, str]) -> bool:
+        return self._level(key) in self.tables
+
+    def __repr__(self) -> str:
+        sizes = ", ".join(f"{LEVEL_NAMES.get(level, level)}={len(array)}" for level, array in self.tables.items())
+        return f"FrequencyTable(k={self.k}, {sizes})"
+
+    @classmethod
+    def from_draws(cls, draws: np.ndarray, k: int, levels: Iterable[int] = (2, 3, 4)) -> "FrequencyTable":
+        """Construye la tabla contando las subsecuencias de una matriz (m, n) de sorteos."""
+        table = cls(k, levels=levels)
+        table.update(draws)
+        return table
+
+    @classmethod
+    def from_dicts(cls, freqs: Dict[str, Dict[tuple, int]], k: int) -> "FrequencyTable":
+        """Convierte el formato anterior ({'pares': {(1, 5): 12, ...}, ...}) a una tabla densa."""
+        counts: Dict[int, np.ndarray] = {}
+        for name, freq_map in freqs.items():
+            level = NAME_LEVELS[name]
+            array = np.zeros(comb(k, level), dtype=np.int64)
+            if freq_map:
+                subs = np.array([sorted(sub) for sub in freq_map.keys()], dtype=np.int64)
+                array[rank_subsequences(subs, k)] = np.fromiter(freq_map.values(), dtype=np.int64, count=len(freq_map))
+            counts[level] = array
+        return cls(k, counts)
+
+    def freeze(self) -> "FrequencyTable":
+        """Marca los arreglos como de solo lectura (p. ej. para tablas compartidas en caché)."""
+        for array in self.tables.values(): array.setflags(write=False)
+        return self
+
+    def copy(self) -> "FrequencyTable":
+        return FrequencyTable(self.k, {level: array.copy() for level, array in self.tables.items()})
+
+    def update(self, draws: np.ndarray) -> None:
+        """Suma al conteo las subsecuencias de uno o varios sorteos (vector de n o matriz (m, n))."""
+        draws = np.asarray(draws, dtype=np.int64)
+        if draws.size == 0: return
+        for level, array in self.tables.items():
+            ranks = subsequence_ranks(draws, level, self.k)
+            array += np.bincount(ranks.ravel(), minlength=len(array))
+
+    def remove(self, draws: np.ndarray) -> None:
+        """Inversa de update: descuenta las subsecuencias de uno o varios sorteos."""
+        draws = np.asarray(draws, dtype=np.int64)
+        if draws.size == 0: return
+        for level, array in self.tables.items():
+            ranks = subsequence_ranks(draws, level, self.k)
+            array -= np.bincount(ranks.ravel(), minlength=len(array))
+
+    def get(self, subsequence: Sequence[int], default: int = 0) -> int:
+        """Frecuencia de una subsecuencia concreta (cualquier orden); 'default' si está fuera del universo."""
+        sub = sorted(int(x) for x in subsequence)
+        level = len(sub)
+        if level not in self.tables or len(set(sub)) != level or sub[0] < 1 or sub[-1] > self.k: return default
+        return int(self.tables[level][rank_subsequences(np.array(sub, dtype=np.int64), self.k)])
+
+    def affinity(self, combination: Sequence[int], size: int) -> int:
+        """Suma de frecuencias de todas las subsecuencias de tamaño 'size' de una combinación."""
+        if size not in self.tables: return 0
+        combo = np.sort(np.asarray(combination, dtype=np.int64))
+        subs = combo[subsequence_positions(len(combo), size)]
+        # Los números fuera de [1, k] no tienen frecuencia registrada, igual que en el formato de diccionarios.
+        valid = ((subs >= 1) & (subs <= self.k)).all(axis=1)
+        return int(self.tables[size][rank_subsequences(subs[valid], self.k)].sum())
+
+    def affinities(self, draws: np.ndarray, size: int) -> np.ndarray:
+        """
+        Afinidades de nivel 'size' para una matriz (m, n) de combinaciones. Las subsecuencias con números
+        fuera de [1, k] no tienen frecuencia registrada y suman 0, como en 'affinity'.
+        """
+        draws = np.asarray(draws, dtype=np.int64)
+        if size not in self.tables or draws.size == 0: return np.zeros(len(draws), dtype=np.int64)
+        if draws.min() >= 1 and draws.max() <= self.k:
+            return self.tables[size][subsequence_ranks(draws, size, self.k)].sum(axis=1)
+        subs = np.sort(draws, axis=1)[:, subsequence_positions(draws.shape[1], size)]
+        valid = (subs[..., 0] >= 1) & (subs[..., -1] <= self.k)
+        # Las subsecuencias inválidas se sustituyen por (1, ..., size) solo para poder indexar; se descartan después.
+        ranks = rank_subsequences(np.where(valid[..., None], subs, np.arange(1, size + 1)), self.k)
+        return np.where(valid, self.tables[size][ranks], 0).sum(axis=1)
+
+    def to_dicts(self) -> Dict[str, Dict[tuple, int]]:
+        """Formato de diccionarios con claves tupla, solo para las subsecuencias observadas."""
+        result: Dict[str, Dict[tuple, int]] = {}
+        for level, array in self.tables.items():
+            subs = all_subsequences(self.k, level)
+            observed = np.flatnonzero(array)
+            result[LEVEL_NAMES[level]] = {tuple(int(x) for x in subs[i]): int(array[i]) for i in observed}
+        return result
+
+
+# --- ENUMERACIÓN DEL UNIVERSO POR BLOQUES ---
+# El universo C(k, n) se recorre en orden lexicográfico (el mismo que
+# itertools.combinations) por rangos de índices. Cada bloque se obtiene
+# des-rankeando sus índices con una búsqueda por posición, así cualquier
+# rango [start, stop) puede procesarse de forma independiente.
+
+@lru_cache(maxsize=None)
+def _lex_offsets(k: int, remaining: int) -> np.ndarray:
+    """offsets[v] = número de combinaciones que empiezan (en una posición dada) con un valor menor que v."""
+    offsets = np.zeros(k + 2, dtype=np.int64)
+    offsets[0] = -1
+    for v in range(1, k + 1):
+        offsets[v + 1] = offsets[v] + comb(k - v, remaining)
+    offsets.setflags(write=False)
+    return offsets
+
+def unrank_combinations(ranks: np.ndarray, n: int, k: int) -> np.ndarray:
+    """Combinaciones (m, n) en uint8 correspondientes a índices lexicográficos en [0, C(k, n))."""
+    residual = np.asarray(ranks, dtype=np.int64).copy()
+    out = np.empty((len(residual), n), dtype=np.uint8)
+    prev = np.zeros(len(residual), dtype=np.int64)
+    for i in range(n):
+        offsets = _lex_offsets(k, n - i - 1)
+        # Los índices relativos al primer valor permitido (prev + 1) se trasladan a la escala absoluta.
+        target = residual + offsets[prev + 1]
+        value = np.searchsorted(offsets, target, side='right') - 1
+        residual = target - offsets[value]
+        out[:, i] = value
+        prev = value
+    return out
+
+def rank_combinations(combos: np.ndarray, k: int) -> np.ndarray:
+    """Índice lexicográfico de cada fila ordenada de una matriz (m, n) de combinaciones."""
+    combos = np.sort(np.asarray(combos, dtype=np.int64).reshape(-1, np.shape(combos)[-1]), axis=1)
+    n = combos.shape[1]
+    ranks = np.zeros(len(combos), dtype=np.int64)
+    prev = np.zeros(len(combos), dtype=np.int64)
+    for i in range(n):
+        offsets = _lex_offsets(k, n - i - 1)
+        ranks += offsets[combos[:, i]] - offsets[prev + 1]
+        prev = combos[:, i]
+    return ranks
+
+def iter_combination_blocks(n: int, k: int, start: int = 0, stop: Optional[int] = None, block_size: int = 250_000) -> Iterator[Tuple[int, np.ndarray]]:
+    """Genera (índice_inicial, bloque uint8 (m, n)) para el rango [start, stop) del universo."""
+    stop = comb(k, n) if stop is None else min(stop, comb(k, n))
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        yield block_start, unrank_combinations(np.arange(block_start, block_stop, dtype=np.int64), n, k)
+
+def neighbourhood_ranks(draws: np.ndarray, n: int, k: int, min_shared: int = 2) -> np.ndarray:
+    """
+    Índices lexicográficos (ordenados y sin repetir) de las combinaciones que comparten al
+    menos 'min_shared' números con alguno de los sorteos (m, n). Se construyen eligiendo j
+    números del sorteo y n - j del resto, sin recorrer el universo.
+    """
+    draws = np.atleast_2d(np.asarray(draws, dtype=np.int64))
+    universe = np.arange(1, k + 1)
+    # La unión de las vecindades se marca sobre el universo: más barato que ordenar y deduplicar.
+    selected = np.zeros(comb(k, n), dtype=bool)
+    for draw in draws:
+        draw = np.unique(draw)
+        rest = np.setdiff1d(universe, draw)
+        for j in range(min_shared, min(len(draw), n) + 1):
+            inside = np.array(list(combinations(draw.tolist(), j)), dtype=np.int64).reshape(comb(len(draw), j), j)
+            outside = np.array(list(combinations(rest.tolist(), n - j)), dtype=np.int64).reshape(comb(len(rest), n - j), n - j)
+            if len(inside) == 0 or len(outside) == 0: continue
+            block = np.concatenate([np.repeat(inside, len(outside), axis=0), np.tile(outside, (len(inside), 1))], axis=1)
+            selected[rank_combinations(block, k)] = True
+    return np.flatnonzero(selected)
+
+def split_rank_ranges(total: int, parts: int) -> List[Tuple[int, int]]:
+    """Divide [0, total) en 'parts' rangos contiguos de tamaño similar."""
+    parts = max(1, min(parts, total)) if total else 1
+    bounds = np.linspace(0, total, parts + 1, dtype=np.int64)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+# --- FORMATO BINARIO DE FRECUENCIAS ---
+# Cabecera little-endian: magic, versión, k, número de niveles, último concurso
+# procesado y la lista de niveles. Tras la cabecera (alineada a 64 bytes) van
+# los conteos int64 de cada nivel, concatenados en orden de nivel.
+
+FREQ_FILE_MAGIC = b"ZLFQ"
+FREQ_FILE_VERSION = 1
+_HEADER_STRUCT = struct.Struct("<4sIIIq")
+_HEADER_ALIGN = 64
+
+def _header_size(n_levels: int) -> int:
+    raw = _HEADER_STRUCT.size + 4 * n_levels
+    return (raw + _HEADER_ALIGN - 1) // _HEADER_ALIGN * _HEADER_ALIGN
+
+def save_frequency_file(table: FrequencyTable, path: str, last_concurso: int = 0) -> None:
+    """Escribe la tabla en formato binario de forma atómica (archivo temporal + os.replace)."""
+    levels = table.levels
+    header = _HEADER_STRUCT.pack(FREQ_FILE_MAGIC, FREQ_FILE_VERSION, table.k, len(levels), int(last_concurso))
+    header += struct.pack(f"<{len(levels)}I", *levels)
+    header = header.ljust(_header_size(len(levels)), b"\0")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".freq_", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for level in levels:
+                f.write(np.ascontiguousarray(table[level], dtype="<i8").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def read_frequency_header(path: str) -> Dict[str, Any]:
+    """Lee solo la cabecera del archivo binario (versión, k, niveles y último concurso)."""
+    with open(path, "rb") as f:
+        raw = f.read(_HEADER_STRUCT.size)
+        if len(raw) < _HEADER_STRUCT.size: raise ValueError(f"Archivo de frecuencias truncado: {path}")
+        magic, version, k, n_levels, last_concurso = _HEADER_STRUCT.unpack(raw)
+        if magic != FREQ_FILE_MAGIC: raise ValueError(f"'{path}' no es un archivo de frecuencias válido.")
+        if version != FREQ_FILE_VERSION: raise ValueError(f"Versión de archivo de frecuencias no soportada: {version}")
+        levels = struct.unpack(f"<{n_levels}I", f.read(4 * n_levels))
+    return {"version": version, "k": k, "levels": levels, "last_concurso": last_concurso, "data_offset": _header_size(n_levels)}
+
+def load_frequency_file(path: str, mmap: bool = False) -> FrequencyTable:
+    """
+    Carga una tabla desde el formato binario. Con mmap=True los arreglos son vistas
+    de solo lectura sobre el archivo, útiles para compartirlos entre procesos.
+    """
+    header = read_frequency_header(path)
+    k, levels = header["k"], header["levels"]
+    total = sum(comb(k, level) for level in levels)
+    if mmap:
+        data = np.memmap(path, dtype="<i8", mode="r", offset=header["data_offset"], shape=(total,))
+    else:
+        data = np.fromfile(path, dtype="<i8", count=total, offset=header["data_offset"])
+    if data.shape != (total,): raise ValueError(f"Archivo de frecuencias truncado: {path}")
+    counts, start = {}, 0
+    for level in levels:
+        size = comb(k, level)
+        counts[level] = data[start:start + size]
+        start += size
+    return FrequencyTable(k, counts)
+
+def load_legacy_json(path: str, k: int) -> FrequencyTable:
+    """Lector del formato JSON anterior ({"FREQ_PARES": {"(1, 5)": 12, ...}, ...})."""
+    with open(path, "r", encoding="utf-8") as f: data = json.load(f)
+    parse = lambda key: tuple(int(x) for x in key.strip("()").split(",") if x.strip())
+    freqs = {name: {parse(key): value for key, value in data.get(f"FREQ_{name.upper()}", {}).items()} for name in LEVEL_NAMES.values()}
+    return FrequencyTable.from_dicts(freqs, k)
@@ -0,0 +1,71 @@
+# game_cache.py
+
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Caché de proceso compartida por todos los callbacks: (game_id, clave) -> (firma, valor).
+# Un valor se reutiliza mientras la firma de su origen (archivo o base de datos) no cambie.
+_entries: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+_db_watchers: Dict[str, Tuple[int, sqlite3.Connection]] = {}
+_lock = threading.RLock()
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """Firma (inodo, mtime, tamaño) de un archivo, o None si no existe."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def db_signature(db_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Firma de una base de datos SQLite basada en 'PRAGMA data_version', que cambia
+    cada vez que otra conexión confirma cambios. Se mantiene una conexión de solo
+    lectura por archivo y se reabre si el archivo fue reemplazado.
+    """
+    try:
+        inode = os.stat(db_path).st_ino
+    except OSError:
+        return None
+    with _lock:
+        watcher = _db_watchers.get(db_path)
+        if watcher is None or watcher[0] != inode:
+            if watcher is not None: watcher[1].close()
+            try:
+                conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, timeout=10)
+            except sqlite3.Error as e:
+                logger.warning(f"No se pudo vigilar la base de datos '{os.path.basename(db_path)}': {e}")
+                return None
+            watcher = (inode, conn)
+            _db_watchers[db_path] = watcher
+        try:
+            data_version = watcher[1].execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return None
+    return (inode, data_version)
+
+def get_or_load(game_id: str, key: str, signature: Any, loader: Callable[[], Any]) -> Any:
+    """Devuelve el valor en caché si la firma coincide; si no, lo recarga. Los valores None no se guardan."""
+    with _lock:
+        entry = _entries.get((game_id, key))
+        if entry is not None and signature is not None and entry[0] == signature:
+            return entry[1]
+    value = loader()
+    with _lock:
+        if value is not None and signature is not None:
+            _entries[(game_id, key)] = (signature, value)
+        else:
+            _entries.pop((game_id, key), None)
+    return value
+
+def invalidate(game_id: Optional[str] = None, key: Optional[str] = None):
+    """Descarta entradas de la caché (todas, las de un juego o una en concreto)."""
+    with _lock:
+        for entry_key in list(_entries):
+            if (game_id is None or entry_key[0] == game_id) and (key is None or entry_key[1] == key):
+                del _entries[entry_key]
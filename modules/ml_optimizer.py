@@ -3,15 +3,20 @@
 import pandas as pd
 import numpy as np
 import multiprocessing as mp
-from itertools import combinations, product
 import logging
-import time
 import json
-from typing import Tuple, Dict, Any, Optional
+import time
+from functools import partial
+from math import comb
+from typing import Tuple, Dict, Any, List, Optional, Callable, Iterator
 import warnings
 
-# Se importa solo la función de ayuda de omega_logic
-from modules.omega_logic import _calculate_subsequence_affinity
+# Se importan solo las funciones de ayuda de omega_logic
+from modules import database as db
+from modules.omega_logic import calculate_batch_affinities, get_draws_matrix, score_omega_block
+from modules.frequency_table import FrequencyTable, LEVEL_NAMES, iter_combination_blocks, split_rank_ranges
+from modules.omega_search import iter_omega_branch_and_bound, top_suffix_sums
+from utils.parallel_utils import SharedArrayPool, TaskCancelled, get_shared_array
 
 warnings.filterwarnings('ignore') # Se mantiene para suprimir advertencias de numpy/pandas
 
@@ -31,81 +36,479 @@ def _save_thresholds_to_json(new_thresholds: Dict[str, int], game_config: Dict[s
 
 def _estimate_cu_monte_carlo(
     thresholds: Dict[str, int], 
-    freqs_data: Dict[str, Dict[tuple, int]], 
+    freqs_data: FrequencyTable, 
     game_config: Dict[str, Any],
     sample_size: int = 3000
 ) -> float:
     """Estima la Cobertura Universal para un juego específico mediante Monte Carlo."""
     try:
-        np.random.seed(42)
-        omega_count = 0
+        # Generador propio con la misma semilla: no altera el estado global que usan otros análisis del recorrido.
+        rng = np.random.RandomState(42)
         n, k = game_config['n'], game_config['k']
         
-        freq_pares = freqs_data.get('pares', {})
-        freq_tercias = freqs_data.get('tercias', {})
-        freq_cuartetos = freqs_data.get('cuartetos', {})
+        sample = np.array([sorted(rng.choice(range(1, k + 1), n, replace=False)) for _ in range(sample_size)], dtype=np.int64)
         
-        for _ in range(sample_size):
-            combo = tuple(sorted(np.random.choice(range(1, k + 1), n, replace=False)))
-            
-            afinidad_pares = sum(freq_pares.get(par, 0) for par in combinations(combo, 2))
-            afinidad_tercias = sum(freq_tercias.get(tercia, 0) for tercia in combinations(combo, 3))
-            afinidad_cuartetos = sum(freq_cuartetos.get(cuarteto, 0) for cuarteto in combinations(combo, 4))
-            
-            if (afinidad_pares >= thresholds['pares'] and 
-                afinidad_tercias >= thresholds['tercias'] and 
-                afinidad_cuartetos >= thresholds['cuartetos']):
-                omega_count += 1
-        return float(omega_count / sample_size)
-    except Exception:
-        return 1.0 # Devuelve el peor caso si falla
-
-def _worker_evaluate_scenario(args: Tuple) -> Optional[Dict[str, Any]]:
-    """Función de trabajo para un proceso del pool de multiprocessing."""
-    try:
-        percentiles, afinidades_hist, freqs_tuple_keys, game_config = args
-        p_pares, p_tercias, p_cuartetos = percentiles
+        afinidad_pares = freqs_data.affinities(sample, 2)
+        afinidad_tercias = freqs_data.affinities(sample, 3)
+        afinidad_cuartetos = freqs_data.affinities(sample, 4)
         
-        # Calcula los umbrales para este escenario
-        umbral_pares = int(np.percentile(afinidades_hist['pares'], p_pares * 100))
-        umbral_tercias = int(np.percentile(afinidades_hist['tercias'], p_tercias * 100))
-        umbral_cuartetos = int(np.percentile(afinidades_hist['cuartetos'], p_cuartetos * 100))
-        
-        thresholds_scenario = {'pares': umbral_pares, 'tercias': umbral_tercias, 'cuartetos': umbral_cuartetos}
-
-        # Calcula la Cobertura Histórica
         mask_omega = (
-            (np.array(afinidades_hist['pares']) >= umbral_pares) &
-            (np.array(afinidades_hist['tercias']) >= umbral_tercias) &
-            (np.array(afinidades_hist['cuartetos']) >= umbral_cuartetos)
+            (afinidad_pares >= thresholds['pares']) & 
+            (afinidad_tercias >= thresholds['tercias']) & 
+            (afinidad_cuartetos >= thresholds['cuartetos'])
         )
-        cobertura_historica = float(np.mean(mask_omega))
-        
-        # Filtro no negociable: si no cubre al menos el 95% del histórico, se descarta
-        if cobertura_historica < 0.95:
-            return None
-            
-        # Estima la Cobertura Universal
-        cobertura_universal_estimada = _estimate_cu_monte_carlo(
-            thresholds_scenario, freqs_tuple_keys, game_config
-        )
-        
-        return {
-            'umbrales': thresholds_scenario,
-            'cobertura_historica': cobertura_historica,
-            'cobertura_universal_estimada': cobertura_universal_estimada
-        }
+        return float(np.count_nonzero(mask_omega) / sample_size)
     except Exception:
+        return 1.0 # Devuelve el peor caso si falla
+
+# --- COBERTURA UNIVERSAL EXACTA ---
+# Los umbrales de cada escenario salen de 17 percentiles por nivel, así que solo hay un puñado de
+# valores posibles por eje. El universo se resume una vez en un histograma 3-D cuyos bordes son esos
+# valores; con sumas acumuladas desde el final, cada escenario se responde con una sola consulta:
+# el número exacto de combinaciones con las tres afinidades por encima de sus umbrales.
+
+def _grid_thresholds(afinidades_hist: Dict[str, np.ndarray], percentiles_range: np.ndarray) -> Dict[str, np.ndarray]:
+    """Umbral de cada percentil de la rejilla, por nivel (una sola llamada a np.percentile por nivel)."""
+    return {name: np.percentile(afinidades_hist[name], percentiles_range * 100).astype(np.int64) for name in LEVEL_NAMES.values()}
+
+def _coverage_edges(grid_thresholds: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Valores de umbral posibles (ordenados, sin repetir) por nivel para la rejilla de percentiles."""
+    return {name: np.unique(values) for name, values in grid_thresholds.items()}
+
+def _interval_histogram(edges: List[np.ndarray], affinities: Tuple[np.ndarray, ...]) -> np.ndarray:
+    """Histograma N-D de afinidades por intervalos entre bordes (intervalo = cuántos bordes son <= afinidad)."""
+    shape = tuple(len(e) + 1 for e in edges)
+    # 'afinidad >= borde i' equivale a intervalo > i.
+    bins = [np.searchsorted(e, values, side='right') for e, values in zip(edges, affinities)]
+    return np.bincount(np.ravel_multi_index(bins, shape), minlength=int(np.prod(shape))).reshape(shape)
+
+def _dominance_table(histogram: np.ndarray) -> np.ndarray:
+    """Suma acumulada desde el final en cada eje: table[i, j, ...] = elementos en intervalos >= (i, j, ...)."""
+    table = histogram
+    for axis in range(histogram.ndim):
+        table = np.flip(np.flip(table, axis).cumsum(axis=axis), axis)
+    return table
+
+# Combinaciones por tarea al recorrer el universo: da la granularidad del avance y de la cancelación.
+UNIVERSE_TASK_SIZE = 200_000
+
+# Tope de procesos de los pools internos. Quien ya reparte optimizaciones entre procesos
+# (p. ej. la trayectoria en paralelo) lo reduce en cada worker para no sobresuscribir núcleos.
+MAX_PROCESSES = 8
+
+def _process_count() -> int:
+    return max(1, min(mp.cpu_count(), MAX_PROCESSES))
+
+def _map_universe(
+    worker: Callable,
+    shared_arrays: Dict[str, np.ndarray],
+    game_config: Dict[str, Any],
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None
+) -> Iterator[Any]:
+    """
+    Reparte el universo en rangos contiguos entre procesos y produce los resultados en orden. Tras cada
+    rango reporta las combinaciones recorridas y consulta 'should_cancel'; si pide cancelar, lanza
+    TaskCancelled y el pool se termina al salir del bloque 'with'.
+    """
+    n, k = game_config['n'], game_config['k']
+    total = comb(k, n)
+    n_processes = _process_count()
+    tasks = split_rank_ranges(total, max(n_processes * 4, -(-total // UNIVERSE_TASK_SIZE)))
+    with SharedArrayPool(shared_arrays, processes=n_processes) as pool:
+        for (_, stop), result in zip(tasks, pool.imap(partial(worker, n=n, k=k), tasks)):
+            if should_cancel and should_cancel():
+                raise TaskCancelled("Optimización cancelada por el usuario.")
+            if progress: progress(stop, total)
+            yield result
+
+def _worker_universe_histogram(rank_range: Tuple[int, int], n: int, k: int) -> np.ndarray:
+    """Histograma 3-D de las afinidades del rango [start, stop) del universo, por intervalos entre bordes."""
+    freqs = FrequencyTable(k, {level: get_shared_array(f'freq_{level}') for level in LEVEL_NAMES})
+    edges = [get_shared_array(f'bordes_{name}') for name in LEVEL_NAMES.values()]
+    histogram = np.zeros(tuple(len(e) + 1 for e in edges), dtype=np.int64)
+    # Ninguna consulta usa el intervalo 0 (por debajo del umbral más bajo), así que esas combinaciones
+    # se descartan nivel a nivel sin calcular el resto de sus afinidades.
+    lowest = {name: int(e[0]) for name, e in zip(LEVEL_NAMES.values(), edges)}
+    start, stop = rank_range
+    for _, block in iter_combination_blocks(n, k, start, stop):
+        _, af_p, af_t, af_q = score_omega_block(block, freqs, lowest)
+        histogram += _interval_histogram(edges, (af_p, af_t, af_q))
+    return histogram
+
+def compute_universe_coverage(
+    freqs: FrequencyTable,
+    game_config: Dict[str, Any],
+    edges: Dict[str, np.ndarray],
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None
+) -> np.ndarray:
+    """
+    Tabla de dominancia: coverage[i, j, l] = combinaciones del universo con af_pares >= bordes_pares[i - 1],
+    af_tercias >= bordes_tercias[j - 1] y af_cuartetos >= bordes_cuartetos[l - 1], para i, j, l >= 1.
+    """
+    shared_arrays = {f'freq_{level}': freqs[level] for level in LEVEL_NAMES}
+    shared_arrays.update({f'bordes_{name}': values for name, values in edges.items()})
+    histogram = sum(_map_universe(_worker_universe_histogram, shared_arrays, game_config, progress, should_cancel))
+    return _dominance_table(histogram)
+
+def _coverage_index(thresholds: np.ndarray, edges: Dict[str, np.ndarray]) -> Tuple[np.ndarray, ...]:
+    """Índices en la tabla de dominancia para una matriz (g, 3) de umbrales que están entre los bordes."""
+    return tuple(np.searchsorted(edges[name], thresholds[:, column], side='left') + 1 for column, name in enumerate(LEVEL_NAMES.values()))
+
+def evaluate_percentile_grid(afinidades_hist: Dict[str, np.ndarray], percentiles_range: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Evalúa toda la rejilla de percentiles (en el orden de product(percentiles_range, repeat=3)) en una pasada:
+    devuelve la matriz (g, 3) de umbrales, la Cobertura Histórica de cada escenario y los bordes por nivel.
+    """
+    grid = _grid_thresholds(afinidades_hist, percentiles_range)
+    edges = _coverage_edges(grid)
+    names = list(LEVEL_NAMES.values())
+    thresholds = np.stack([axis.ravel() for axis in np.meshgrid(*(grid[name] for name in names), indexing='ij')], axis=1)
+    table = _dominance_table(_interval_histogram([edges[name] for name in names], tuple(afinidades_hist[name] for name in names)))
+    cobertura_historica = table[_coverage_index(thresholds, edges)] / len(afinidades_hist[names[0]])
+    return thresholds, cobertura_historica, edges
+
+# --- MUESTRA COMÚN (NÚMEROS ALEATORIOS COMUNES) ---
+# Para universos demasiado grandes para recorrerlos, todos los escenarios se comparan contra la misma
+# muestra, que se puntúa una sola vez por lotes. Tras cada lote se calcula un intervalo de Wilson por
+# candidato y se detiene el muestreo en cuanto el mejor queda separado del segundo: el tamaño de la
+# muestra funciona como perilla de latencia.
+
+EXACT_COVERAGE_MAX_UNIVERSE = 50_000_000
+
+def _draw_sample(rng: np.random.Generator, size: int, n: int, k: int) -> np.ndarray:
+    """Matriz (size, n) de combinaciones uniformes sin reemplazo, ordenadas por fila."""
+    return np.sort(rng.random((size, k)).argsort(axis=1)[:, :n] + 1, axis=1)
+
+def _wilson_interval(hits: np.ndarray, total: int, z: float) -> Tuple[np.ndarray, np.ndarray]:
+    p = hits / total
+    center = (p + z**2 / (2 * total)) / (1 + z**2 / total)
+    half = z / (1 + z**2 / total) * np.sqrt(p * (1 - p) / total + z**2 / (4 * total**2))
+    return np.clip(center - half, 0.0, 1.0), np.clip(center + half, 0.0, 1.0)
+
+def estimate_cu_sampled(
+    candidates: np.ndarray,
+    freqs: FrequencyTable,
+    game_config: Dict[str, Any],
+    sample_size: int = 20000,
+    batch_size: int = 2000,
+    seed: int = 42,
+    z: float = 1.96,
+    should_cancel: Optional[Callable[[], bool]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Cobertura Universal de varios candidatos (matriz (c, 3) de umbrales pares/tercias/cuartetos) sobre una
+    muestra común. Devuelve (estimación, límite inferior, límite superior, combinaciones usadas).
+    """
+    n, k = game_config['n'], game_config['k']
+    rng = np.random.default_rng(seed)
+    hits = np.zeros(len(candidates), dtype=np.int64)
+    used = 0
+    while used < sample_size:
+        if should_cancel and should_cancel():
+            raise TaskCancelled("Optimización cancelada por el usuario.")
+        sample = _draw_sample(rng, min(batch_size, sample_size - used), n, k)
+        affinities = calculate_batch_affinities(sample, freqs)
+        passes = np.ones((len(sample), len(candidates)), dtype=bool)
+        for column, name in enumerate(LEVEL_NAMES.values()):
+            passes &= affinities[name][:, None] >= candidates[None, :, column]
+        hits += np.count_nonzero(passes, axis=0)
+        used += len(sample)
+        low, high = _wilson_interval(hits, used, z)
+        if len(candidates) < 2: break
+        order = np.argsort(hits, kind='stable')
+        if high[order[0]] < low[order[1]]:
+            logger.info(f"Muestreo detenido con {used:,} combinaciones: el mejor candidato ya está separado del segundo.")
+            break
+    return hits / used, low, high, used
+
+# --- BÚSQUEDA ADAPTATIVA DE UMBRALES ---
+# Ambas coberturas son no crecientes en cada umbral, así que el óptimo está en la frontera de umbrales
+# máximos que aún cubren el 95% del histórico, y solo importan los valores enteros que aparecen en el
+# histórico: entre dos de ellos la Cobertura Histórica no cambia y subir el umbral solo baja la Universal.
+# Se parte del mejor escenario de la rejilla y, fijando un nivel, se recorre la frontera 2-D de los otros
+# dos con tablas de dominancia; se alternan los niveles fijos hasta que ninguna frontera mejora.
+
+def _worker_universe_points(rank_range: Tuple[int, int], n: int, k: int, lowest: Dict[str, int]) -> np.ndarray:
+    """Afinidades (m, 3) de las combinaciones del rango [start, stop) que superan 'lowest' en los tres niveles."""
+    freqs = FrequencyTable(k, {level: get_shared_array(f'freq_{level}') for level in LEVEL_NAMES})
+    start, stop = rank_range
+    points = [np.column_stack(score_omega_block(block, freqs, lowest)[1:]) for _, block in iter_combination_blocks(n, k, start, stop)]
+    return np.concatenate(points) if points else np.empty((0, 3), dtype=np.int64)
+
+# Frecuencias y cotas de poda de cada worker de la pasada con poda; se calculan una vez por proceso.
+_pruned_worker: Dict[str, Any] = {}
+
+def _init_pruned_worker(n: int, k: int):
+    freqs = FrequencyTable(k, {level: get_shared_array(f'freq_{level}') for level in LEVEL_NAMES})
+    _pruned_worker.update(freqs=freqs, tops=top_suffix_sums(freqs, n, k))
+
+def _worker_pruned_points(first_numbers: Tuple[int, ...], n: int, k: int, lowest: Dict[str, int]) -> np.ndarray:
+    """Afinidades (m, 3) de las combinaciones que empiezan por 'first_numbers' y superan 'lowest', con poda."""
+    blocks = iter_omega_branch_and_bound(_pruned_worker['freqs'], lowest, n, k, first_numbers, {}, _pruned_worker['tops'])
+    points = [np.column_stack(block[1:]) for block in blocks]
+    return np.concatenate(points) if points else np.empty((0, 3), dtype=np.int64)
+
+def _coverage_points(
+    freqs: FrequencyTable,
+    game_config: Dict[str, Any],
+    lowest: Dict[str, int],
+    coverage_mode: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+    pruned: bool = False
+) -> Tuple[np.ndarray, int]:
+    """
+    Afinidades (m, 3) contra las que se mide la Cobertura Universal y el total que representan: el universo
+    completo en modo 'exact' o la muestra común en los demás. Solo se conservan las que superan 'lowest';
+    con 'pruned', el universo se recorre por ramificación y poda (conviene si 'lowest' es selectivo).
+    """
+    n, k = game_config['n'], game_config['k']
+    if coverage_mode == 'exact' and pruned:
+        n_processes = _process_count()
+        shared_arrays = {f'freq_{level}': freqs[level] for level in LEVEL_NAMES}
+        # Las cotas de poda se precalculan una vez por proceso, así que cada primer número es una tarea
+        # (los bajos, con los subárboles más grandes, van primero) y se puede cancelar entre tareas.
+        tasks = [(first,) for first in range(1, k - n + 2)]
+        points = []
+        with SharedArrayPool(shared_arrays, processes=n_processes, initializer=_init_pruned_worker, initargs=(n, k)) as pool:
+            for done, result in enumerate(pool.imap_unordered(partial(_worker_pruned_points, n=n, k=k, lowest=lowest), tasks), start=1):
+                if should_cancel and should_cancel():
+                    raise TaskCancelled("Optimización cancelada por el usuario.")
+                if progress: progress(done, len(tasks))
+                points.append(result)
+        return np.concatenate(points), comb(k, n)
+    if coverage_mode == 'exact':
+        shared_arrays = {f'freq_{level}': freqs[level] for level in LEVEL_NAMES}
+        points = list(_map_universe(partial(_worker_universe_points, lowest=lowest), shared_arrays, game_config, progress, should_cancel))
+        return np.concatenate(points), comb(k, n)
+    sample_size = game_config['omega_config'].get('coverage_sample_size', 20000)
+    batch_size = game_config['omega_config'].get('coverage_sample_batch', 2000)
+    rng, points = np.random.default_rng(42), []
+    # La muestra se genera y puntúa por lotes (misma secuencia aleatoria que de una vez) para poder cancelar.
+    for start in range(0, sample_size, batch_size):
+        if should_cancel and should_cancel():
+            raise TaskCancelled("Optimización cancelada por el usuario.")
+        sample = _draw_sample(rng, min(batch_size, sample_size - start), n, k)
+        points.append(np.column_stack(score_omega_block(sample, freqs, lowest)[1:]))
+        if progress: progress(min(start + batch_size, sample_size), sample_size)
+    return np.concatenate(points), sample_size
+
+def _frontier_sweep(hist: np.ndarray, points: np.ndarray, values: List[np.ndarray], current: np.ndarray, fixed: int, min_coverage: float) -> Tuple[np.ndarray, int, int]:
+    """
+    Con el nivel 'fixed' en su umbral actual, recorre la frontera de los otros dos niveles. Devuelve los
+    índices del mejor punto factible, su conteo en 'points' y los puntos de la frontera evaluados.
+    """
+    a, b = [column for column in range(3) if column != fixed]
+    total_hist = len(hist)
+    threshold = values[fixed][current[fixed]]
+    hist, points = hist[hist[:, fixed] >= threshold], points[points[:, fixed] >= threshold]
+    edges = [values[a], values[b]]
+    # Con los propios valores como bordes, el intervalo i + 1 equivale a 'afinidad >= values[i]'.
+    hist_table = _dominance_table(_interval_histogram(edges, (hist[:, a], hist[:, b])))[1:, 1:]
+    point_table = _dominance_table(_interval_histogram(edges, (points[:, a], points[:, b])))[1:, 1:]
+    feasible = hist_table / total_hist >= min_coverage
+    # La factibilidad decrece a lo largo de cada fila: la frontera es la última columna factible.
+    rows = np.flatnonzero(feasible.any(axis=1))
+    if len(rows) == 0:
+        return current, np.iinfo(np.int64).max, 0
+    columns = feasible.shape[1] - 1 - np.argmax(feasible[rows, ::-1], axis=1)
+    counts = point_table[rows, columns]
+    best = int(np.argmin(counts))
+    result = current.copy()
+    result[a], result[b] = rows[best], columns[best]
+    return result, int(counts[best]), len(rows)
+
+def search_thresholds_adaptive(hist: np.ndarray, points: np.ndarray, start: np.ndarray, min_coverage: float = 0.95, window: int = 2, lower: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int, int]:
+    """
+    Busca los umbrales (pares, tercias, cuartetos) que minimizan cuántas filas de 'points' los superan con
+    Cobertura Histórica >= min_coverage, partiendo de los umbrales factibles 'start'. 'window' es cuántos
+    valores sube o baja el nivel fijo en cada barrido; 'lower' limita los umbrales por debajo.
+    Devuelve (umbrales, conteo en 'points', evaluaciones).
+    """
+    lower = hist.min(axis=0) if lower is None else lower
+    values = [np.unique(hist[:, column][hist[:, column] >= lower[column]]) for column in range(3)]
+    # Subir cada umbral al siguiente valor del histórico conserva la Cobertura Histórica.
+    current = np.array([np.searchsorted(values[column], start[column], side='left') for column in range(3)])
+    best_count = int(np.count_nonzero(np.all(points >= [values[c][current[c]] for c in range(3)], axis=1)))
+    evaluations = 1
+    stalled, fixed = 0, 2
+    while stalled < 3:
+        # El nivel fijo también se mueve unos pasos, para salir de óptimos donde deben cambiar los tres umbrales.
+        improved = False
+        for index in range(max(current[fixed] - window, 0), min(current[fixed] + window + 1, len(values[fixed]))):
+            start_point = current.copy()
+            start_point[fixed] = index
+            candidate, count, evaluated = _frontier_sweep(hist, points, values, start_point, fixed, min_coverage)
+            evaluations += evaluated
+            if count < best_count:
+                current, best_count, improved = candidate, count, True
+        stalled = 0 if improved else stalled + 1
+        fixed = (fixed + 1) % 3
+    return np.array([values[c][current[c]] for c in range(3)], dtype=np.int64), best_count, evaluations
+
+def _search_candidate(hist: np.ndarray, thresholds: np.ndarray, count: int, total: int, coverage_mode: str) -> Dict[str, Any]:
+    """Candidato con las coberturas de unos umbrales hallados por búsqueda ('count' de 'total' puntos los superan)."""
+    candidate = {
+        'umbrales': dict(zip(LEVEL_NAMES.values(), map(int, thresholds))),
+        'cobertura_historica': float(np.mean(np.all(hist >= thresholds, axis=1))),
+        'cobertura_universal_estimada': count / total
+    }
+    if coverage_mode != 'exact':
+        low, high = _wilson_interval(np.array([count]), total, 1.96)
+        candidate['cobertura_universal_ic'] = [float(low[0]), float(high[0])]
+    return candidate
+
+# Niveles extra de Cobertura Histórica para los que la búsqueda adaptativa deja un escenario óptimo en el frente.
+PARETO_COVERAGE_LEVELS = (0.96, 0.97, 0.98, 0.99)
+
+def _optimize_adaptive(
+    afinidades_hist: Dict[str, np.ndarray],
+    thresholds_grid: np.ndarray,
+    historical_coverage: np.ndarray,
+    edges: Dict[str, np.ndarray],
+    freqs: FrequencyTable,
+    game_config: Dict[str, Any],
+    coverage_mode: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Candidato óptimo de la búsqueda adaptativa, los campos extra del reporte y los escenarios evaluados:
+    toda la rejilla (medida sobre los mismos puntos) y el óptimo para 95% y para PARETO_COVERAGE_LEVELS.
+    """
+    names = list(LEVEL_NAMES.values())
+    hist = np.column_stack([afinidades_hist[name] for name in names])
+    # Ningún umbral óptimo queda por debajo del mínimo histórico de su nivel.
+    points, total = _coverage_points(freqs, game_config, {name: int(afinidades_hist[name].min()) for name in names}, coverage_mode, progress, should_cancel)
+    point_table = _dominance_table(_interval_histogram([edges[name] for name in names], tuple(points.T)))
+    grid_counts = point_table[_coverage_index(thresholds_grid, edges)]
+    scenarios = [
+        {'umbrales': dict(zip(names, map(int, row))), 'cobertura_historica': float(coverage), 'cobertura_universal_estimada': float(count / total)}
+        for row, coverage, count in zip(thresholds_grid, historical_coverage, grid_counts)
+    ]
+
+    evaluations = 0
+    optimal = {}
+    for min_coverage in (0.95,) + PARETO_COVERAGE_LEVELS:
+        # Punto de partida: el mejor escenario de la rejilla que cumple el nivel, medido sobre los mismos puntos;
+        # si ninguno lo cumple, los mínimos históricos (cubren todo el histórico).
+        feasible = np.flatnonzero(historical_coverage >= min_coverage)
+        start = thresholds_grid[feasible[np.argmin(grid_counts[feasible])]] if len(feasible) else hist.min(axis=0)
+        thresholds, count, evaluated = search_thresholds_adaptive(hist, points, start, min_coverage)
+        evaluations += evaluated
+        optimal[min_coverage] = _search_candidate(hist, thresholds, count, total, coverage_mode)
+
+    extra = {"evaluaciones": evaluations}
+    if coverage_mode != 'exact':
+        extra["muestras_usadas"] = total
+    return optimal[0.95], extra, scenarios + list(optimal.values())
+
+# --- ARRANQUE EN CALIENTE ---
+# Entre bloques consecutivos de la trayectoria los umbrales óptimos se mueven poco. Con la solución anterior
+# se busca primero en una caja que baja unos cuantos valores del histórico por nivel: solo cuentan las
+# combinaciones por encima de su esquina inferior (con poda en modo 'exact') y la búsqueda no sale de ella.
+# Si la esquina no cubre el 95% del histórico o el óptimo toca el borde inferior, se hace la búsqueda completa.
+
+WARM_START_WINDOW = 8
+WARM_START_FRACTION = 0.1
+
+def _optimize_warm_start(
+    afinidades_hist: Dict[str, np.ndarray],
+    previous: Dict[str, int],
+    freqs: FrequencyTable,
+    game_config: Dict[str, Any],
+    coverage_mode: str,
+    should_cancel: Optional[Callable[[], bool]] = None
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Óptimo en la vecindad de 'previous' y los campos extra del reporte, o None si hay que buscar en todo."""
+    names = list(LEVEL_NAMES.values())
+    hist = np.column_stack([afinidades_hist[name] for name in names])
+    values = [np.unique(hist[:, column]) for column in range(3)]
+    previous_thresholds = np.array([previous[name] for name in names], dtype=np.int64)
+    # La caja baja al menos WARM_START_WINDOW valores, o una fracción de los valores distintos del nivel.
+    steps = [max(WARM_START_WINDOW, int(WARM_START_FRACTION * len(v))) for v in values]
+    lower = np.array([values[c][max(np.searchsorted(values[c], previous_thresholds[c]) - steps[c], 0)] for c in range(3)])
+    if np.mean(np.all(hist >= lower, axis=1)) < 0.95:
+        return None
+    points, total = _coverage_points(freqs, game_config, dict(zip(names, map(int, lower))), coverage_mode, should_cancel=should_cancel, pruned=True)
+    start = previous_thresholds if np.mean(np.all(hist >= previous_thresholds, axis=1)) >= 0.95 else lower
+    thresholds, count, evaluations = search_thresholds_adaptive(hist, points, start, lower=lower)
+    if np.any((thresholds == lower) & (lower > hist.min(axis=0))):
         return None
+    extra = {"evaluaciones": evaluations}
+    if coverage_mode != 'exact':
+        extra["muestras_usadas"] = total
+    return _search_candidate(hist, thresholds, count, total, coverage_mode), extra
+
+# --- ESCENARIOS Y FRENTE DE PARETO ---
+# Cada corrida guarda todos los escenarios con Cobertura Universal conocida, por snapshot de frecuencias.
+# El frente de Pareto (más Cobertura Histórica, menos Universal) permite elegir otro compromiso sin reoptimizar.
+
+def pareto_front(historical: np.ndarray, universal: np.ndarray) -> np.ndarray:
+    """Máscara de los escenarios no dominados: ninguno otro cubre más histórico con menos universo."""
+    order = np.lexsort((universal, -historical))
+    best_before = np.minimum.accumulate(universal[order])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = universal[order][1:] < best_before[:-1]
+    mask = np.zeros(len(order), dtype=bool)
+    mask[order[keep]] = True
+    return mask
+
+def _persist_scenarios(game_config: Dict[str, Any], snapshot: int, scenarios: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Guarda los escenarios (sin repetir umbrales) con su marca de Pareto; devuelve (escenarios, tamaño del frente)."""
+    names = list(LEVEL_NAMES.values())
+    unique = {tuple(s['umbrales'][name] for name in names): s for s in scenarios}
+    df = pd.DataFrame([dict(zip(names, key)) for key in unique])
+    df['cobertura_historica'] = [s['cobertura_historica'] for s in unique.values()]
+    df['cobertura_universal'] = [s['cobertura_universal_estimada'] for s in unique.values()]
+    df['omega_size'] = np.rint(df['cobertura_universal'] * comb(game_config['k'], game_config['n'])).astype(np.int64)
+    df['pareto'] = pareto_front(df['cobertura_historica'].to_numpy(), df['cobertura_universal'].to_numpy()).astype(np.int64)
+    success, message = db.save_threshold_scenarios(game_config['paths']['db'], snapshot, df)
+    if success: logger.info(message)
+    return len(df), int(df['pareto'].sum())
+
+def apply_scenario_thresholds(game_config: Dict[str, Any], thresholds: Dict[str, int]) -> Tuple[bool, str]:
+    """Adopta los umbrales de un escenario guardado sin volver a optimizar."""
+    new_thresholds = {name: int(thresholds[name]) for name in LEVEL_NAMES.values()}
+    if not _save_thresholds_to_json(new_thresholds, game_config):
+        return False, "Falló la actualización del archivo de umbrales."
+    return True, f"Umbrales {new_thresholds} aplicados para '{game_config['display_name']}'. Vuelva a enriquecer el histórico y a pre-generar la Clase Omega para usarlos."
+
 # ml_optimizer.py
 
 # ... (otros imports y funciones)
 
+def _progress_reporter(set_progress, label: str, low: int, high: int) -> Optional[Callable[[int, int], None]]:
+    """Traduce el avance real (hechas/total) a la barra entre 'low' y 'high', con ritmo y tiempo restante."""
+    if not set_progress:
+        return None
+    from dash import no_update
+    started = time.time()
+
+    def report(done: int, total: int):
+        elapsed = time.time() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = (total - done) / rate if rate > 0 else 0.0
+        set_progress((
+            low + int((high - low) * done / total),
+            f"{label}: {done:,}/{total:,} ({rate:,.0f}/s, quedan ~{remaining:.0f} s)",
+            no_update, no_update, no_update, no_update, no_update, no_update
+        ))
+    return report
+
 def run_optimization(
     game_config: Dict[str, Any], 
     df_historico: pd.DataFrame, 
-    freqs: Dict[str, Dict[tuple, int]], 
-    set_progress=None
+    freqs: FrequencyTable, 
+    set_progress=None,
+    search: Optional[str] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+    snapshot: Optional[int] = None,
+    warm_start: Optional[Dict[str, int]] = None,
+    persist_scenarios: bool = True,
+    save_thresholds: bool = True
 ) -> Tuple[bool, str, Dict]:
     from dash import no_update
     
@@ -116,71 +519,137 @@ def run_optimization(
         logger.info(f"Iniciando optimización para '{game_config['display_name']}'.")
         result_columns = game_config['data_source']['result_columns']
 
-        afinidades_pares, afinidades_tercias, afinidades_cuartetos = [], [], []
-        for _, row in df_historico.iterrows():
-            try:
-                combo = sorted([int(row[col]) for col in result_columns]) #type: ignore
-                afinidades_pares.append(_calculate_subsequence_affinity(combo, freqs, 2))
-                afinidades_tercias.append(_calculate_subsequence_affinity(combo, freqs, 3))
-                afinidades_cuartetos.append(_calculate_subsequence_affinity(combo, freqs, 4))
-            except (ValueError, TypeError):
-                continue
-        
-        if not afinidades_pares:
+        draws = get_draws_matrix(df_historico, result_columns)
+        if len(draws) == 0:
             return False, "No se pudieron calcular afinidades para el histórico.", {}
 
-        afinidades_hist_data = {'pares': afinidades_pares, 'tercias': afinidades_tercias, 'cuartetos': afinidades_cuartetos}
+        afinidades_hist_data = calculate_batch_affinities(draws, freqs)
 
         percentiles_range = np.arange(0.01, 0.51, 0.03)
-        percentile_combinations = list(product(percentiles_range, repeat=3))
-        
-        worker_args = [(p_combo, afinidades_hist_data, freqs, game_config) for p_combo in percentile_combinations]
-        
-        n_processes = min(mp.cpu_count(), 8)
-        logger.info(f"Optimizando {len(worker_args)} escenarios en {n_processes} núcleos...")
-        
-        # --- INICIO DE LA CORRECCIÓN DE PROGRESO (ROBUSTA) ---
-        if set_progress:
-            set_progress((5, f"Iniciando optimización de {len(worker_args)} escenarios...", no_update, no_update, no_update, no_update, no_update, no_update))
-        # --- FIN DE LA CORRECCIÓN DE PROGRESO ---
-        
-        with mp.Pool(processes=n_processes) as pool:
-            async_result = pool.map_async(_worker_evaluate_scenario, worker_args)
-            
+        omega_config = game_config['omega_config']
+        coverage_mode = omega_config.get('coverage_mode', 'exact')
+        if coverage_mode == 'exact' and comb(game_config['k'], game_config['n']) > EXACT_COVERAGE_MAX_UNIVERSE:
+            logger.warning(f"El universo de '{game_config['display_name']}' es demasiado grande para la cobertura exacta; se usará la muestra común.")
+            coverage_mode = 'sample'
+        # 'grid' recorre toda la rejilla de percentiles; 'adaptive' parte de ella y busca sobre umbrales enteros.
+        search = search or omega_config.get('threshold_search', 'grid')
+
+        # Con la solución de un bloque anterior se busca primero en su vecindad. Esa búsqueda es sobre umbrales
+        # enteros, así que solo se usa con 'adaptive': con 'grid' mezclaría dos métodos en la misma trayectoria.
+        if search != 'adaptive' or not omega_config.get('warm_start', True):
+            warm_start = None
+        warm = _optimize_warm_start(afinidades_hist_data, warm_start, freqs, game_config, coverage_mode, should_cancel) if warm_start else None
+        if warm_start:
+            logger.info("Arranque en caliente resuelto en la vecindad." if warm else "Arranque en caliente sin solución en la vecindad; se hace la búsqueda completa.")
+        if warm:
+            optimal_candidate, extra_report = warm
+            scenarios = [optimal_candidate]
+        else:
+            # --- INICIO DE LA CORRECCIÓN DE PROGRESO (ROBUSTA) ---
             if set_progress:
-                # Bucle de progreso "ficticio" que avanza mientras espera
-                progress = 5
-                while not async_result.ready():
-                    time.sleep(1) # Espera un segundo
-                    progress = min(progress + 5, 90) # Incrementa el progreso, con un tope de 90%
-                    set_progress((
-                        progress, f"Procesando escenarios...",
-                        no_update, no_update, no_update, no_update, no_update, no_update
-                    ))
-            
-            worker_results = async_result.get() # Espera a que todo termine
-        
-        if set_progress:
-            set_progress((95, "Recopilando resultados...", no_update, no_update, no_update, no_update, no_update, no_update))
+                set_progress((5, f"Evaluando {len(percentiles_range) ** 3} escenarios...", no_update, no_update, no_update, no_update, no_update, no_update))
+            # --- FIN DE LA CORRECCIÓN DE PROGRESO ---
 
-        valid_candidates = [result for result in worker_results if result is not None]
-        
-        if not valid_candidates:
-            return False, "No se encontraron candidatos con Cobertura Histórica >= 95%", {}
-        
-        optimal_candidate = min(valid_candidates, key=lambda x: x['cobertura_universal_estimada'])
-        
-        if not _save_thresholds_to_json(optimal_candidate['umbrales'], game_config):
+            # Toda la rejilla de percentiles se evalúa contra el histórico en una sola pasada.
+            thresholds_grid, cobertura_historica, edges = evaluate_percentile_grid(afinidades_hist_data, percentiles_range)
+            # Filtro no negociable: si no cubre al menos el 95% del histórico, se descarta
+            survivors = np.flatnonzero(cobertura_historica >= 0.95)
+            logger.info(f"{len(survivors)} de {len(thresholds_grid)} escenarios superan el filtro de Cobertura Histórica (cobertura '{coverage_mode}').")
+
+            if len(survivors) == 0:
+                return False, "No se encontraron candidatos con Cobertura Histórica >= 95%", {}
+
+            if set_progress:
+                set_progress((30, "Calculando Cobertura Universal de los candidatos...", no_update, no_update, no_update, no_update, no_update, no_update))
+
+            if search == 'adaptive':
+                optimal_candidate, extra_report, scenarios = _optimize_adaptive(
+                    afinidades_hist_data, thresholds_grid, cobertura_historica, edges, freqs, game_config, coverage_mode,
+                    _progress_reporter(set_progress, "Recorriendo el universo", 30, 90), should_cancel
+                )
+            else:
+                valid_candidates = [
+                    {
+                        'umbrales': dict(zip(LEVEL_NAMES.values(), map(int, thresholds_grid[index]))),
+                        'cobertura_historica': float(cobertura_historica[index]),
+                        'cobertura_universal_estimada': None
+                    }
+                    for index in survivors
+                ]
+
+                if coverage_mode == 'exact':
+                    # El universo se recorre una sola vez para todos los escenarios.
+                    coverage = compute_universe_coverage(
+                        freqs, game_config, edges,
+                        _progress_reporter(set_progress, "Recorriendo el universo", 30, 90), should_cancel
+                    )
+                    universal = coverage[_coverage_index(thresholds_grid, edges)] / comb(game_config['k'], game_config['n'])
+                    for candidate, value in zip(valid_candidates, universal[survivors]):
+                        candidate['cobertura_universal_estimada'] = float(value)
+                    # Con la tabla de dominancia, la Cobertura Universal de toda la rejilla es gratuita.
+                    scenarios = [
+                        {'umbrales': dict(zip(LEVEL_NAMES.values(), map(int, row))), 'cobertura_historica': float(hc), 'cobertura_universal_estimada': float(cu)}
+                        for row, hc, cu in zip(thresholds_grid, cobertura_historica, universal)
+                    ]
+                elif coverage_mode == 'monte_carlo':
+                    report_progress = _progress_reporter(set_progress, "Estimando escenarios", 30, 90)
+                    for done, candidate in enumerate(valid_candidates, start=1):
+                        if should_cancel and should_cancel():
+                            raise TaskCancelled("Optimización cancelada por el usuario.")
+                        candidate['cobertura_universal_estimada'] = _estimate_cu_monte_carlo(candidate['umbrales'], freqs, game_config)
+                        if report_progress: report_progress(done, len(valid_candidates))
+
+                extra_report = {}
+                if coverage_mode == 'sample':
+                    # Escenarios distintos pueden dar los mismos umbrales; cada terna se evalúa una vez.
+                    thresholds_matrix = np.array([[c['umbrales'][name] for name in LEVEL_NAMES.values()] for c in valid_candidates], dtype=np.int64)
+                    unique_thresholds, inverse = np.unique(thresholds_matrix, axis=0, return_inverse=True)
+                    estimate, low, high, used = estimate_cu_sampled(
+                        unique_thresholds, freqs, game_config,
+                        sample_size=omega_config.get('coverage_sample_size', 20000),
+                        batch_size=omega_config.get('coverage_sample_batch', 2000),
+                        should_cancel=should_cancel
+                    )
+                    for candidate, index in zip(valid_candidates, np.ravel(inverse)):
+                        candidate['cobertura_universal_estimada'] = float(estimate[index])
+                        candidate['cobertura_universal_ic'] = [float(low[index]), float(high[index])]
+                    extra_report = {"muestras_usadas": used}
+
+                optimal_candidate = min(valid_candidates, key=lambda x: x['cobertura_universal_estimada'])
+                if coverage_mode != 'exact':
+                    scenarios = valid_candidates
+
+            if set_progress:
+                set_progress((95, "Recopilando resultados...", no_update, no_update, no_update, no_update, no_update, no_update))
+
+            # Escenarios de la rejilla evaluados contra el histórico más los puntos de frontera de la búsqueda.
+            extra_report["evaluaciones"] = len(thresholds_grid) + extra_report.get("evaluaciones", 0)
+            logger.info(f"Búsqueda '{search}' completada con {extra_report['evaluaciones']} evaluaciones.")
+
+        extra_report["arranque_en_caliente"] = warm is not None
+
+        # El snapshot por defecto es el último concurso del histórico con el que se optimizó.
+        snapshot = snapshot if snapshot is not None else int(df_historico['concurso'].max())
+        if persist_scenarios:
+            extra_report["escenarios"], extra_report["frente_pareto"] = _persist_scenarios(game_config, snapshot, scenarios)
+
+        # Quien optimiza puntos del pasado (la trayectoria) no debe tocar los umbrales vigentes.
+        if save_thresholds and not _save_thresholds_to_json(optimal_candidate['umbrales'], game_config):
             return False, "Falló la actualización del archivo de umbrales.", {}
         
         report = {
             "new_thresholds": optimal_candidate['umbrales'], 
             "cobertura_historica": optimal_candidate['cobertura_historica'], 
-            "cobertura_universal_estimada": optimal_candidate['cobertura_universal_estimada']
+            "cobertura_universal_estimada": optimal_candidate['cobertura_universal_estimada'],
+            **({"cobertura_universal_ic": optimal_candidate['cobertura_universal_ic']} if 'cobertura_universal_ic' in optimal_candidate else {}),
+            **extra_report
         }
         
         return True, f"Optimización para '{game_config['display_name']}' exitosa.", report
         
+    except TaskCancelled as e:
+        logger.warning(str(e))
+        return False, str(e), {}
     except Exception as e:
         logger.error(f"Error crítico en optimización: {str(e)}", exc_info=True)
         return False, f"Error crítico: {str(e)}", {}
\ No newline at end of file
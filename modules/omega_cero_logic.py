@@ -4,8 +4,6 @@ import logging
 import pandas as pd
 import numpy as np
 from typing import Dict, Any, Tuple
-from collections import Counter
-from itertools import combinations
 
 from . import database as db
 from . import omega_logic as ol # Reutilizamos funciones de omega_logic
@@ -63,44 +61,38 @@ def get_omega_cero_candidates(game_config: Dict[str, Any]) -> Tuple[pd.DataFrame
     if df_full_historico.empty:
         logger.warning("El histórico está vacío para calcular el umbral actual."); return pd.DataFrame(), metrics
 
-    afinidades_actuales = [
-        ol._calculate_subsequence_affinity(sorted([int(r[c]) for c in result_columns]), freqs, 2) # type: ignore
-        for _, r in df_full_historico.iterrows()
-    ]
+    afinidades_actuales = ol.calculate_batch_affinities(ol.get_draws_matrix(df_full_historico, result_columns), freqs)['pares']
     umbral_pares_actual = int(np.percentile(afinidades_actuales, 20))
 
-    # 4. Simular el "Score al nacer" para cada candidata
-    candidatas_finales = []
+    # 4. Simular el "Score al nacer" para todas las candidatas a la vez
     num_cols = [f'c{i}' for i in range(1, game_config['n'] + 1)]
     loaded_thresholds = ol.get_loaded_thresholds(game_config)
     weights = game_config['omega_config']['score_weights']
 
-    for _, row in df_omega_candidates.iterrows():
-        try:
-            combination = [int(row[col]) for col in num_cols]
-            af_p = row['afinidad_pares']
-            af_q = row['afinidad_cuartetos']
-            simulated_original_score = (af_p - umbral_pares_actual) / (umbral_pares_actual or 1)
-            
-            # 5. Aplicar el Filtro Dinámico de "Banda de Normalidad"
-            if metrics['banda_normal_inferior'] <= simulated_original_score <= metrics['banda_normal_superior']:
-                # Calcular el 'current_omega_score' on-the-fly para esta candidata
-                s_q = ((af_q - loaded_thresholds.get('cuartetos',0)) / (loaded_thresholds.get('cuartetos',1) or 1)) * weights.get('cuartetos',0)
-                s_t = ((row['afinidad_tercias'] - loaded_thresholds.get('tercias',0)) / (loaded_thresholds.get('tercias',1) or 1)) * weights.get('tercias',0)
-                s_p = ((af_p - loaded_thresholds.get('pares',0)) / (loaded_thresholds.get('pares',1) or 1)) * weights.get('pares',0)
-                current_omega_score = s_q + s_t + s_p
-
-                candidatas_finales.append({
-                    'combinacion': "-".join(map(str, combination)),
-                    'simulated_original_score': simulated_original_score,
-                    'current_omega_score': current_omega_score,
-                    'afinidad_cuartetos': af_q
-                })
-        except (ValueError, TypeError, KeyError):
-            continue
-
-    logger.info(f"Filtro completado. Se encontraron {len(candidatas_finales)} candidatas de Omega Cero.")
-    df_candidatas = pd.DataFrame(candidatas_finales)
+    df_omega_candidates = df_omega_candidates.dropna(subset=num_cols + ['afinidad_pares', 'afinidad_tercias', 'afinidad_cuartetos'])
+    af_p = df_omega_candidates['afinidad_pares'].to_numpy(dtype=np.float64)
+    af_t = df_omega_candidates['afinidad_tercias'].to_numpy(dtype=np.float64)
+    af_q = df_omega_candidates['afinidad_cuartetos'].to_numpy(dtype=np.float64)
+    simulated_original_score = (af_p - umbral_pares_actual) / (umbral_pares_actual or 1)
+
+    # 5. Aplicar el Filtro Dinámico de "Banda de Normalidad"
+    en_banda = (metrics['banda_normal_inferior'] <= simulated_original_score) & (simulated_original_score <= metrics['banda_normal_superior'])
+
+    # Calcular el 'current_omega_score' solo para las candidatas dentro de la banda
+    s_q = ((af_q[en_banda] - loaded_thresholds.get('cuartetos',0)) / (loaded_thresholds.get('cuartetos',1) or 1)) * weights.get('cuartetos',0)
+    s_t = ((af_t[en_banda] - loaded_thresholds.get('tercias',0)) / (loaded_thresholds.get('tercias',1) or 1)) * weights.get('tercias',0)
+    s_p = ((af_p[en_banda] - loaded_thresholds.get('pares',0)) / (loaded_thresholds.get('pares',1) or 1)) * weights.get('pares',0)
+    combos_en_banda = df_omega_candidates[num_cols].to_numpy(dtype=np.int64)[en_banda]
+
+    candidatas_finales = {
+        'combinacion': ["-".join(map(str, combo)) for combo in combos_en_banda.tolist()],
+        'simulated_original_score': simulated_original_score[en_banda],
+        'current_omega_score': s_q + s_t + s_p,
+        'afinidad_cuartetos': df_omega_candidates['afinidad_cuartetos'].to_numpy()[en_banda]
+    }
+
+    df_candidatas = pd.DataFrame(candidatas_finales) if len(combos_en_banda) else pd.DataFrame()
+    logger.info(f"Filtro completado. Se encontraron {len(df_candidatas)} candidatas de Omega Cero.")
     
     metrics['numero_candidatas'] = len(df_candidatas)
     
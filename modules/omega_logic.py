@@ -1,10 +1,9 @@
 # omega_logic.py
 
 import json
-from collections import Counter
-from itertools import combinations, islice
+from itertools import combinations
 import logging
-from math import factorial
+from math import comb
 import pandas as pd
 import numpy as np
 from typing import Dict, Any, List, Tuple, Optional
@@ -12,47 +11,133 @@ from functools import partial
 import multiprocessing as mp
 import os
 
-from utils.parallel_utils import NoDaemonPool
+from utils.parallel_utils import SharedArrayPool, get_shared_array
 from modules import database as db
+from modules import game_cache
+from modules.frequency_table import FrequencyTable, LEVEL_NAMES, iter_combination_blocks, load_frequency_file, load_legacy_json, neighbourhood_ranks, rank_combinations, read_frequency_header, save_frequency_file, split_rank_ranges, unrank_combinations
+from modules.omega_search import iter_omega_branch_and_bound
 from utils import state_manager
 
 logger = logging.getLogger(__name__)
 
-# --- FUNCIONES DE AYUDA (Sin cambios) ---
-def get_frequencies(game_config: Dict[str, Any]) -> Optional[Dict[str, Dict[tuple, int]]]:
+# Sorteos acumulados en la bitácora de frecuencias antes de reescribir la instantánea base.
+FREQ_LOG_COMPACT_EVERY = 50
+
+# --- FUNCIONES DE AYUDA ---
+def migrate_legacy_frequencies(game_config: Dict[str, Any]) -> Optional[FrequencyTable]:
+    """Convierte una sola vez el JSON de frecuencias anterior al formato binario."""
+    legacy_file, freq_file = game_config['paths']['frequencies_legacy'], game_config['paths']['frequencies']
+    try:
+        freqs = load_legacy_json(legacy_file, game_config['k'])
+    except (FileNotFoundError, json.JSONDecodeError, ValueError):
+        return None
+    last_concurso = state_manager.get_state(game_config['paths']['state']).get("last_concurso_for_freqs", 0)
+    try:
+        save_frequency_file(freqs, freq_file, last_concurso)
+        logger.info(f"Frecuencias migradas de '{os.path.basename(legacy_file)}' a '{os.path.basename(freq_file)}'.")
+    except OSError as e:
+        logger.warning(f"No se pudo escribir el archivo binario de frecuencias '{freq_file}': {e}")
+    return freqs
+
+def _read_frequency_snapshot(game_config: Dict[str, Any]) -> Tuple[Optional[FrequencyTable], int]:
+    """Instantánea base de frecuencias y el último concurso que incluye (0 si no existe)."""
     freq_file = game_config['paths']['frequencies']
     try:
-        with open(freq_file, 'r', encoding='utf-8') as f: data = json.load(f)
-        return {"pares": {eval(k): v for k, v in data.get("FREQ_PARES", {}).items()}, "tercias": {eval(k): v for k, v in data.get("FREQ_TERCIAS", {}).items()}, "cuartetos": {eval(k): v for k, v in data.get("FREQ_CUARTETOS", {}).items()}}
-    except (FileNotFoundError, json.JSONDecodeError):
-        logger.warning(f"No se pudo cargar el archivo de frecuencias: {freq_file}"); return None
+        return load_frequency_file(freq_file), read_frequency_header(freq_file)["last_concurso"]
+    except FileNotFoundError:
+        freqs = migrate_legacy_frequencies(game_config)
+        last_concurso = state_manager.get_state(game_config['paths']['state']).get("last_concurso_for_freqs", 0) if freqs is not None else 0
+        return freqs, last_concurso
+    except (OSError, ValueError) as e:
+        logger.warning(f"Archivo de frecuencias inválido '{freq_file}': {e}"); return None, 0
 
-def get_loaded_thresholds(game_config: Dict[str, Any]) -> Dict[str, int]:
+def _read_frequencies(game_config: Dict[str, Any]) -> Optional[FrequencyTable]:
+    """Instantánea base más los sorteos de la bitácora posteriores a ella."""
+    freqs, base_last = _read_frequency_snapshot(game_config)
+    df_log = db.read_frequency_log(game_config['paths']['db'], after=base_last)
+    if freqs is None:
+        if df_log.empty:
+            logger.warning(f"No se pudo cargar el archivo de frecuencias: {game_config['paths']['frequencies']}"); return None
+        freqs = FrequencyTable(game_config['k'], levels=game_config['omega_config']['affinity_levels'])
+    freqs.update(get_draws_matrix(df_log, _log_columns(game_config)))
+    return freqs
+
+def get_frequencies(game_config: Dict[str, Any]) -> Optional[FrequencyTable]:
+    """Frecuencias del juego desde la caché de proceso; la tabla devuelta es de solo lectura."""
+    def loader():
+        freqs = _read_frequencies(game_config)
+        return freqs.freeze() if freqs is not None else None
+    file_signature = game_cache.file_signature(game_config['paths']['frequencies'])
+    db_signature = game_cache.db_signature(game_config['paths']['db'])
+    signature = (file_signature, db_signature) if db_signature is not None else None
+    return game_cache.get_or_load(game_config['id'], 'frequencies', signature, loader)
+
+def get_frequencies_at(game_config: Dict[str, Any], concurso: int) -> Optional[FrequencyTable]:
+    """
+    Reconstruye las frecuencias tal como quedaron tras el sorteo 'concurso': parte de la instantánea
+    base y suma (o resta, si es anterior) los sorteos de la bitácora entre ambos puntos.
+    """
+    freqs, base_last = _read_frequency_snapshot(game_config)
+    if freqs is None: freqs, base_last = FrequencyTable(game_config['k'], levels=game_config['omega_config']['affinity_levels']), 0
+    db_path, log_columns = game_config['paths']['db'], _log_columns(game_config)
+    if concurso >= base_last:
+        freqs.update(get_draws_matrix(db.read_frequency_log(db_path, after=base_last, until=concurso), log_columns))
+        return freqs
+    df_log = db.read_frequency_log(db_path, until=base_last)
+    if df_log.empty:
+        logger.warning(f"La bitácora de frecuencias no cubre el concurso {concurso}."); return None
+    freqs.remove(get_draws_matrix(df_log[df_log['concurso'] > concurso], log_columns))
+    return freqs
+
+def _log_columns(game_config: Dict[str, Any]) -> List[str]:
+    return [f'c{i}' for i in range(1, game_config['n'] + 1)]
+
+def _frequency_log_rows(df: pd.DataFrame, result_columns: List[str]) -> List[tuple]:
+    """Renglones (concurso, c1..cn) para la bitácora; un sorteo con datos inválidos se registra con números nulos."""
+    values = df[result_columns].apply(pd.to_numeric, errors='coerce')
+    valid = values.notna().all(axis=1).to_numpy()
+    numbers = values.fillna(0).to_numpy(dtype=np.int64).tolist()
+    empty = (None,) * len(result_columns)
+    return [(int(concurso),) + (tuple(row) if ok else empty) for concurso, row, ok in zip(df['concurso'].tolist(), numbers, valid)]
+
+def _read_thresholds(game_config: Dict[str, Any]) -> Optional[Dict[str, int]]:
     thresholds_file = game_config['paths']['thresholds']
     try:
         with open(thresholds_file, 'r', encoding='utf-8') as f: return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        logger.warning(f"No se encontró '{thresholds_file}'. Usando valores por defecto."); return game_config['omega_config']['default_thresholds']
+        logger.warning(f"No se encontró '{thresholds_file}'. Usando valores por defecto."); return None
 
-def get_historical_draws_set(game_config: Dict[str, Any]) -> set:
+def get_loaded_thresholds(game_config: Dict[str, Any]) -> Dict[str, int]:
+    signature = game_cache.file_signature(game_config['paths']['thresholds'])
+    thresholds = game_cache.get_or_load(game_config['id'], 'thresholds', signature, lambda: _read_thresholds(game_config))
+    return dict(thresholds if thresholds is not None else game_config['omega_config']['default_thresholds'])
+
+def _read_historical_draws_set(game_config: Dict[str, Any]) -> frozenset:
     db_path = game_config['paths']['db']
     df_historico = db.read_historico_from_db(db_path)
-    if df_historico.empty: return set()
+    if df_historico.empty: return frozenset()
     result_columns = game_config['data_source']['result_columns']
     valid_columns = [col for col in result_columns if col in df_historico.columns]
-    if not valid_columns: return set()
-    np_draws = df_historico[valid_columns].to_numpy()
-    return {tuple(sorted(row)) for row in np_draws}
-
-def _calculate_subsequence_affinity(combination: List[int], freqs: Dict, size: int) -> int:
-    key_map = {2: "pares", 3: "tercias", 4: "cuartetos"}
-    if not freqs or key_map[size] not in freqs: return 0
-    total_affinity = 0
-    freq_map = freqs[key_map[size]]
-    for sub in combinations(sorted(combination), size): total_affinity += freq_map.get(sub, 0)
-    return total_affinity
-
-def evaluate_combination(combination: List[int], freqs: Dict, game_config: Dict[str, Any], loaded_thresholds: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    if not valid_columns: return frozenset()
+    np_draws = np.sort(df_historico[valid_columns].to_numpy(), axis=1).tolist()
+    return frozenset(tuple(row) for row in np_draws)
+
+def get_historical_draws_set(game_config: Dict[str, Any]) -> frozenset:
+    """Conjunto de sorteos históricos (tuplas ordenadas), en caché mientras la BD no cambie."""
+    signature = game_cache.db_signature(game_config['paths']['db'])
+    return game_cache.get_or_load(game_config['id'], 'historical_set', signature, lambda: _read_historical_draws_set(game_config))
+
+def get_draws_matrix(df: pd.DataFrame, result_columns: List[str]) -> np.ndarray:
+    """Matriz (m, n) de enteros con los sorteos de un DataFrame, descartando filas con datos inválidos."""
+    if df.empty or not all(col in df.columns for col in result_columns): return np.empty((0, len(result_columns)), dtype=np.int64)
+    values = df[result_columns].apply(pd.to_numeric, errors='coerce')
+    return values.dropna().to_numpy(dtype=np.int64)
+
+def _calculate_subsequence_affinity(combination: List[int], freqs: Optional[FrequencyTable], size: int) -> int:
+    if not freqs or size not in freqs: return 0
+    return freqs.affinity(combination, size)
+
+def evaluate_combination(combination: List[int], freqs: FrequencyTable, game_config: Dict[str, Any], loaded_thresholds: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
     n = game_config['n']
     if not isinstance(combination, list) or len(set(combination)) != n: return {"error": f"Entrada inválida. Se esperan {n} números únicos."}
     thresholds = loaded_thresholds if loaded_thresholds is not None else get_loaded_thresholds(game_config)
@@ -68,74 +153,81 @@ def evaluate_combination(combination: List[int], freqs: Dict, game_config: Dict[
     s_t = ((af_t - thresholds.get('tercias', 0)) / (thresholds.get('tercias', 1) or 1)) * weights.get('tercias', 0)
     s_q = ((af_q - thresholds.get('cuartetos', 0)) / (thresholds.get('cuartetos', 1) or 1)) * weights.get('cuartetos', 0)
     omega_score = s_p + s_t + s_q
-    historical_set = game_config.get('_historical_set_cache')
-    if historical_set is None:
-        historical_set = get_historical_draws_set(game_config)
-        game_config['_historical_set_cache'] = historical_set
-    ha_salido = tuple(sorted(combination)) in historical_set
+    ha_salido = tuple(sorted(combination)) in get_historical_draws_set(game_config)
     return {"error": None, "esOmega": es_omega, "omegaScore": omega_score, "haSalido": ha_salido, "combinacion": sorted(combination), "afinidadPares": af_p, "afinidadTercias": af_t, "afinidadCuartetos": af_q, "criterios": {"pares": {"cumple": c_p, "score": af_p, "umbral": thresholds.get('pares', 0)}, "tercias": {"cumple": c_t, "score": af_t, "umbral": thresholds.get('tercias', 0)}, "cuartetos": {"cumple": c_q, "score": af_q, "umbral": thresholds.get('cuartetos', 0)}}}
 
+def calculate_batch_affinities(draws: np.ndarray, freqs: FrequencyTable) -> Dict[str, np.ndarray]:
+    """Afinidades de pares, tercias y cuartetos para una matriz (m, n) de combinaciones en una sola pasada."""
+    draws = np.asarray(draws, dtype=np.int64)
+    return {name: freqs.affinities(draws, level) if level in freqs else np.zeros(len(draws), dtype=np.int64) for level, name in LEVEL_NAMES.items()}
+
+def evaluate_batch(draws: np.ndarray, freqs: FrequencyTable, game_config: Dict[str, Any], loaded_thresholds: Optional[Dict[str, int]] = None) -> Dict[str, np.ndarray]:
+    """
+    Versión vectorizada de evaluate_combination para m combinaciones a la vez.
+    Devuelve arreglos de longitud m: af_pares, af_tercias, af_cuartetos, omega_score y es_omega.
+    """
+    thresholds = loaded_thresholds if loaded_thresholds is not None else get_loaded_thresholds(game_config)
+    weights = game_config['omega_config']['score_weights']
+    affinities = calculate_batch_affinities(draws, freqs)
+    es_omega = np.ones(len(affinities['pares']), dtype=bool)
+    omega_score = np.zeros(len(affinities['pares']), dtype=np.float64)
+    for name in ('pares', 'tercias', 'cuartetos'):
+        es_omega &= affinities[name] >= thresholds.get(name, 0)
+        omega_score += ((affinities[name] - thresholds.get(name, 0)) / (thresholds.get(name, 1) or 1)) * weights.get(name, 0)
+    return {"af_pares": affinities['pares'], "af_tercias": affinities['tercias'], "af_cuartetos": affinities['cuartetos'], "omega_score": omega_score, "es_omega": es_omega}
+
 def calculate_and_save_frequencies(game_config: Dict[str, Any]) -> Tuple[bool, str]:
-    # (sin cambios)
+    """
+    Registra los sorteos nuevos en la bitácora de frecuencias (tabla de la BD del juego) en una sola
+    transacción, que es el punto de confirmación: el avance se lee de la bitácora y el archivo de estado
+    se sincroniza a partir de ella. Cada FREQ_LOG_COMPACT_EVERY sorteos se reescribe la instantánea base.
+    """
     logger.info(f"Iniciando cálculo de frecuencias para '{game_config['display_name']}'.")
     state_file, freq_file, db_path = game_config['paths']['state'], game_config['paths']['frequencies'], game_config['paths']['db']
-    result_columns, affinity_levels = game_config['data_source']['result_columns'], game_config['omega_config']['affinity_levels']
+    result_columns = game_config['data_source']['result_columns']
     state = state_manager.get_state(state_file)
-    last_processed_concurso = state.get("last_concurso_for_freqs", 0)
+    _, base_last = _read_frequency_snapshot(game_config)
+    log_last = db.last_concurso_in_frequency_log(db_path)
+    last_processed_concurso = max(base_last, log_last)
     df_historico = db.read_historico_from_db(db_path)
     if df_historico.empty: return False, "La base de datos del juego está vacía."
-    df_new_draws = df_historico[df_historico['concurso'] > last_processed_concurso].copy()
-    if df_new_draws.empty: return True, "Las frecuencias ya están actualizadas."
-    freqs_data = get_frequencies(game_config) or {}
-    freq_counters = {2: Counter(freqs_data.get("pares", {})), 3: Counter(freqs_data.get("tercias", {})), 4: Counter(freqs_data.get("cuartetos", {}))}
-    for _, row in df_new_draws.iterrows():
-        try:
-            draw = sorted([int(row[col]) for col in result_columns])
-            for level in affinity_levels: freq_counters[level].update(combinations(draw, level))
-        except (ValueError, TypeError):
-            logger.warning(f"Omitiendo fila con datos inválidos en el histórico: {row.get('concurso')}")
-            continue
+    df_new_draws = df_historico[df_historico['concurso'] > last_processed_concurso].sort_values(by='concurso')
+    log_rows = _frequency_log_rows(df_new_draws, result_columns)
+    invalid_rows = sum(1 for row in log_rows if row[1] is None)
+    if invalid_rows: logger.warning(f"Omitiendo {invalid_rows} filas con datos inválidos en el histórico.")
+    if log_last == 0 and base_last > 0:
+        # Primera escritura: se registran también los sorteos ya incluidos en la instantánea para poder
+        # reconstruir cualquier punto anterior restándolos.
+        df_counted = df_historico[df_historico['concurso'] <= base_last].sort_values(by='concurso')
+        log_rows = _frequency_log_rows(df_counted, result_columns) + log_rows
+    success, message = db.append_frequency_log(db_path, log_rows)
+    if not success: return False, f"Error al guardar frecuencias para '{game_config['display_name']}': {message}"
+    if df_new_draws.empty:
+        if state.get("last_concurso_for_freqs", 0) != last_processed_concurso:
+            state["last_concurso_for_freqs"] = last_processed_concurso
+            state_manager.save_state(state, state_file)
+        return True, "Las frecuencias ya están actualizadas."
     new_last_processed_concurso = int(df_new_draws['concurso'].max())
-    output_data = {"FREQ_PARES": {str(k): v for k, v in freq_counters[2].items()}, "FREQ_TERCIAS": {str(k): v for k, v in freq_counters[3].items()}, "FREQ_CUARTETOS": {str(k): v for k, v in freq_counters[4].items()}}
-    try:
-        with open(freq_file, 'w', encoding='utf-8') as f: json.dump(output_data, f, indent=4)
-        state["last_concurso_for_freqs"] = new_last_processed_concurso
-        state_manager.save_state(state, state_file)
-        return True, f"Frecuencias para '{game_config['display_name']}' actualizadas con {len(df_new_draws)} nuevos sorteos."
-    except Exception as e: return False, f"Error al guardar archivo de frecuencias para '{game_config['display_name']}': {e}"
-
-# --- SECCIÓN DE ENRIQUECIMIENTO PARALELO (CORREGIDA) ---
-
-def _worker_enrich(df_chunk: pd.DataFrame, freqs: Dict, game_config: Dict[str, Any], loaded_thresholds: Dict[str, int]) -> List[Dict]:
-    """Worker para enriquecer un lote del DataFrame histórico."""
-    result_columns = game_config['data_source']['result_columns']
-    resultados_chunk = []
-    
-    for _, row in df_chunk.iterrows():
+    state["last_concurso_for_freqs"] = new_last_processed_concurso
+    state_manager.save_state(state, state_file)
+    pending = df_historico[(df_historico['concurso'] > base_last) & (df_historico['concurso'] <= new_last_processed_concurso)]
+    if len(pending) >= FREQ_LOG_COMPACT_EVERY or not os.path.exists(freq_file):
         try:
-            combination = [int(row[col]) for col in result_columns] # type: ignore
-            eval_result = evaluate_combination(combination, freqs, game_config, loaded_thresholds)
-            
-            if eval_result.get("error"): continue
-
-            resultados_chunk.append({
-                'concurso': row['concurso'],
-                'es_omega': 1 if eval_result["esOmega"] else 0,
-                'omega_score': round(eval_result["omegaScore"], 4),
-                'afinidad_cuartetos': eval_result["afinidadCuartetos"],
-                'afinidad_tercias': eval_result["afinidadTercias"],
-                'afinidad_pares': eval_result["afinidadPares"],
-            })
-        except (ValueError, TypeError):
-            continue
-            
-    return resultados_chunk
+            freqs = _read_frequencies(game_config)
+            if freqs is not None: save_frequency_file(freqs, freq_file, new_last_processed_concurso)
+        except OSError as e:
+            # La bitácora ya tiene los sorteos; la compactación se reintentará en la siguiente actualización.
+            logger.warning(f"No se pudo compactar la instantánea de frecuencias '{freq_file}': {e}")
+    return True, f"Frecuencias para '{game_config['display_name']}' actualizadas con {len(df_new_draws)} nuevos sorteos."
+
+# --- SECCIÓN DE ENRIQUECIMIENTO VECTORIZADO ---
 
 def enrich_historical_data(game_config: Dict[str, Any], set_progress=None) -> Tuple[bool, str]:
     from dash import no_update
     
-    logger.info(f"Iniciando enriquecimiento paralelo para '{game_config['display_name']}'.")
+    logger.info(f"Iniciando enriquecimiento vectorizado para '{game_config['display_name']}'.")
     db_path = game_config['paths']['db']
+    result_columns = game_config['data_source']['result_columns']
     
     df_historico = db.read_historico_from_db(db_path)
     freqs = get_frequencies(game_config)
@@ -143,29 +235,30 @@ def enrich_historical_data(game_config: Dict[str, Any], set_progress=None) -> Tu
     
     if df_historico.empty or freqs is None:
         return False, "No se puede enriquecer. Faltan datos base."
-        
-    n_processes = mp.cpu_count()
     
-    # --- CORRECCIÓN: Dividir los índices del DataFrame en lugar del DataFrame en sí ---
-    indices = np.array_split(df_historico.index, n_processes)
-    df_chunks = [df_historico.loc[idx] for idx in indices if not idx.empty] # type: ignore
-    # --- FIN CORRECCIÓN ---
+    # Las filas con datos inválidos o números repetidos se omiten, igual que en evaluate_combination.
+    df_valid = df_historico[result_columns].apply(pd.to_numeric, errors='coerce').dropna()
+    draws = np.sort(df_valid.to_numpy(dtype=np.int64), axis=1)
+    unique_mask = (np.diff(draws, axis=1) > 0).all(axis=1)
+    draws = draws[unique_mask]
     
-    worker_func = partial(_worker_enrich, freqs=freqs, game_config=game_config, loaded_thresholds=loaded_thresholds)
-    
-    all_results = []
-    processed_count = 0
     total_rows = len(df_historico)
+    if set_progress:
+        set_progress((10, f"Enriqueciendo: 0/{total_rows}", no_update, no_update, no_update, no_update, no_update, no_update))
+    
+    batch = evaluate_batch(draws, freqs, game_config, loaded_thresholds)
     
-    with NoDaemonPool(processes=n_processes) as pool:
-        for i, result_chunk in enumerate(pool.imap_unordered(worker_func, df_chunks)):
-            all_results.extend(result_chunk)
-            processed_count += len(df_chunks[i])
-            if set_progress:
-                progress = int((processed_count / total_rows) * 100)
-                set_progress((progress, f"Enriqueciendo: {processed_count}/{total_rows}", no_update, no_update, no_update, no_update, no_update, no_update))
-
-    df_omega_stats = pd.DataFrame(all_results)
+    if set_progress:
+        set_progress((90, f"Enriqueciendo: {total_rows}/{total_rows}", no_update, no_update, no_update, no_update, no_update, no_update))
+
+    df_omega_stats = pd.DataFrame({
+        'concurso': df_historico.loc[df_valid.index[unique_mask], 'concurso'].to_numpy(),
+        'es_omega': batch['es_omega'].astype(int),
+        'omega_score': np.round(batch['omega_score'], 4),
+        'afinidad_cuartetos': batch['af_cuartetos'],
+        'afinidad_tercias': batch['af_tercias'],
+        'afinidad_pares': batch['af_pares'],
+    })
     
     if 'bolsa' in df_historico.columns and df_historico['bolsa'].max() > 5000000:
         df_sorted = df_historico.sort_values(by='concurso', ascending=True)
@@ -184,69 +277,197 @@ def enrich_historical_data(game_config: Dict[str, Any], set_progress=None) -> Tu
     success, message = db.save_historico_to_db(df_enriquecido, db_path, mode='replace')
     return success, f"Enriquecimiento para '{game_config['display_name']}' completado. {message}"
 
-# --- SECCIÓN DE PRE-GENERACIÓN DE ALTO RENDIMIENTO (CORREGIDA) ---
-
-def _worker_pregenerate(combo_chunk: List[tuple], freqs: Dict, thresholds: Dict[str, int], historical_set: set) -> List[Dict]:
-    pid = os.getpid()
-    logger.info(f"[Worker PID: {pid}] Procesando un lote de {len(combo_chunk)} combinaciones.")
-    omega_list_chunk = []
-    for combo in combo_chunk:
-        af_p = sum(freqs['pares'].get(par, 0) for par in combinations(combo, 2))
-        if af_p < thresholds['pares']: continue
-            
-        # --- CORRECCIÓN: Usar 'terc' en lugar de 'ter' ---
-        af_t = sum(freqs['tercias'].get(terc, 0) for terc in combinations(combo, 3))
-        if af_t < thresholds['tercias']: continue
-
-        af_q = sum(freqs['cuartetos'].get(cuart, 0) for cuart in combinations(combo, 4))
-        if af_q < thresholds['cuartetos']: continue
-            
-        data = {f'c{j+1}': num for j, num in enumerate(combo)}
-        data.update({'ha_salido': 1 if combo in historical_set else 0, 'afinidad_pares': af_p, 'afinidad_tercias': af_t, 'afinidad_cuartetos': af_q})
-        omega_list_chunk.append(data)
-    return omega_list_chunk
-
-# ... (El resto del archivo, pregenerate_omega_class y deconstruct_affinity, se mantiene sin cambios)
-def pregenerate_omega_class(game_config: Dict[str, Any], set_progress=None) -> Tuple[bool, str]:
+# --- SECCIÓN DE PRE-GENERACIÓN DE ALTO RENDIMIENTO (VECTORIZADA POR BLOQUES) ---
+
+# Tamaño máximo (en combinaciones del universo) de cada tarea por bloques y filas por lote de escritura.
+PREGENERATION_TASK_SIZE = 250_000
+OMEGA_WRITE_BATCH_SIZE = 50_000
+# Con más sorteos nuevos la unión de sus vecindades se acerca al universo y conviene regenerar.
+OMEGA_DELTA_MAX_DRAWS = 10
+
+def score_omega_block(block: np.ndarray, freqs: FrequencyTable, thresholds: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Filtra un bloque (m, n) de combinaciones por los tres umbrales, calculando cada nivel
+    solo sobre las que superaron el anterior. Devuelve (combinaciones, af_p, af_t, af_q).
+    """
+    af_p = freqs.affinities(block, 2)
+    mask = af_p >= thresholds['pares']
+    block, af_p = block[mask], af_p[mask]
+
+    af_t = freqs.affinities(block, 3)
+    mask = af_t >= thresholds['tercias']
+    block, af_p, af_t = block[mask], af_p[mask], af_t[mask]
+
+    af_q = freqs.affinities(block, 4)
+    mask = af_q >= thresholds['cuartetos']
+    return block[mask], af_p[mask], af_t[mask], af_q[mask]
+
+def _shared_pregeneration_arrays(freqs: FrequencyTable, historical_set: frozenset, n: int, k: int) -> Dict[str, np.ndarray]:
+    """Arreglos que los workers de pre-generación leen de memoria compartida."""
+    arrays = {f'freq_{level}': freqs[level] for level in freqs.levels}
+    arrays['historical_ranks'] = _historical_ranks(historical_set, n, k)
+    return arrays
+
+def _historical_ranks(historical_set: frozenset, n: int, k: int) -> np.ndarray:
+    """Índices lexicográficos ordenados de los sorteos históricos válidos."""
+    rows = [row for row in historical_set if len(row) == n]
+    if not rows: return np.zeros(0, dtype=np.int64)
+    draws = np.array(rows, dtype=np.float64)
+    valid = np.isfinite(draws).all(axis=1) & (draws == np.round(draws)).all(axis=1) & (draws >= 1).all(axis=1) & (draws <= k).all(axis=1) & (np.diff(draws, axis=1) > 0).all(axis=1)
+    return np.unique(rank_combinations(draws[valid].astype(np.int64), k))
+
+def _shared_frequencies(k: int, levels: Tuple[int, ...]) -> FrequencyTable:
+    """Reconstruye, dentro de un worker, la tabla de frecuencias sobre la memoria compartida (sin copiarla)."""
+    return FrequencyTable(k, {level: get_shared_array(f'freq_{level}') for level in levels})
+
+def _worker_pregenerate(rank_range: Tuple[int, int], levels: Tuple[int, ...], thresholds: Dict[str, int], n: int, k: int) -> Tuple[int, np.ndarray]:
+    """Evalúa el rango [start, stop) del universo; solo recibe los límites, no las combinaciones."""
+    start, stop = rank_range
+    logger.info(f"[Worker PID: {os.getpid()}] Procesando el rango [{start:,}, {stop:,}) del universo.")
+    freqs = _shared_frequencies(k, levels)
+    historical_ranks = get_shared_array('historical_ranks')
+    chunks = [_omega_rows(*score_omega_block(block, freqs, thresholds), k, historical_ranks) for _, block in iter_combination_blocks(n, k, start, stop)]
+    return stop - start, np.concatenate(chunks) if chunks else np.zeros((0, n + 4), dtype=np.int64)
+
+def _worker_pregenerate_bnb(first_numbers: Tuple[int, ...], levels: Tuple[int, ...], thresholds: Dict[str, int], n: int, k: int) -> Tuple[int, int, np.ndarray]:
+    """Recorre con poda los subárboles de los primeros números indicados. Devuelve (combinaciones cubiertas, nodos visitados, filas)."""
+    logger.info(f"[Worker PID: {os.getpid()}] Búsqueda con poda para los primeros números {list(first_numbers)}.")
+    freqs = _shared_frequencies(k, levels)
+    stats = {}
+    historical_ranks = get_shared_array('historical_ranks')
+    chunks = [_omega_rows(combos, af_p, af_t, af_q, k, historical_ranks) for combos, af_p, af_t, af_q in iter_omega_branch_and_bound(freqs, thresholds, n, k, first_numbers, stats)]
+    covered = sum(comb(k - v, n - 1) for v in first_numbers)
+    return covered, stats.get('visitados', 0), np.concatenate(chunks) if chunks else np.zeros((0, n + 4), dtype=np.int64)
+
+def _omega_rows(combos: np.ndarray, af_p: np.ndarray, af_t: np.ndarray, af_q: np.ndarray, k: int, historical_ranks: np.ndarray) -> np.ndarray:
+    """Matriz (m, n + 4) con las columnas c1..cn, ha_salido y las tres afinidades de la tabla omega_class."""
+    ha_salido = np.isin(rank_combinations(combos, k), historical_ranks) if len(combos) else np.zeros(0, dtype=bool)
+    return np.column_stack([combos.astype(np.int64), ha_salido.astype(np.int64), af_p, af_t, af_q])
+
+def _omega_delta_draws(game_config: Dict[str, Any], state: Dict[str, Any], thresholds: Dict[str, int]) -> Tuple[Optional[np.ndarray], str]:
+    """
+    Sorteos incorporados a las frecuencias desde la última pre-generación, si la Clase Omega
+    guardada admite una actualización incremental. Si no, devuelve None y el motivo.
+    """
+    db_path = game_config['paths']['db']
+    last_omega = state.get("last_concurso_for_omega_class", 0)
+    previous_thresholds = state.get("omega_class_thresholds")
+    if last_omega <= 0 or not previous_thresholds: return None, "no hay una pre-generación previa registrada"
+    # Con umbrales más altos basta volver a filtrar las filas existentes; si alguno baja, pueden
+    # entrar combinaciones de cualquier parte del universo.
+    if any(thresholds.get(name, 0) < previous_thresholds.get(name, 0) for name in LEVEL_NAMES.values()): return None, "algún umbral bajó respecto a la pre-generación anterior"
+    if db.count_omega_class(db_path) == 0: return None, "la tabla omega_class está vacía"
+    df_historico = db.read_historico_from_db(db_path)
+    if df_historico.empty: return None, "no hay histórico"
+    last_freqs = state.get("last_concurso_for_freqs", 0)
+    df_new = df_historico[(df_historico['concurso'] > last_omega) & (df_historico['concurso'] <= last_freqs)]
+    new_draws = get_draws_matrix(df_new, game_config['data_source']['result_columns'])
+    if len(new_draws) > OMEGA_DELTA_MAX_DRAWS: return None, f"hay {len(new_draws)} sorteos nuevos (máximo {OMEGA_DELTA_MAX_DRAWS} para el modo incremental)"
+    return new_draws, ""
+
+def _update_omega_class_incremental(game_config: Dict[str, Any], freqs: FrequencyTable, thresholds: Dict[str, int], historical_set: frozenset, new_draws: np.ndarray) -> Tuple[bool, str]:
+    """
+    Un sorteo nuevo solo cambia las frecuencias de sus propias subsecuencias, así que solo las
+    combinaciones que comparten al menos dos números con él pueden cambiar de afinidad. Se recalcula
+    esa vecindad y se aplican las altas, bajas y actualizaciones sobre la tabla existente.
+    """
+    db_path = game_config['paths']['db']
+    n, k = game_config['n'], game_config['k']
+    neighbourhood = neighbourhood_ranks(new_draws, n, k)
+    historical_ranks = _historical_ranks(historical_set, n, k)
+    chunks = [np.zeros((0, n + 4), dtype=np.int64)]
+    for start in range(0, len(neighbourhood), PREGENERATION_TASK_SIZE):
+        block = unrank_combinations(neighbourhood[start:start + PREGENERATION_TASK_SIZE], n, k)
+        chunks.append(_omega_rows(*score_omega_block(block, freqs, thresholds), k, historical_ranks))
+    members = np.concatenate(chunks)
+    member_ranks = rank_combinations(members[:, :n], k)
+
+    combo_cols = [f'c{i}' for i in range(1, n + 1)]
+    df_omega_class = db.read_full_omega_class(db_path)
+    current = df_omega_class[combo_cols + ['afinidad_pares', 'afinidad_tercias', 'afinidad_cuartetos']].to_numpy(dtype=np.int64)
+    current_ranks = rank_combinations(current[:, :n], k)
+    # Fuera de la vecindad las afinidades guardadas siguen vigentes: solo se comprueban los umbrales.
+    passes = (current[:, n] >= thresholds['pares']) & (current[:, n + 1] >= thresholds['tercias']) & (current[:, n + 2] >= thresholds['cuartetos'])
+    leaves = np.where(np.isin(current_ranks, neighbourhood), ~np.isin(current_ranks, member_ranks), ~passes)
+    already_member = np.isin(member_ranks, current_ranks)
+
+    deleted = current[leaves, :n].tolist()
+    updated = members[already_member][:, [n, n + 1, n + 2, n + 3] + list(range(n))].tolist()
+    inserted = members[~already_member].tolist()
+    logger.info(f"Actualización incremental con {len(new_draws)} sorteos nuevos: vecindad de {len(neighbourhood):,} combinaciones.")
+    return db.apply_omega_class_delta(db_path, n, deleted, updated, inserted)
+
+def pregenerate_omega_class(game_config: Dict[str, Any], set_progress=None, method: Optional[str] = None, incremental: Optional[bool] = None) -> Tuple[bool, str]:
+    """
+    Pre-calcula la Clase Omega completa. 'method' (o 'pregeneration_method' en omega_config) elige
+    entre recorrer todo el universo por bloques ('blocks') o la búsqueda con poda ('branch_and_bound').
+    Con 'incremental' (por defecto 'incremental_pregeneration' en omega_config) solo se recalcula la
+    vecindad de los sorteos nuevos desde 'last_concurso_for_omega_class', cuando es posible.
+    """
     from dash import no_update
     logger.info(f"Verificando pre-generación para '{game_config['display_name']}'.")
     state = state_manager.get_state(game_config['paths']['state'])
     last_opt, last_omega = state.get("last_concurso_for_optimization", 0), state.get("last_concurso_for_omega_class", -1)
-    if last_opt > 0 and last_opt == last_omega: return True, "Pre-generación ya está actualizada."
+    thresholds = get_loaded_thresholds(game_config)
+    # Los umbrales pueden cambiar sin reoptimizar (p. ej. al aplicar un escenario guardado).
+    same_thresholds = state.get("omega_class_thresholds") == {name: int(thresholds.get(name, 0)) for name in LEVEL_NAMES.values()}
+    if last_opt > 0 and last_opt == last_omega and same_thresholds: return True, "Pre-generación ya está actualizada."
     freqs = get_frequencies(game_config)
     if freqs is None: return False, "Faltan frecuencias para pre-generar."
-    thresholds = get_loaded_thresholds(game_config)
     historical_draws_set = get_historical_draws_set(game_config)
     n, k = game_config['n'], game_config['k']
-    total_combinations = factorial(k) // (factorial(n) * factorial(k - n))
+    total_combinations = comb(k, n)
+    method = method or game_config['omega_config'].get('pregeneration_method', 'blocks')
+    if method not in ('blocks', 'branch_and_bound'): return False, f"Método de pre-generación desconocido: '{method}'."
+    incremental = game_config['omega_config'].get('incremental_pregeneration', False) if incremental is None else incremental
+    if incremental:
+        new_draws, reason = _omega_delta_draws(game_config, state, thresholds)
+        if new_draws is not None:
+            if set_progress: set_progress((5, f"Actualizando la Clase Omega con {len(new_draws)} sorteos nuevos...", no_update, no_update, no_update, no_update, no_update, no_update))
+            success, message = _update_omega_class_incremental(game_config, freqs, thresholds, historical_draws_set, new_draws)
+            if success: _save_omega_class_state(state, thresholds, game_config)
+            return success, f"Pre-generación para '{game_config['display_name']}' completada. {message}"
+        logger.info(f"Se hará una pre-generación completa: {reason}.")
     if set_progress: set_progress((5, f"Iniciando pre-generación de {total_combinations:,} combinaciones...", no_update, no_update, no_update, no_update, no_update, no_update))
-    all_possible_combinations = combinations(range(1, k + 1), n)
     n_processes = mp.cpu_count()
-    chunk_size = (total_combinations + n_processes - 1) // n_processes
-    worker_func = partial(_worker_pregenerate, freqs=freqs, thresholds=thresholds, historical_set=historical_draws_set)
-    omega_list = []
-    processed_count = 0
-    with NoDaemonPool(processes=n_processes) as pool:
-        def chunk_generator(it, size):
-            iterator = iter(it)
-            while True:
-                chunk = list(islice(iterator, size))
-                if not chunk: break
-                yield chunk
-        for i, result_chunk in enumerate(pool.imap_unordered(worker_func, chunk_generator(all_possible_combinations, chunk_size))):
-            omega_list.extend(result_chunk)
-            processed_count += chunk_size
-            if set_progress:
-                progress = 5 + int((min(processed_count, total_combinations) / total_combinations) * 90)
-                set_progress((progress, f"Pre-generando: {min(processed_count, total_combinations):,}/{total_combinations:,}", no_update, no_update, no_update, no_update, no_update, no_update))
-    if set_progress: set_progress((95, "Guardando resultados...", no_update, no_update, no_update, no_update, no_update, no_update))
-    omega_df = pd.DataFrame(omega_list)
-    success, message = db.save_omega_class(omega_df, game_config['paths']['db'])
-    if success:
-        state["last_concurso_for_omega_class"] = state.get("last_concurso_for_optimization", 0)
-        state_manager.save_state(state, game_config['paths']['state'])
+    counters = {'processed': 0, 'visited': 0, 'omega': 0}
+    shared_arrays = _shared_pregeneration_arrays(freqs, historical_draws_set, n, k)
+    with SharedArrayPool(shared_arrays, processes=n_processes) as pool:
+        if method == 'branch_and_bound':
+            # Un subárbol por primer número; los números bajos tienen los subárboles más grandes y se reparten primero.
+            tasks = [(v,) for v in range(1, k - n + 2)]
+            worker_func = partial(_worker_pregenerate_bnb, levels=freqs.levels, thresholds=thresholds, n=n, k=k)
+            results = pool.imap_unordered(worker_func, tasks)
+        else:
+            # Rangos de a lo sumo un bloque de enumeración (y varios por proceso) para acotar la memoria
+            # de cada resultado y que el progreso avance de forma regular.
+            tasks = split_rank_ranges(total_combinations, max(n_processes * 4, -(-total_combinations // PREGENERATION_TASK_SIZE)))
+            worker_func = partial(_worker_pregenerate, levels=freqs.levels, thresholds=thresholds, n=n, k=k)
+            results = ((processed, processed, rows) for processed, rows in pool.imap_unordered(worker_func, tasks))
+
+        def omega_batches():
+            # Cada resultado se escribe en cuanto llega; en memoria solo vive el lote actual.
+            for processed, visited, rows in results:
+                counters['processed'] += processed
+                counters['visited'] += visited
+                counters['omega'] += len(rows)
+                if set_progress:
+                    progress = 5 + int((counters['processed'] / total_combinations) * 90)
+                    set_progress((progress, f"Pre-generando: {counters['processed']:,}/{total_combinations:,}", no_update, no_update, no_update, no_update, no_update, no_update))
+                for start in range(0, len(rows), OMEGA_WRITE_BATCH_SIZE):
+                    yield rows[start:start + OMEGA_WRITE_BATCH_SIZE].tolist()
+
+        success, message = db.save_omega_class_batches(omega_batches(), game_config['paths']['db'], n)
+    logger.info(f"Pre-generación '{method}': {counters['visited']:,} nodos evaluados para un universo de {total_combinations:,} combinaciones; {counters['omega']:,} en la Clase Omega.")
+    if success: _save_omega_class_state(state, thresholds, game_config)
     return success, f"Pre-generación para '{game_config['display_name']}' completada. {message}"
 
+def _save_omega_class_state(state: Dict[str, Any], thresholds: Dict[str, int], game_config: Dict[str, Any]):
+    """Registra hasta qué concurso y con qué umbrales está calculada la Clase Omega guardada."""
+    state["last_concurso_for_omega_class"] = state.get("last_concurso_for_optimization", 0)
+    state["omega_class_thresholds"] = {name: int(thresholds.get(name, 0)) for name in LEVEL_NAMES.values()}
+    state_manager.save_state(state, game_config['paths']['state'])
+
 def deconstruct_affinity(combination: List[int], omega_score: float, game_config: Dict[str, Any]) -> Dict[str, Any]:
     freqs = get_frequencies(game_config)
     if not freqs: return {"error": "Frecuencias no disponibles."}
@@ -257,7 +478,6 @@ def deconstruct_affinity(combination: List[int], omega_score: float, game_config
     for level, name in [(2, "pares"), (3, "tercias"), (4, "cuartetos")]:
         if level in game_config['omega_config']['affinity_levels']:
             subs = list(combinations(sorted(combination), level))
-            freq_map = freqs.get(name, {})
-            breakdown_list = [{"subsequence": str(s), "frequency": freq_map.get(s, 0)} for s in subs]
+            breakdown_list = [{"subsequence": str(s), "frequency": freqs.get(s)} for s in subs]
             breakdown[name] = sorted(breakdown_list, key=lambda x: x["frequency"], reverse=True)
     return {"combination": eval_result.get("combinacion"), "omega_score": omega_score, "totals": {"pares": eval_result.get("afinidadPares"), "tercias": eval_result.get("afinidadTercias"), "cuartetos": eval_result.get("afinidadCuartetos")}, "breakdown": breakdown, "error": None}
\ No newline at end of file
@@ -0,0 +1,124 @@
+# omega_search.py
+
+import logging
+from math import comb
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from modules.frequency_table import FrequencyTable, LEVEL_NAMES, binomial_table, subsequence_ranks
+
+logger = logging.getLogger(__name__)
+
+# --- BÚSQUEDA DE LA CLASE OMEGA POR RAMIFICACIÓN Y PODA ---
+# El universo se recorre como un árbol de prefijos en orden lexicográfico. Como las
+# tres afinidades son sumas de frecuencias no negativas, cada prefijo tiene una cota
+# superior de lo que puede alcanzar cualquier combinación que lo complete; si esa
+# cota no llega a un umbral, se descarta el subárbol completo.
+#
+# Para un prefijo P de longitud d (último número L) y r = n - d números por elegir,
+# la afinidad final de nivel l de cualquier completación W se descompone en:
+#   - las subsecuencias dentro de P (suma ya conocida),
+#   - las que tienen exactamente un número w de W: sum_w ganancia_l(P, w), acotada
+#     por la suma de las r mayores ganancias con w > L,
+#   - las que tienen dos o más números de W: son c = sum_{j>=2} C(r, j) C(d, l - j)
+#     subsecuencias distintas con algún número > L, acotadas por la suma de las c
+#     mayores frecuencias de ese conjunto (precalculada por L).
+
+FRONTIER_CHUNK_SIZE = 20_000
+
+def top_suffix_sums(freqs: FrequencyTable, n: int, k: int) -> Dict[int, np.ndarray]:
+    """
+    tops[l][v, c] = suma de las c mayores frecuencias de nivel l entre las subsecuencias
+    con algún número > v. En orden colex son justamente los rangos >= C(v, l).
+    """
+    tops = {}
+    for level in freqs.levels:
+        counts = freqs[level]
+        c_max = comb(n, level)
+        table = np.zeros((k + 1, c_max + 1), dtype=np.int64)
+        for v in range(k + 1):
+            tail = counts[comb(v, level):]
+            c = min(c_max, tail.size)
+            if c == 0: continue
+            largest = np.sort(np.partition(tail, tail.size - c)[tail.size - c:])[::-1]
+            table[v, 1:c + 1] = np.cumsum(largest)
+            table[v, c + 1:] = table[v, c]
+        tops[level] = table
+    return tops
+
+def _affinity_gains(prefix: np.ndarray, future: np.ndarray, freqs: FrequencyTable, k: int) -> Dict[int, np.ndarray]:
+    """
+    gains[l][i, w] = suma de frecuencias de las subsecuencias de nivel l formadas por w y
+    l - 1 números del prefijo i. Solo se calcula donde future[i, w] (w mayor que todo el prefijo);
+    con w como máximo, el rango colex es rango(Q) + C(w - 1, l).
+    """
+    gains = {}
+    binom = binomial_table(k, 4)
+    rows, values = np.nonzero(future)
+    for level in freqs.levels:
+        matrix = np.zeros(future.shape, dtype=np.int64)
+        if prefix.shape[1] >= level - 1:
+            sub_ranks = subsequence_ranks(prefix, level - 1, k).astype(np.int64)
+            matrix[rows, values] = freqs[level][sub_ranks[rows] + binom[values - 1, level][:, None]].sum(axis=1)
+        gains[level] = matrix
+    return gains
+
+def iter_omega_branch_and_bound(freqs: FrequencyTable, thresholds: Dict[str, int], n: int, k: int, first_numbers: Tuple[int, ...], stats: Dict[str, int], tops: Optional[Dict[int, np.ndarray]] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Genera bloques (combinaciones, af_p, af_t, af_q) de la Clase Omega cuyos primeros números
+    están en 'first_numbers', en orden lexicográfico. 'stats' acumula los prefijos visitados y podados.
+    'tops' (de top_suffix_sums) no depende de los umbrales y puede reutilizarse entre llamadas.
+    """
+    levels = [level for level in (2, 3, 4) if level in freqs]
+    limits = {level: thresholds.get(LEVEL_NAMES[level], 0) for level in levels}
+    tops = top_suffix_sums(freqs, n, k) if tops is None else tops
+    columns = np.arange(k + 1)
+
+    def expand(prefix: np.ndarray, sums: Dict[int, np.ndarray]):
+        d = prefix.shape[1]
+        r = n - d
+        stats['visitados'] = stats.get('visitados', 0) + len(prefix)
+        last = prefix[:, -1].astype(np.int64)
+        future = columns[None, :] > last[:, None]
+        gains = _affinity_gains(prefix, future, freqs, k)
+
+        keep = np.ones(len(prefix), dtype=bool)
+        for level in levels:
+            best_single = np.partition(gains[level], k + 1 - r, axis=1)[:, k + 1 - r:].sum(axis=1)
+            c = sum(comb(r, j) * comb(d, level - j) for j in range(2, min(r, level) + 1))
+            bound = sums[level] + best_single + tops[level][last, c]
+            keep &= bound >= limits[level]
+        stats['podados'] = stats.get('podados', 0) + int(np.count_nonzero(~keep))
+        if not keep.any(): return
+
+        prefix, last, future = prefix[keep], last[keep], future[keep]
+        sums = {level: sums[level][keep] for level in levels}
+        gains = {level: gains[level][keep] for level in levels}
+
+        # Hijos (P, v) con espacio para los r - 1 números restantes, en orden lexicográfico.
+        rows, values = np.nonzero(future & (columns[None, :] <= k - r + 1))
+        child_prefix = np.concatenate([prefix[rows], values[:, None].astype(prefix.dtype)], axis=1)
+        child_sums = {level: sums[level][rows] + gains[level][rows, values] for level in levels}
+
+        if r == 1:
+            stats['visitados'] = stats.get('visitados', 0) + len(child_prefix)
+            mask = np.ones(len(child_prefix), dtype=bool)
+            for level in levels: mask &= child_sums[level] >= limits[level]
+            if mask.any():
+                zeros = np.zeros(int(np.count_nonzero(mask)), dtype=np.int64)
+                yield (child_prefix[mask],) + tuple(child_sums[level][mask] if level in child_sums else zeros for level in (2, 3, 4))
+            return
+
+        for start in range(0, len(child_prefix), FRONTIER_CHUNK_SIZE):
+            chunk = slice(start, start + FRONTIER_CHUNK_SIZE)
+            yield from expand(child_prefix[chunk], {level: child_sums[level][chunk] for level in levels})
+
+    roots = np.array([v for v in first_numbers if v <= k - n + 1], dtype=np.uint8).reshape(-1, 1)
+    if len(roots) == 0: return
+    if n == 1:
+        stats['visitados'] = stats.get('visitados', 0) + len(roots)
+        zeros = np.zeros(len(roots), dtype=np.int64)
+        if all(limits[level] <= 0 for level in levels): yield roots, zeros, zeros, zeros
+        return
+    yield from expand(roots, {level: np.zeros(len(roots), dtype=np.int64) for level in levels})
@@ -0,0 +1,101 @@
+# order_statistics.py
+
+from typing import Optional, Union
+
+import numpy as np
+
+# --- ESTADÍSTICOS DE ORDEN INCREMENTALES ---
+# Multiconjunto de enteros no negativos (p. ej. afinidades) con percentiles
+# exactos. Las frecuencias por valor viven en un árbol de Fenwick: insertar o
+# retirar un valor y pedir el k-ésimo menor cuestan O(log D), con D el mayor
+# valor visto. Las actualizaciones masivas se vuelcan al histograma y el árbol
+# se reconstruye de forma vectorizada en O(D) antes de la siguiente consulta.
+
+# A partir de este número de valores por llamada conviene reconstruir el árbol en lugar de actualizarlo uno a uno.
+BULK_UPDATE_SIZE = 64
+
+
+class OrderStatistics:
+    """Multiconjunto de enteros no negativos con k-ésimo menor y percentil 'linear' idéntico a np.percentile."""
+
+    def __init__(self, values: Optional[np.ndarray] = None, size: int = 1024):
+        self.counts = np.zeros(max(1, size), dtype=np.int64)
+        self.tree = np.zeros(len(self.counts) + 1, dtype=np.int64)
+        self.total = 0
+        self.dirty = False
+        if values is not None: self.add(values)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def copy(self) -> "OrderStatistics":
+        other = OrderStatistics(size=len(self.counts))
+        other.counts = self.counts.copy()
+        other.tree = self.tree.copy()
+        other.total, other.dirty = self.total, self.dirty
+        return other
+
+    def _grow(self, max_value: int) -> None:
+        size = len(self.counts)
+        while size <= max_value: size *= 2
+        counts = np.zeros(size, dtype=np.int64)
+        counts[:len(self.counts)] = self.counts
+        self.counts = counts
+        self.dirty = True
+
+    def _rebuild(self) -> None:
+        # tree[i] = suma de counts en (i - lowbit(i), i], a partir de la suma acumulada.
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        index = np.arange(1, len(self.counts) + 1)
+        self.tree = np.concatenate([[0], cumulative[index] - cumulative[index - (index & -index)]])
+        self.dirty = False
+
+    def add(self, values: Union[int, np.ndarray], delta: int = 1) -> None:
+        """Inserta (delta > 0) o retira (delta < 0) cada valor de 'values'."""
+        values = np.asarray(values, dtype=np.int64).ravel()
+        if values.size == 0: return
+        if values.min() < 0: raise ValueError("OrderStatistics solo admite enteros no negativos.")
+        if values.max() >= len(self.counts): self._grow(int(values.max()))
+        np.add.at(self.counts, values, delta)
+        self.total += delta * int(values.size)
+        if self.dirty or values.size >= BULK_UPDATE_SIZE:
+            self.dirty = True
+            return
+        size = len(self.counts)
+        for value in values.tolist():
+            i = value + 1
+            while i <= size:
+                self.tree[i] += delta
+                i += i & -i
+
+    def remove(self, values: Union[int, np.ndarray]) -> None:
+        self.add(values, -1)
+
+    def kth(self, k: int) -> int:
+        """k-ésimo menor valor (base 0) por descenso binario sobre el árbol."""
+        if not 0 <= k < self.total: raise IndexError(f"k={k} fuera de rango para {self.total} valores.")
+        if self.dirty: self._rebuild()
+        size = len(self.counts)
+        position, remaining = 0, k + 1
+        step = 1 << (size.bit_length() - 1)
+        while step:
+            following = position + step
+            if following <= size and self.tree[following] < remaining:
+                position = following
+                remaining -= int(self.tree[following])
+            step >>= 1
+        return position
+
+    def percentile(self, q: float) -> float:
+        """
+        Percentil con interpolación lineal, replicando paso a paso np.percentile(method='linear')
+        para que el resultado coincida bit a bit con el del arreglo completo.
+        """
+        if self.total == 0: raise ValueError("No hay valores para calcular el percentil.")
+        virtual = (self.total - 1) * (q / 100)
+        if virtual >= self.total - 1: return float(self.kth(self.total - 1))
+        previous = int(np.floor(virtual))
+        gamma = virtual - previous
+        low, high = self.kth(previous), self.kth(previous + 1)
+        diff = high - low
+        return float(high - diff * (1 - gamma)) if gamma >= 0.5 else float(low + diff * gamma)
@@ -126,7 +126,25 @@ def create_configuracion_view():
         html.Div([
             html.P("Procesando, por favor espere...", id="progress-text", className="mt-4 mb-2 text-muted"),
             dbc.Progress(id="progress-bar", value=0, striped=True, animated=True, style={"height": "20px"}),
-        ], id="progress-container", style={'display': 'none'})
+            dbc.Button("Cancelar optimización", id="btn-cancel-optimize", color="secondary", size="sm", className="mt-2", style={'display': 'none'}),
+        ], id="progress-container", style={'display': 'none'}),
+        html.Hr(className="my-4"),
+        html.H5("Frente de Pareto de Umbrales", className="text-center text-dark mb-2"),
+        html.P(id="pareto-info", className="text-center text-muted small mb-3"),
+        dbc.Row([
+            dbc.Col(dbc.Button("Cargar escenarios", id="btn-load-pareto", color="primary", outline=True), width="auto"),
+            dbc.Col(dbc.Button("Aplicar escenario seleccionado", id="btn-apply-scenario", color="primary"), width="auto"),
+        ], justify="center", className="g-3 mb-3"),
+        dash_table.DataTable(
+            id='table-pareto', data=[], row_selectable='single', selected_rows=[], page_size=15, sort_action='native',
+            columns=[
+                {'name': 'Pares', 'id': 'pares'}, {'name': 'Tercias', 'id': 'tercias'}, {'name': 'Cuartetos', 'id': 'cuartetos'},
+                {'name': 'Cobertura Histórica', 'id': 'cobertura_historica', 'type': 'numeric', 'format': {'specifier': '.2%'}},
+                {'name': 'Cobertura Universal', 'id': 'cobertura_universal', 'type': 'numeric', 'format': {'specifier': '.4%'}},
+                {'name': 'Tamaño Clase Omega', 'id': 'omega_size', 'type': 'numeric', 'format': {'specifier': ','}},
+            ],
+            style_cell={'textAlign': 'center'}, style_header={'fontWeight': 'bold', 'backgroundColor': 'rgb(230, 230, 230)'}, style_table={'overflowX': 'auto'}
+        )
     ])
 
 def create_registros_view():
@@ -0,0 +1,265 @@
+# time_travel.py
+
+import logging
+from math import comb
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from modules.frequency_table import FrequencyTable, LEVEL_NAMES, NAME_LEVELS, subsequence_ranks
+from modules.omega_logic import get_draws_matrix
+from modules.order_statistics import OrderStatistics
+
+logger = logging.getLogger(__name__)
+
+# --- MOTOR DE VIAJE EN EL TIEMPO ---
+# Recorre el histórico una sola vez y en cada posición expone el estado "como
+# estaba antes del sorteo": frecuencias, índices que cambió el último sorteo y
+# umbrales de afinidad de pares. Los scripts de trayectoria consumen el mismo
+# recorrido en lugar de reconstruir cada uno sus frecuencias.
+
+PERCENTIL_UMBRAL_PARES = 20
+
+
+class AffinityTracker:
+    """
+    Afinidad de cada sorteo pasado por nivel, mantenida al añadir sorteos sin recontar el histórico.
+    Un sorteo nuevo que comparte s números con uno pasado le suma C(s, nivel); la suya es la suma de esos C(s, nivel) más C(n, nivel).
+    Las afinidades de pares 'ancladas' se miden en el sorteo ancla y, desde ahí, cada sorteo conserva la que tuvo al ingresar.
+    Cada conjunto se refleja en una estructura de orden para consultar sus percentiles sin reordenar.
+    """
+    def __init__(self, draws: np.ndarray, k: int, anchor: Optional[int] = None, levels: Iterable[int] = (2,)):
+        n = draws.shape[1]
+        self.draws = draws
+        self.anchor = anchor
+        self.levels = tuple(sorted(set(levels) | {2}))
+        # gains[level][s]: afinidad que gana un sorteo pasado cuando uno nuevo comparte s números con él.
+        self.gains = {level: np.array([comb(s, level) for s in range(n + 1)], dtype=np.int64) for level in self.levels}
+        self.own = {level: comb(n, level) for level in self.levels}
+        self.afinidades = {level: np.zeros(len(draws), dtype=np.int64) for level in self.levels}
+        self.sums = {level: 0 for level in self.levels}
+        self.current_stats = {level: OrderStatistics() for level in self.levels}
+        self.ancladas = np.zeros(len(draws), dtype=np.int64)
+        self.anchored_stats: Optional[OrderStatistics] = None
+        self.membership = np.zeros((len(draws), k + 1), dtype=bool)
+        self.membership[np.arange(len(draws))[:, None], draws] = True
+        self.count = 0
+
+    @property
+    def actuales(self) -> np.ndarray:
+        return self.afinidades[2]
+
+    def advance(self, count: int) -> None:
+        """Incorpora los sorteos hasta tener los primeros 'count' de la matriz."""
+        for j in range(self.count, count):
+            if j == self.anchor:
+                self.ancladas[:j] = self.actuales[:j]
+                self.anchored_stats = self.current_stats[2].copy()
+            shared = self.membership[:j, self.draws[j]].sum(axis=1)
+            for level in self.levels:
+                gained = self.gains[level][shared]
+                changed = np.flatnonzero(gained)
+                values, stats = self.afinidades[level], self.current_stats[level]
+                stats.remove(values[changed])
+                values[changed] += gained[changed]
+                stats.add(values[changed])
+                gained_total = int(gained.sum())
+                values[j] = gained_total + self.own[level]
+                stats.add(values[j])
+                self.sums[level] += gained_total + int(values[j])
+            self.ancladas[j] = self.actuales[j]
+            if self.anchored_stats is not None: self.anchored_stats.add(self.ancladas[j])
+        self.count = max(self.count, count)
+
+    def current(self, level: int = 2) -> np.ndarray:
+        return self.afinidades[level][:self.count]
+
+    def anchored(self) -> np.ndarray:
+        if self.anchored_stats is None: return self.current()
+        return self.ancladas[:self.count]
+
+    def percentile(self, q: float, anchored: bool = False, level: int = 2) -> float:
+        """Percentil exacto (igual a np.percentile) de las afinidades actuales o ancladas; 0.0 si no hay sorteos."""
+        stats = self.anchored_stats if anchored and self.anchored_stats is not None else self.current_stats[level]
+        return stats.percentile(q) if len(stats) else 0.0
+
+    def summary(self, level: int) -> Dict[str, Any]:
+        """Media, mediana, mínimo y máximo de las afinidades actuales del nivel, iguales a los de numpy sobre el arreglo."""
+        stats = self.current_stats[level]
+        if not len(stats): return {'media': 0.0, 'mediana': 0.0, 'min': 0, 'max': 0}
+        return {'media': self.sums[level] / len(stats), 'mediana': stats.percentile(50),
+                'min': stats.kth(0), 'max': stats.kth(len(stats) - 1)}
+
+
+class Snapshot:
+    """
+    Estado del histórico justo antes de la fila 'index' (las 'index' filas anteriores ya contadas).
+    Es una vista viva del motor: solo es válida durante su paso del recorrido; copie lo que deba conservar.
+    """
+    def __init__(self, engine: "TimeTravel", index: int):
+        self.engine = engine
+        self.index = index
+        self._cache: Dict[str, Any] = {}
+
+    @property
+    def row(self) -> Optional[Any]:
+        """Fila del sorteo que aún no se cuenta (namedtuple), o None al final del histórico."""
+        return self.engine.rows[self.index] if self.index < len(self.engine) else None
+
+    @property
+    def concurso(self) -> Optional[int]:
+        return int(self.row.concurso) if self.row is not None else None
+
+    @property
+    def ultimo_concurso(self) -> Optional[int]:
+        return int(self.engine.rows[self.index - 1].concurso) if self.index > 0 else None
+
+    @property
+    def freqs(self) -> FrequencyTable:
+        return self.engine.freqs
+
+    @property
+    def draws(self) -> np.ndarray:
+        """Sorteos válidos ya contados, en orden de concurso."""
+        return self.engine.draws[:self.engine.valid_before[self.index]]
+
+    @property
+    def history(self) -> pd.DataFrame:
+        return self.engine.df.head(self.index)
+
+    @property
+    def delta(self) -> Dict[str, np.ndarray]:
+        """Índices (rangos colex) de cada nivel que incrementó la fila anterior; vacíos si era inválida."""
+        if 'delta' not in self._cache:
+            last = self.engine.draws[self.engine.valid_before[self.index - 1]:self.engine.valid_before[self.index]] if self.index > 0 else self.engine.draws[:0]
+            self._cache['delta'] = {LEVEL_NAMES[level]: subsequence_ranks(last, level, self.engine.k).ravel() for level in self.freqs.levels}
+        return self._cache['delta']
+
+    @property
+    def afinidades_pasadas(self) -> np.ndarray:
+        """Afinidad de pares de cada sorteo pasado medida con las frecuencias actuales."""
+        self.engine.tracker.advance(int(self.engine.valid_before[self.index]))
+        return self.engine.tracker.current()
+
+    def afinidades(self, level: Union[int, str]) -> np.ndarray:
+        """Afinidad de cada sorteo pasado en el nivel dado (tamaño o nombre), con las frecuencias actuales."""
+        self.engine.tracker.advance(int(self.engine.valid_before[self.index]))
+        return self.engine.tracker.current(NAME_LEVELS[level] if isinstance(level, str) else level)
+
+    def affinity_summary(self, level: Union[int, str]) -> Dict[str, Any]:
+        """Media, mediana, mínimo y máximo de las afinidades pasadas del nivel, sin recorrer el arreglo."""
+        self.engine.tracker.advance(int(self.engine.valid_before[self.index]))
+        return self.engine.tracker.summary(NAME_LEVELS[level] if isinstance(level, str) else level)
+
+    @property
+    def afinidades_ancladas(self) -> np.ndarray:
+        """Afinidades de pares congeladas desde el sorteo ancla del motor (ver AffinityTracker)."""
+        self.engine.tracker.advance(int(self.engine.valid_before[self.index]))
+        return self.engine.tracker.anchored()
+
+    @property
+    def umbral_pares(self) -> float:
+        """Percentil de las afinidades pasadas; 0.0 si aún no hay sorteos."""
+        if 'umbral_pares' not in self._cache:
+            self.engine.tracker.advance(int(self.engine.valid_before[self.index]))
+            self._cache['umbral_pares'] = self.engine.tracker.percentile(self.engine.percentile)
+        return self._cache['umbral_pares']
+
+    @property
+    def umbral_pares_anclado(self) -> float:
+        """Percentil de las afinidades ancladas; 0.0 si aún no hay sorteos."""
+        if 'umbral_pares_anclado' not in self._cache:
+            self.engine.tracker.advance(int(self.engine.valid_before[self.index]))
+            self._cache['umbral_pares_anclado'] = self.engine.tracker.percentile(self.engine.percentile, anchored=True)
+        return self._cache['umbral_pares_anclado']
+
+
+class TimeTravel:
+    """
+    Recorrido único del histórico ordenado por concurso. Las frecuencias avanzan con el recorrido,
+    por lo que cada motor se itera una sola vez.
+    'anchor_concurso' fija el sorteo desde el que se congelan las afinidades ancladas (Fénix y Línea Dorada).
+    """
+    def __init__(self, df_historico: pd.DataFrame, game_config: Dict[str, Any], levels: Iterable[int] = (2, 3, 4),
+                 anchor_concurso: Optional[int] = None, percentile: float = PERCENTIL_UMBRAL_PARES):
+        result_columns = game_config['data_source']['result_columns']
+        self.k = game_config['k']
+        self.percentile = percentile
+        self.df = df_historico.sort_values(by='concurso').reset_index(drop=True)
+        self.rows = list(self.df.itertuples(index=False))
+        self.draws = get_draws_matrix(self.df, result_columns)
+        valid_rows = self.df[result_columns].apply(pd.to_numeric, errors='coerce').notna().all(axis=1).to_numpy() if len(self.df) else np.zeros(0, dtype=bool)
+        # valid_before[i]: sorteos válidos entre las primeras i filas.
+        self.valid_before = np.concatenate([[0], np.cumsum(valid_rows)]).astype(np.int64)
+        anchor = int(self.valid_before[self.index_of(anchor_concurso)]) if anchor_concurso is not None else None
+        self.freqs = FrequencyTable(self.k, levels=levels)
+        self.tracker = AffinityTracker(self.draws, self.k, anchor, levels=self.freqs.levels)
+        self.counted = 0
+        self.position = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def index_of(self, concurso: int) -> int:
+        """Primera fila cuyo concurso es mayor o igual a 'concurso'."""
+        return int(np.searchsorted(self.df['concurso'].to_numpy(), concurso, side='left'))
+
+    def snapshots(self, start: int = 0) -> Iterator[Snapshot]:
+        """Instantáneas de las posiciones start..len(self), inclusive (la última ya incluye todo el histórico)."""
+        if start < self.position:
+            raise ValueError(f"El motor ya avanzó hasta la fila {self.position}; no puede volver a la {start}.")
+        for index in range(start, len(self) + 1):
+            target = int(self.valid_before[index])
+            # Antes del primer punto las frecuencias se ponen al día en un solo lote.
+            self.freqs.update(self.draws[self.counted:target])
+            self.counted = target
+            self.position = index
+            yield Snapshot(self, index)
+
+
+def replay(engine: TimeTravel, consumers: List[Any], start: int = 0, log_every: int = 1000) -> None:
+    """
+    Reparte un único recorrido del motor entre varios consumidores.
+    Cada consumidor implementa consume(snapshot) y, opcionalmente, finish() al terminar.
+    """
+    total = len(engine)
+    logger.info(f"Viaje en el tiempo: recorriendo {total - start} sorteos para {len(consumers)} análisis...")
+    for snapshot in engine.snapshots(start):
+        for consumer in consumers:
+            consumer.consume(snapshot)
+        if snapshot.index and (snapshot.index % log_every == 0 or snapshot.index == total):
+            logger.info(f"  -> Viaje en el tiempo: fila {snapshot.index}/{total}...")
+    for consumer in consumers:
+        finish = getattr(consumer, 'finish', None)
+        if finish is not None: finish()
+
+
+class PairTrajectory:
+    """
+    Consumidor que registra, desde 'start_concurso', los conteos de pares y el umbral anclado de cada punto.
+    Es la trayectoria común de la que parten el Score Fénix y la Línea Dorada.
+    """
+    def __init__(self, start_concurso: int = 600):
+        self.start_concurso = start_concurso
+        self._concursos: List[int] = []
+        self._pair_counts: List[np.ndarray] = []
+        self._umbrales: List[float] = []
+        self.concursos = np.zeros(0, dtype=np.int64)
+        self.pair_counts = np.zeros((0, 0), dtype=np.int64)
+        self.umbrales = np.zeros(0, dtype=np.float64)
+
+    def consume(self, snapshot: Snapshot) -> None:
+        if snapshot.row is None or snapshot.concurso < self.start_concurso: return
+        self._concursos.append(snapshot.concurso)
+        self._pair_counts.append(snapshot.freqs['pares'].copy())
+        self._umbrales.append(snapshot.umbral_pares_anclado)
+
+    def finish(self) -> None:
+        self.concursos = np.array(self._concursos, dtype=np.int64)
+        if self._pair_counts: self.pair_counts = np.stack(self._pair_counts)
+        self.umbrales = np.array(self._umbrales, dtype=np.float64)
+        self._pair_counts = []
+
+    def __len__(self) -> int:
+        return len(self.concursos)
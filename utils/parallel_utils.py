@@ -1,7 +1,10 @@
 # utils/parallel_utils.py
 import multiprocessing
 import multiprocessing.pool
-from typing import Any, Callable, Iterable, Optional
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
 
 # --- CORRECCIÓN 1: Solución para "Incompatible Variable Override" ---
 # En lugar de sobrescribir la propiedad 'daemon', que confunde a Pylance,
@@ -49,4 +52,88 @@ class NoDaemonPool(multiprocessing.pool.Pool):
             initargs=initargs, 
             maxtasksperchild=maxtasksperchild, 
             context=custom_context
-        )
\ No newline at end of file
+        )
+
+# --- POOL CON ARREGLOS EN MEMORIA COMPARTIDA ---
+# Los arreglos grandes (frecuencias, trayectorias, combinaciones) se copian una sola vez a
+# segmentos de memoria compartida. Cada worker se conecta a ellos en su inicializador y las
+# tareas solo transportan índices (rangos de rango u offsets de fila), no los datos.
+
+_worker_arrays: Dict[str, np.ndarray] = {}
+_worker_segments: List[shared_memory.SharedMemory] = []
+
+def _attach_shared_arrays(specs: Dict[str, tuple], initializer: Optional[Callable[..., Any]], initargs: tuple):
+    """Inicializador de cada worker: abre los segmentos y expone vistas de solo lectura."""
+    _worker_arrays.clear()
+    for name, (segment_name, shape, dtype) in specs.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        # La referencia al segmento debe vivir tanto como la vista sobre su buffer.
+        _worker_segments.append(segment)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+        array.setflags(write=False)
+        _worker_arrays[name] = array
+    if initializer is not None:
+        initializer(*initargs)
+
+def get_shared_array(name: str) -> np.ndarray:
+    """Devuelve, dentro de un worker de SharedArrayPool, el arreglo compartido con ese nombre."""
+    try:
+        return _worker_arrays[name]
+    except KeyError:
+        raise KeyError(f"El arreglo compartido '{name}' no está disponible en este proceso.") from None
+
+class SharedArrayPool(NoDaemonPool):
+    """
+    Un NoDaemonPool que publica un diccionario de arreglos numpy en memoria compartida.
+    Los workers los leen con get_shared_array(nombre). El proceso principal es el dueño
+    de los segmentos y los libera al terminar el pool (p. ej. al salir del bloque 'with').
+    """
+    def __init__(self,
+                 arrays: Dict[str, np.ndarray],
+                 processes: Optional[int] = None,
+                 initializer: Optional[Callable[..., Any]] = None,
+                 initargs: Iterable[Any] = (),
+                 maxtasksperchild: Optional[int] = None):
+
+        self._segments: List[shared_memory.SharedMemory] = []
+        specs: Dict[str, tuple] = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                # SharedMemory no admite tamaño 0; un arreglo vacío ocupa un byte de relleno.
+                segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._segments.append(segment)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+                specs[name] = (segment.name, array.shape, array.dtype.str)
+            super(SharedArrayPool, self).__init__(
+                processes=processes,
+                initializer=_attach_shared_arrays,
+                initargs=(specs, initializer, tuple(initargs)),
+                maxtasksperchild=maxtasksperchild
+            )
+        except Exception:
+            self._release_segments()
+            raise
+
+    def _release_segments(self):
+        while self._segments:
+            segment = self._segments.pop()
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+    def terminate(self):
+        super(SharedArrayPool, self).terminate()
+        self._release_segments()
+
+    def join(self):
+        super(SharedArrayPool, self).join()
+        self._release_segments()
+
+class TaskCancelled(Exception):
+    """
+    Se lanza en el proceso principal cuando el usuario cancela una tarea paralela. Al propagarse
+    fuera del bloque 'with' del pool, los workers se terminan y se liberan sus segmentos.
+    """
@@ -34,4 +34,23 @@ def save_state(new_state: Dict[str, Any], state_file_path: str):
             json.dump(new_state, f, indent=4)
         logger.info(f"Estado del sistema actualizado en '{os.path.basename(state_file_path)}'.")
     except Exception as e:
-        logger.error(f"Error crítico al guardar el estado del sistema en '{state_file_path}': {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Error crítico al guardar el estado del sistema en '{state_file_path}': {e}", exc_info=True)
+
+# --- MARCAS DE CANCELACIÓN ---
+# Una cancelación es un archivo propio de la tarea, fuera del estado del sistema: crearlo y borrarlo son
+# operaciones atómicas, así que ni la tarea al guardar su estado ni otra escritura pueden pisarla.
+
+def request_cancel(flag_path: str):
+    """Pide cancelar la tarea asociada a 'flag_path'."""
+    with open(flag_path, 'w', encoding='utf-8'):
+        pass
+
+def clear_cancel(flag_path: str):
+    """Retira una cancelación pendiente; se llama al iniciar la tarea."""
+    try:
+        os.remove(flag_path)
+    except FileNotFoundError:
+        pass
+
+def is_cancel_requested(flag_path: str) -> bool:
+    return os.path.exists(flag_path)